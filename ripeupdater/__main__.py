@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+"""
+command line interface of ripe-updater
+"""
+import argparse
+import json
+import signal
+import sys
+
+from .backup_manager import BackupManager
+from .export import EXPORT_WORKERS, FORMATS, NDJSON, export as export_keys, select_keys
+from .job_queue import JobQueue
+from .log_manager import LogManager
+from .mirror import OBJECT_TYPES, RipeMirror
+from .mailer import flush as flush_mails, get_outbox
+from .restore import RestoreJournal, parse_time, run_restore, select_backups
+from .ripe import UNCHANGED
+from .sync import (sync as sync_all, plan as plan_all)
+from .worker import WorkerPool
+from .configuration import *
+
+# Seconds to wait for queued mails and backups on exit
+FLUSH_TIMEOUT = 60
+
+logger = LogManager().logger
+
+
+def worker(args):
+    """
+    drain the job queue until terminated
+    """
+    stop_signals = {signal.SIGINT, signal.SIGTERM}
+    # block signals before starting threads, so only sigwait receives them
+    signal.pthread_sigmask(signal.SIG_BLOCK, stop_signals)
+
+    backup = BackupManager()
+    # resolves hostname and IP address for the mails before the first job
+    get_outbox()
+    pool = WorkerPool(JobQueue(), backup, size=args.workers)
+    pool.start()
+    signal.sigwait(stop_signals)
+    logger.info('stopping queue workers')
+    pool.stop()
+    backup.flush(FLUSH_TIMEOUT)
+    flush_mails(FLUSH_TIMEOUT)
+
+
+def sync(args):
+    """
+    sync all NetBox prefixes to RIPE DB
+    with --dry-run the planned changes are written as one json object per line
+    """
+    if args.dry_run:
+        for plan in plan_all(workers=args.workers):
+            if args.all or plan['action'] != UNCHANGED:
+                sys.stdout.write(json.dumps(plan) + '\n')
+        return
+
+    backup = BackupManager()
+    results = sync_all(backup, workers=args.workers)
+    backup.flush(FLUSH_TIMEOUT)
+    flush_mails(FLUSH_TIMEOUT)
+    for result, count in sorted(results.items()):
+        print(f'{result}: {count}')
+
+
+def export(args):
+    """
+    write all or the matching backups as json lines or tar.gz archive to a file or stdout
+    """
+    backup = BackupManager()
+    keys = select_keys(backup, args.search, args.latest)
+    logger.info(f'exporting {len(keys)} backups')
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_keys(backup, keys, args.format, args.workers):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+def restore(args):
+    """
+    write backups back to RIPE DB, the result of each object is written as json line
+    """
+    backup = BackupManager()
+    journal = RestoreJournal()
+
+    if args.resume is not None:
+        restore_id = args.resume
+        if journal.progress(restore_id) is None:
+            sys.exit(f'restore {restore_id} not found')
+    else:
+        if not (args.prefixes or args.manifest or args.at):
+            sys.exit('select the backups to restore by prefixes, --manifest or --at')
+        manifest = None
+        if args.manifest:
+            with open(args.manifest) as manifest_file:
+                manifest = json.load(manifest_file)
+        selection = select_backups(backup, args.prefixes, manifest, None if args.at is None else parse_time(args.at))
+        if not selection:
+            sys.exit('no backups match')
+        restore_id = journal.create(selection, json.dumps({'prefixes': args.prefixes, 'at': args.at,
+                                                           'manifest': args.manifest}))
+
+    sys.stderr.write(f'restore {restore_id}\n')
+    for result in run_restore(backup, journal, restore_id, args.workers):
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
+    backup.flush(FLUSH_TIMEOUT)
+    flush_mails(FLUSH_TIMEOUT)
+    progress = journal.progress(restore_id)
+    sys.stderr.write(json.dumps(progress) + '\n')
+    if progress['failed']:
+        sys.exit(1)
+
+
+def dead_letters(args):
+    """
+    write the dead letters as json lines, with --replay queue them again
+    """
+    queue = JobQueue()
+    if args.replay:
+        job_ids = queue.replay(args.ids or None)
+        print(f'queued {len(job_ids)} jobs')
+        return
+
+    for letter in queue.dead_letters():
+        if not args.ids or letter['id'] in args.ids:
+            sys.stdout.write(json.dumps(letter) + '\n')
+
+
+def mirror(args):
+    """
+    load our objects from the dump files of the RIPE DB into the local mirror
+    """
+    files = {}
+    for file in args.file or []:
+        objecttype, sep, path = file.partition('=')
+        if not sep or objecttype not in OBJECT_TYPES:
+            sys.exit(f"--file must be {' or '.join(f'{t}=PATH' for t in OBJECT_TYPES)}")
+        files[objecttype] = path
+
+    ripe_mirror = RipeMirror()
+    for objecttype in files or OBJECT_TYPES:
+        count = ripe_mirror.load(objecttype, files.get(objecttype), args.mnt)
+        print(f'{objecttype}: {count}')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m ripeupdater')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_worker = commands.add_parser('worker', help='process queued webhooks')
+    parser_worker.add_argument('-w', '--workers', type=int, default=max(int(QUEUE_WORKERS), 1),
+                               help='number of worker threads')
+    parser_worker.set_defaults(func=worker)
+
+    parser_sync = commands.add_parser('sync', help='sync all NetBox prefixes with ripe_report to RIPE DB')
+    parser_sync.add_argument('-w', '--workers', type=int, default=int(SYNC_WORKERS),
+                             help='number of parallel RIPE DB requests')
+    parser_sync.add_argument('-n', '--dry-run', action='store_true',
+                             help='print planned changes as json lines, without writing to RIPE DB')
+    parser_sync.add_argument('-a', '--all', action='store_true',
+                             help='include unchanged prefixes in the output of --dry-run')
+    parser_sync.set_defaults(func=sync)
+
+    parser_export = commands.add_parser('export', help='export backups as json lines or tar.gz archive')
+    parser_export.add_argument('-f', '--format', choices=FORMATS, default=NDJSON, help='format of the export')
+    parser_export.add_argument('-s', '--search', help='network or beginning of the keys of the exported backups')
+    parser_export.add_argument('-l', '--latest', action='store_true',
+                               help='export only the latest version of each prefix')
+    parser_export.add_argument('-o', '--output', help='file to write the export to, default is stdout')
+    parser_export.add_argument('-w', '--workers', type=int, default=EXPORT_WORKERS,
+                               help='number of parallel S3 requests')
+    parser_export.set_defaults(func=export)
+
+    parser_dead = commands.add_parser('dead-letters', help='list or replay jobs, which ran out of retries')
+    parser_dead.add_argument('ids', nargs='*', type=int, help='only these dead letters')
+    parser_dead.add_argument('-r', '--replay', action='store_true', help='queue the dead letters again')
+    parser_dead.set_defaults(func=dead_letters)
+
+    parser_mirror = commands.add_parser('mirror', help='load our objects from the dump files of the RIPE DB')
+    parser_mirror.add_argument('-f', '--file', action='append',
+                               help='load a local dump file instead of RIPE_MIRROR_URL, e.g. inetnum=ripe.db.inetnum.gz')
+    parser_mirror.add_argument('-m', '--mnt', action='append', help='maintainer of the objects, default RIPE_MIRROR_MNT')
+    parser_mirror.set_defaults(func=mirror)
+
+    parser_restore = commands.add_parser('restore', help='write backups back to RIPE DB')
+    parser_restore.add_argument('prefixes', nargs='*', help='restore only these prefixes')
+    parser_restore.add_argument('-m', '--manifest', help='restore the objects of a saved manifest.json')
+    parser_restore.add_argument('-t', '--at', help='restore the versions at this unix timestamp or ISO 8601 time')
+    parser_restore.add_argument('-r', '--resume', type=int, help='resume an interrupted restore by its id')
+    parser_restore.add_argument('-w', '--workers', type=int, default=int(SYNC_WORKERS),
+                                help='number of parallel RIPE DB requests')
+    parser_restore.set_defaults(func=restore)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
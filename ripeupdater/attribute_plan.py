@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compiles a template and its inherited base template into the ordered list of attributes of a RIPE object.
+Values, which differ per prefix, are left as slots and filled in when rendering an object.
+"""
+
+# attributes, which are patched in the TEST database
+TEST_MNT_ATTRIBUTES = ['mnt-by', 'mnt-ref', 'mnt-lower', 'mnt-domains', 'mnt-routes', 'mnt-irt']
+TEST_PERSON_ATTRIBUTES = ['admin-c', 'tech-c', 'abuse-c']
+
+# attributes, which may be given multiple times in templates and base templates
+MULTIPLE_ATTRIBUTES = ['descr', 'country']
+
+
+class Slot:
+    """
+    placeholder for a value, which is filled in when rendering an object
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f'Slot({self.name})'
+
+
+NETNAME = Slot('netname')
+ORG = Slot('org')
+COUNTRY = Slot('country')
+STATUS = Slot('status')
+
+
+class AttributePlan:
+    """
+    ordered list of (name, value) following the primary key, a value may be a Slot
+    """
+    def __init__(self, attributes):
+        self.attributes = attributes
+
+    def render(self, objecttype, primary_key, **values):
+        """
+        fill in the slots and return the attributes of a RIPE object, attributes without a value are left out
+        values: netname, org, country and status
+        """
+        attributes = [{'name': objecttype, 'value': primary_key}]
+        for name, value in self.attributes:
+            if type(value) is Slot:
+                value = values[value.name]
+            if value:
+                attributes.append({'name': name, 'value': value})
+
+        return attributes
+
+
+def compile_plan(template_attributes, master_attributes, ripe_db, test_values=None):
+    """
+    compile attributes of a template and its base template into an AttributePlan
+
+    Order: primary key, netname, descr, org, country, the remaining attributes of template and
+    base template and status, which is placed right before source.
+    Attributes of the template replace those of the base template with the same name,
+    descr and country of both are kept. An org given in template or base template replaces
+    the org of the LIR, a status given replaces the default status.
+    In the TEST database maintainers, persons, org, source and status are replaced by test_values,
+    a dict with the keys mnt, person and org.
+    """
+    template_fields = [(name, value) for attribute in template_attributes
+                       for name, value in attribute.items() if value]
+    template_names = {name for name, value in template_fields if name not in MULTIPLE_ATTRIBUTES}
+    master_fields = [(name, value) for attribute in master_attributes
+                     for name, value in attribute.items() if value and name not in template_names]
+
+    descr = []
+    org = ORG
+    country = [('country', COUNTRY)]
+    status = STATUS
+    others = []
+
+    # base template first, so attributes of the template take precedence
+    for name, value in master_fields + template_fields:
+        if name == 'org':
+            org = value
+        elif name == 'status':
+            status = value
+
+    for name, value in template_fields + master_fields:
+        if name == 'descr':
+            descr.append((name, value))
+        elif name == 'country':
+            country.append((name, value))
+        elif name not in ['org', 'status']:
+            others.append((name, value))
+
+    if ripe_db == 'TEST':
+        # patch attributes, that don't exist in TEST DB
+        org = test_values['org']
+        # status is overridden per address family, as parent objects with mnt-lower may not be present in TEST-DB
+        status = STATUS
+        others = [(name, test_values['mnt'] if name in TEST_MNT_ATTRIBUTES else
+                   test_values['person'] if name in TEST_PERSON_ATTRIBUTES else
+                   ripe_db if name == 'source' else value)
+                  for name, value in others]
+
+    # status goes right before source, or last if there is no source
+    names = [name for name, value in others]
+    position = names.index('source') if 'source' in names else len(others)
+    others.insert(position, ('status', status))
+
+    return AttributePlan([('netname', NETNAME)] + descr + [('org', org)] + country + others)
@@ -1,23 +1,100 @@
 # -*- coding: utf-8 -*-
 
+import gzip
+import hashlib
+import json
 import os
+import sqlite3
+import threading
+import time
 import boto3
 
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from ipaddress import ip_network
 from botocore.exceptions import ClientError
 
+from .cache import TTLCache
 from .log_manager import LogManager
 from .configuration import *
 
+# Name of the sqlite database inside DATA_DIR
+BACKUP_INDEX_FILE = 'backups.sqlite3'
+# Seconds a claimed upload stays locked, before another uploader may pick it up again
+UPLOAD_LEASE = 300
+# Seconds a failed upload waits before it is retried
+UPLOAD_RETRY_DELAY = 10
+# Seconds an idle uploader or a waiting writer waits before looking into the index again
+POLL_INTERVAL = 1
+# Key of the manifest listing all versions of all objects
+MANIFEST_KEY = 'manifest.json'
+# Seconds between uploads of the manifest
+MANIFEST_INTERVAL = 10
+
+
+def format_version(timestamp):
+    """
+    return the version of a backup taken at a unix timestamp, versions sort in chronological order
+    """
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ')
+
+
+def key_network(key):
+    """
+    return the network of a backup key like prefix_198.51.100.0_24.json, None for other keys
+    """
+    name = key.split('/')[0].removesuffix('.json')
+    if not name.startswith('prefix_'):
+        return None
+    try:
+        address, prefixlen = name.removeprefix('prefix_').rsplit('_', 1)
+        return ip_network(f'{address}/{prefixlen}')
+    except ValueError:
+        return None
+
+
+def filter_keys(keys, search=None):
+    """
+    return the keys matching a search, which is either a network, matching the backups of all prefixes within it,
+    or the beginning of a key
+    """
+    if not search:
+        return list(keys)
+
+    try:
+        network = ip_network(search, strict=False)
+    except ValueError:
+        return [key for key in keys if key.startswith(search)]
+
+    networks = ((key, key_network(key)) for key in keys)
+    return [key for key, key_net in networks
+            if key_net and key_net.version == network.version and key_net.subnet_of(network)]
+
+
+def version_key(name, version):
+    """
+    return the key of a version of an object, e.g. prefix_198.51.100.0_24/20221231T235959.000000Z.json
+    """
+    return f"{name.removesuffix('.json')}/{version}.json"
+
 
 class BackupManager:
     """
     Handles storage of backups for ripe objects
+    Backups are written to a local sqlite index and uploaded to s3 by a background thread.
+    Each backup is stored as a new version of its object, versions equal to the last one are not uploaded again.
+    The index of all versions is uploaded as manifest.json.
     """
-    def __init__(self):
+    def __init__(self, path=None):
         """
         connect to s3 and ensures presence of the bucket
         """
         self.logger = LogManager().logger
+        self.uploaded = 0
+        self.skipped = 0
+        self.manifest_dirty = False
+        self.manifest_written = 0
+        self.listing = TTLCache(float(BACKUP_LIST_TTL), 1)
 
         if S3_BACKUP == 'yes':
             self.logger.info(f"connect to s3 {S3_ENDPOINT_URL}")
@@ -36,43 +113,335 @@ class BackupManager:
                     self.logger.info("bucket already exists")
                 else:
                     raise error
+
+            self.path = path or os.path.join(DATA_DIR, BACKUP_INDEX_FILE)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with self.connect() as db:
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute("""CREATE TABLE IF NOT EXISTS uploads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    locked_until REAL
+                )""")
+                db.execute("""CREATE TABLE IF NOT EXISTS versions (
+                    key TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL
+                )""")
+                db.execute('CREATE INDEX IF NOT EXISTS versions_name ON versions (name, created)')
+                empty = not db.execute('SELECT 1 FROM versions LIMIT 1').fetchone()
+
+            if empty:
+                self.import_manifest()
+
+            self.wakeup = threading.Event()
+            self.stopped = threading.Event()
+            self.thread = threading.Thread(target=self.run, name='backup-uploader', daemon=True)
+            self.thread.start()
         else:
             self.logger.info("S3-Backup disabled")
 
+    @contextmanager
+    def connect(self):
+        """
+        yields a new connection in autocommit mode, sqlite connections must not be shared between threads
+        """
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
     def put(self, filename, content):
+        """
+        queue a new version of an object for upload to s3 and return its key
+        None is returned, if the content equals the last stored or queued version
+        """
+        if S3_BACKUP != 'yes':
+            return None
+
+        body = content.encode() if type(content) is str else content
+        digest = hashlib.sha256(body).hexdigest()
+
+        # bounds the uploads waiting in the index
+        while self.pending() >= int(BACKUP_QUEUE_SIZE):
+            self.wakeup.set()
+            time.sleep(POLL_INTERVAL)
+
+        now = time.time()
+        key = version_key(filename, format_version(now))
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                # compare with the latest queued version, or the latest stored one
+                latest = db.execute(
+                    'SELECT sha256 FROM uploads WHERE name = ? ORDER BY id DESC LIMIT 1', (filename,)
+                ).fetchone() or db.execute(
+                    'SELECT sha256 FROM versions WHERE name = ? ORDER BY created DESC LIMIT 1', (filename,)
+                ).fetchone()
+
+                if latest and latest[0] == digest:
+                    key = None
+                else:
+                    db.execute(
+                        'INSERT INTO uploads (name, key, body, sha256, created) VALUES (?, ?, ?, ?, ?)',
+                        (filename, key, body, digest, now)
+                    )
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+
+        if key is None:
+            self.skipped += 1
+            self.logger.info(f'backup {filename} is unchanged, skipping upload')
+            return None
+
+        self.wakeup.set()
+        return key
+
+    def pending(self):
+        """
+        return number of uploads waiting in the index
+        """
+        with self.connect() as db:
+            return db.execute('SELECT COUNT(*) FROM uploads').fetchone()[0]
+
+    def claim(self):
+        """
+        lock the oldest upload and return it as (id, name, key, body, sha256, created), None if there is none
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute(
+                    """SELECT id, name, key, body, sha256, created FROM uploads
+                       WHERE locked_until IS NULL OR locked_until < ? ORDER BY id LIMIT 1""",
+                    (now,)
+                ).fetchone()
+                if row is not None:
+                    db.execute('UPDATE uploads SET locked_until = ? WHERE id = ?', (now + UPLOAD_LEASE, row[0]))
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+
+        return row
+
+    def upload(self, key, body):
         """
         upload an object to s3
         """
-        if S3_BACKUP == 'yes':
-            return self.s3.put_object(
-                Bucket=S3_BUCKET,
-                Key=filename,
-                Body=content
+        if BACKUP_GZIP == 'yes':
+            return self.s3.put_object(Bucket=S3_BUCKET, Key=key, Body=gzip.compress(body),
+                                      ContentType='application/json', ContentEncoding='gzip')
+
+        return self.s3.put_object(Bucket=S3_BUCKET, Key=key, Body=body, ContentType='application/json')
+
+    def run_once(self):
+        """
+        upload a single object, returns False if there was nothing to upload
+        """
+        upload = self.claim()
+        if upload is None:
+            return False
+
+        upload_id, name, key, body, digest, created = upload
+        try:
+            self.upload(key, body)
+        except Exception as err:
+            self.logger.error(f'Could not upload backup {key}, retrying in {UPLOAD_RETRY_DELAY}s: {err!r}')
+            with self.connect() as db:
+                db.execute('UPDATE uploads SET locked_until = ? WHERE id = ?',
+                           (time.time() + UPLOAD_RETRY_DELAY, upload_id))
+            return True
+
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+            db.execute(
+                'INSERT OR REPLACE INTO versions (key, name, version, created, size, sha256) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, name, format_version(created), created, len(body), digest)
             )
-        
-        return None
+            db.execute('COMMIT')
+
+        self.uploaded += 1
+        self.manifest_dirty = True
+        self.listing.clear()
+        self.logger.info(f'uploaded backup {key}')
+        return True
+
+    def run(self):
+        """
+        main loop of the uploader thread
+        """
+        while not self.stopped.is_set():
+            try:
+                if self.run_once():
+                    continue
+                if self.manifest_dirty and time.monotonic() - self.manifest_written >= MANIFEST_INTERVAL:
+                    self.write_manifest()
+            except Exception as err:
+                self.logger.exception(f'backup uploader failed: {err!r}')
+            self.wakeup.wait(POLL_INTERVAL)
+            self.wakeup.clear()
+
+    def stop(self):
+        """
+        let the uploader finish its current upload and stop, queued uploads stay in the index
+        """
+        if S3_BACKUP != 'yes':
+            return
+
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread.join()
+
+    def flush(self, timeout=None):
+        """
+        wait until all queued uploads are done, returns False on timeout
+        """
+        if S3_BACKUP != 'yes':
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self.wakeup.set()
+            time.sleep(0.1)
+
+        if self.manifest_dirty:
+            self.write_manifest()
+        return True
+
+    def manifest(self):
+        """
+        return all stored versions as {'updated': timestamp, 'objects': {name: [[version, size, sha256], ...]}}
+        versions of each object are sorted from old to new
+        """
+        with self.connect() as db:
+            rows = db.execute('SELECT name, version, size, sha256 FROM versions ORDER BY name, created').fetchall()
+
+        objects = {}
+        for name, version, size, digest in rows:
+            objects.setdefault(name, []).append([version, size, digest])
+
+        return {'updated': time.time(), 'objects': objects}
+
+    def write_manifest(self):
+        """
+        upload the manifest of all versions
+        """
+        self.manifest_dirty = False
+        self.manifest_written = time.monotonic()
+        manifest = self.manifest()
+        try:
+            self.upload(MANIFEST_KEY, json.dumps(manifest, separators=(',', ':')).encode())
+        except Exception:
+            self.manifest_dirty = True
+            raise
+        self.logger.info(f"uploaded manifest of {len(manifest['objects'])} objects")
+
+    def import_manifest(self):
+        """
+        fill an empty index from the manifest in s3, e.g. after DATA_DIR was lost
+        """
+        try:
+            manifest = json.loads(self.get(MANIFEST_KEY))
+        except ClientError as error:
+            if error.response['Error']['Code'] not in ['NoSuchKey', '404']:
+                self.logger.error(f'Could not read {MANIFEST_KEY}: {error}')
+            return
+        except (TypeError, ValueError) as err:
+            self.logger.error(f'Could not read {MANIFEST_KEY}: {err!r}')
+            return
+
+        rows = [(version_key(name, version), name, version,
+                 datetime.strptime(version, '%Y%m%dT%H%M%S.%fZ').replace(tzinfo=timezone.utc).timestamp(),
+                 size, digest)
+                for name, versions in manifest['objects'].items() for version, size, digest in versions]
+        with self.connect() as db:
+            db.executemany(
+                'INSERT OR IGNORE INTO versions (key, name, version, created, size, sha256) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        self.logger.info(f'imported {len(rows)} versions from {MANIFEST_KEY}')
+
+    def versions(self, name, manifest=None):
+        """
+        return all versions of an object as list of {'key', 'version', 'size', 'sha256'}, from old to new
+        """
+        manifest = manifest or self.manifest()
+        return [{'key': version_key(name, version), 'version': version, 'size': size, 'sha256': digest}
+                for version, size, digest in manifest['objects'].get(name, [])]
+
+    def snapshot(self, at=None, manifest=None):
+        """
+        return {name: key} of the version of each object in effect at a unix timestamp, by default the latest version
+        a version holds an object as it was before it was overwritten, so the first version after at is taken,
+        objects without a later version are left out, the current object was in effect at that time
+        """
+        manifest = manifest or self.manifest()
+        limit = None if at is None else format_version(at)
+        snapshot = {}
+        for name, versions in manifest['objects'].items():
+            keys = [version_key(name, version) for version, size, digest in versions
+                    if limit is None or version > limit]
+            if keys:
+                snapshot[name] = keys[-1] if limit is None else keys[0]
+
+        return snapshot
 
     def get(self, filename):
         """
         return the content of an object
         """
         if S3_BACKUP == 'yes':
-            return self.s3.get_object(
+            obj = self.s3.get_object(
                 Bucket=S3_BUCKET,
                 Key=filename
-            )['Body'].read()
-        
+            )
+            body = obj['Body'].read()
+            if obj.get('ContentEncoding') == 'gzip':
+                body = gzip.decompress(body)
+            return body
+
         return ""
 
-    def list(self):
+    def list(self, search=None):
         """
-        list all objects in this bucket
+        list all objects in this bucket, sorted by key
+        search is either a network, which lists the backups of all prefixes within it, or the beginning of a key
+        the listing of the bucket is cached for BACKUP_LIST_TTL seconds
         """
-        if S3_BACKUP == 'yes':
-            files = self.s3.list_objects(Bucket=S3_BUCKET)
-            self.logger.debug(f'{files=}')
-            if files.get('Contents'):
-                return [o['Key'] for o in files['Contents']]
-        
-        return []
+        if S3_BACKUP != 'yes':
+            return []
+
+        keys = self.listing.get('keys')
+        if keys is None:
+            keys = []
+            for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=S3_BUCKET):
+                keys.extend(o['Key'] for o in page.get('Contents', []))
+            self.logger.debug(f'listed {len(keys)} objects')
+            self.listing.set('keys', keys)
+
+        return filter_keys(keys, search)
+
+    def stats(self):
+        if S3_BACKUP != 'yes':
+            return {}
 
+        return {
+            'pending': self.pending(),
+            'uploaded': self.uploaded,
+            'skipped': self.skipped,
+        }
@@ -26,6 +26,30 @@ SMTP = getenv('SMTP', '127.0.0.1')
 # default: no
 SMTP_STARTTLS = getenv('SMTP_STARTTLS', 'no')
 
+# MAIL_DIGEST_INTERVAL
+# if set, notifications are collected and sent as one summary mail every interval seconds
+# values: integer
+# default: 0
+MAIL_DIGEST_INTERVAL = getenv('MAIL_DIGEST_INTERVAL', '0')
+
+# MAIL_FAILURES_IMMEDIATELY
+# send notifications of failed operations immediately in digest mode
+# values: yes/no
+# default: yes
+MAIL_FAILURES_IMMEDIATELY = getenv('MAIL_FAILURES_IMMEDIATELY', 'yes')
+
+# MAIL_QUEUE_SIZE
+# maximum number of mails waiting to be sent, further mails are dropped
+# values: integer
+# default: 1000
+MAIL_QUEUE_SIZE = getenv('MAIL_QUEUE_SIZE', '1000')
+
+# MAIL_RETRIES
+# number of retries of a mail, which could not be sent
+# values: integer
+# default: 3
+MAIL_RETRIES = getenv('MAIL_RETRIES', '3')
+
 # SENDER_MAIL
 # sender mail of email-reports
 # values: email
@@ -56,6 +80,48 @@ NETBOX_URL = getenv('NETBOX_URL')
 # default: -
 NETBOX_TOKEN = getenv('NETBOX_TOKEN')
 
+# NETBOX_GRAPHQL
+# fetch sites, regions and aggregates via the GraphQL API of netbox
+# values: yes/no
+# default: no
+NETBOX_GRAPHQL = getenv('NETBOX_GRAPHQL', 'no')
+
+# NETBOX_POOL_SIZE
+# maximum number of connections to netbox per process
+# values: integer
+# default: 10
+NETBOX_POOL_SIZE = getenv('NETBOX_POOL_SIZE', '10')
+
+# NETBOX_TIMEOUT
+# seconds to wait for a response of netbox
+# values: integer
+# default: 30
+NETBOX_TIMEOUT = getenv('NETBOX_TIMEOUT', '30')
+
+# NETBOX_CACHE_TTL
+# seconds the countries of sites and the region tree are cached
+# values: integer
+# default: 3600
+NETBOX_CACHE_TTL = getenv('NETBOX_CACHE_TTL', '3600')
+
+# NETBOX_CACHE_SIZE
+# maximum number of cached sites and regions, each
+# values: integer
+# default: 10000
+NETBOX_CACHE_SIZE = getenv('NETBOX_CACHE_SIZE', '10000')
+
+# NETBOX_CACHE_WARMUP
+# load all sites and regions into the cache at startup
+# values: yes/no
+# default: yes
+NETBOX_CACHE_WARMUP = getenv('NETBOX_CACHE_WARMUP', 'yes')
+
+# NETBOX_INDEX_REFRESH_INTERVAL
+# seconds after which all aggregates and prefixes are loaded from netbox again
+# values: integer
+# default: 300
+NETBOX_INDEX_REFRESH_INTERVAL = getenv('NETBOX_INDEX_REFRESH_INTERVAL', '300')
+
 # DEFAULT_COUNTRY
 # default country if none could be determined
 # values: ISO3166-II country
@@ -68,6 +134,12 @@ DEFAULT_COUNTRY = getenv('DEFAULT_COUNTRY')
 # default: /opt/ripeupdater/templates
 TEMPLATES_DIR = getenv('TEMPLATES_DIR', '/opt/ripeupdater/templates')
 
+# TEMPLATES_RELOAD_INTERVAL
+# seconds between checks for changed templates, 0 disables reloading
+# values: seconds
+# default: 10
+TEMPLATES_RELOAD_INTERVAL = getenv('TEMPLATES_RELOAD_INTERVAL', '10')
+
 # RIPE_MNT_PASSWORD
 # ripe maintainer password with write permissions to your INET(6)NUM objects
 # values: string
@@ -80,6 +152,66 @@ RIPE_MNT_PASSWORD = getenv('RIPE_MNT_PASSWORD')
 # default: TEST
 RIPE_DB = getenv('RIPE_DB', 'TEST')
 
+# RIPE_POOL_SIZE
+# number of connections to the RIPE DB kept open per process
+# values: integer
+# default: 10
+RIPE_POOL_SIZE = getenv('RIPE_POOL_SIZE', '10')
+
+# RIPE_TIMEOUT
+# seconds to wait for the RIPE DB before a request fails
+# values: seconds
+# default: 30
+RIPE_TIMEOUT = getenv('RIPE_TIMEOUT', '30')
+
+# RIPE_READ_RATE
+# queries per second sent to the RIPE DB per process, 0 disables the limit
+# values: float
+# default: 10
+RIPE_READ_RATE = getenv('RIPE_READ_RATE', '10')
+
+# RIPE_WRITE_RATE
+# creates, updates and deletes per second sent to the RIPE DB per process, 0 disables the limit
+# values: float
+# default: 2
+RIPE_WRITE_RATE = getenv('RIPE_WRITE_RATE', '2')
+
+# RIPE_LATENCY_TARGET
+# seconds a request to the RIPE DB may take before fewer requests are sent in parallel
+# values: seconds
+# default: 5
+RIPE_LATENCY_TARGET = getenv('RIPE_LATENCY_TARGET', '5')
+
+# RIPE_RETRIES
+# how often requests throttled or rejected as unavailable by the RIPE DB are retried
+# values: integer
+# default: 3
+RIPE_RETRIES = getenv('RIPE_RETRIES', '3')
+
+# RIPE_MIRROR
+# serve reads from a local mirror of our objects, loaded from the dump files of the RIPE DB by the mirror command
+# values: yes/no
+# default: no
+RIPE_MIRROR = getenv('RIPE_MIRROR', 'no')
+
+# RIPE_MIRROR_MNT
+# maintainers of the objects kept in the mirror, separated by comma
+# values: string
+# default: empty
+RIPE_MIRROR_MNT = getenv('RIPE_MIRROR_MNT', '')
+
+# RIPE_MIRROR_URL
+# URL of the dump files of the RIPE DB, {objecttype} is replaced by inetnum or inet6num
+# values: URL
+# default: https://ftp.ripe.net/ripe/dbase/split/ripe.db.{objecttype}.gz
+RIPE_MIRROR_URL = getenv('RIPE_MIRROR_URL', 'https://ftp.ripe.net/ripe/dbase/split/ripe.db.{objecttype}.gz')
+
+# RIPE_MIRROR_MAX_AGE
+# seconds after the last load, when the mirror is not used anymore
+# values: seconds
+# default: 172800
+RIPE_MIRROR_MAX_AGE = getenv('RIPE_MIRROR_MAX_AGE', '172800')
+
 # RIPE_TEST_MNT
 # which maintainer to use in the TEST database, as your maintainer may not be present
 # values: string
@@ -151,3 +283,57 @@ S3_SECRET_ACCESS_KEY = getenv('S3_SECRET_ACCESS_KEY')
 # values: string
 # default: -
 S3_BUCKET = getenv('S3_BUCKET')
+
+# BACKUP_GZIP
+# store backups gzip compressed
+# values: yes/no
+# default: no
+BACKUP_GZIP = getenv('BACKUP_GZIP', 'no')
+
+# BACKUP_LIST_TTL
+# seconds the listing of all backups is cached
+# values: integer
+# default: 30
+BACKUP_LIST_TTL = getenv('BACKUP_LIST_TTL', '30')
+
+# BACKUP_QUEUE_SIZE
+# maximum number of backups waiting for upload, further backups wait for a free slot
+# values: integer
+# default: 1000
+BACKUP_QUEUE_SIZE = getenv('BACKUP_QUEUE_SIZE', '1000')
+
+# DATA_DIR
+# location of local state, e.g. the job queue
+# values: path
+# default: /opt/ripeupdater/data
+DATA_DIR = getenv('DATA_DIR', '/opt/ripeupdater/data')
+
+# QUEUE_WORKERS
+# number of threads per process working on queued webhooks, 0 disables workers inside the web service
+# values: integer
+# default: 2
+QUEUE_WORKERS = getenv('QUEUE_WORKERS', '2')
+
+# COALESCE_WINDOW
+# seconds a webhook waits in the queue, further webhooks of the same prefix within this window replace it
+# values: seconds
+# default: 5
+COALESCE_WINDOW = getenv('COALESCE_WINDOW', '5')
+
+# JOB_RETRIES
+# how often a failed job is retried, before it is moved to the dead letters
+# values: integer
+# default: 5
+JOB_RETRIES = getenv('JOB_RETRIES', '5')
+
+# JOB_RETRY_DELAY
+# seconds to wait before the first retry of a failed job, doubled with each further retry, up to an hour
+# values: seconds
+# default: 30
+JOB_RETRY_DELAY = getenv('JOB_RETRY_DELAY', '30')
+
+# SYNC_WORKERS
+# number of parallel RIPE DB requests of the sync command
+# values: integer
+# default: 8
+SYNC_WORKERS = getenv('SYNC_WORKERS', '8')
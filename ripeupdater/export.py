@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+Streams backups out of S3 as a single tar.gz archive or as json lines
+"""
+import io
+import json
+import tarfile
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .backup_manager import filter_keys
+from .log_manager import LogManager
+
+# number of backups fetched from S3 in parallel
+EXPORT_WORKERS = 8
+
+TAR = 'tar'
+NDJSON = 'ndjson'
+FORMATS = [TAR, NDJSON]
+
+logger = LogManager().logger
+
+
+def select_keys(backup, search=None, latest=False):
+    """
+    return the keys of all backups matching search, with latest only the latest version of each prefix
+    """
+    if latest:
+        return sorted(filter_keys(backup.snapshot().values(), search))
+    return backup.list(search)
+
+
+def fetch(backup, keys, workers=None):
+    """
+    yield (key, body, error) of each key in order, at most twice as many objects as workers are held in memory
+    """
+    workers = EXPORT_WORKERS if workers is None else workers
+    window = deque()
+
+    def result(key, future):
+        try:
+            return key, future.result(), None
+        except Exception as err:
+            logger.error(f'Could not export backup {key}: {err!r}')
+            return key, None, repr(err)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for key in keys:
+            window.append((key, executor.submit(backup.get, key)))
+            if len(window) >= 2 * workers:
+                yield result(*window.popleft())
+
+        while window:
+            yield result(*window.popleft())
+
+
+def export_ndjson(backup, keys, workers=None):
+    """
+    yield one json object per backup and line, {'key': key, 'object': object} or {'key': key, 'error': error}
+    """
+    for key, body, error in fetch(backup, keys, workers):
+        if error is None:
+            try:
+                line = {'key': key, 'object': json.loads(body)}
+            except ValueError as err:
+                line = {'key': key, 'error': repr(err)}
+        else:
+            line = {'key': key, 'error': error}
+        yield (json.dumps(line) + '\n').encode()
+
+
+class _Chunks(io.RawIOBase):
+    """
+    file object collecting the written bytes until they are taken
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_tar(backup, keys, workers=None):
+    """
+    yield a tar.gz archive of the backups, backups which could not be fetched are left out
+    """
+    chunks = _Chunks()
+    with tarfile.open(fileobj=chunks, mode='w|gz') as archive:
+        for key, body, error in fetch(backup, keys, workers):
+            if error is not None:
+                continue
+            info = tarfile.TarInfo(key)
+            info.size = len(body)
+            info.mtime = time.time()
+            archive.addfile(info, io.BytesIO(body))
+            data = chunks.take()
+            if data:
+                yield data
+
+    yield chunks.take()
+
+
+def export(backup, keys, fmt=NDJSON, workers=None):
+    """
+    yield the export of keys in the format tar or ndjson
+    """
+    if fmt == TAR:
+        return export_tar(backup, keys, workers)
+    return export_ndjson(backup, keys, workers)
@@ -2,13 +2,13 @@
 
 import json
 import os
-import smtplib
-import socket
+from difflib import SequenceMatcher
 from email.message import EmailMessage
 
 from ipaddress import ip_network
 from .exceptions import ErrorSmallPrefix, NotRoutedNetwork
 from .log_manager import LogManager
+from .mailer import get_digest, get_outbox
 from .configuration import *
 
 # Dictionary RIPE Documentaion of response codes for each action
@@ -16,6 +16,9 @@ RIPE_DOCU_URLS = {'POST': 'https://github.com/RIPE-NCC/whois/wiki/WHOIS-REST-API
                   'PUT': 'https://github.com/RIPE-NCC/whois/wiki/WHOIS-REST-API-Update',
                   'DELETE': 'https://github.com/RIPE-NCC/whois/wiki/WHOIS-REST-API-Delete'}
 
+# attributes maintained by the RIPE DB itself, they are ignored when comparing objects
+RIPE_MANAGED_ATTRIBUTES = ['created', 'last-modified', 'source']
+
 logger = LogManager().logger
 
 
@@ -53,6 +56,50 @@ def format_ripe_object(obj, prefix=''):
     return string
 
 
+def ripe_attributes(obj):
+    """
+    expects a ripe_object dict or a RIPE DB response and returns its attributes as list of (name, value),
+    names are lower case and whitespace in values is normalized, attributes maintained by the RIPE DB are left out
+    """
+    if not obj:
+        return []
+    if find('objects.object', obj):
+        obj = obj['objects']['object'][0]
+
+    attributes = [(str(attr.get('name')).lower(), ' '.join(str(attr.get('value')).split()))
+                  for attr in find('attributes.attribute', obj) or []]
+    return [(name, value) for name, value in attributes if name not in RIPE_MANAGED_ATTRIBUTES]
+
+
+def diff_ripe_attributes(old_object, new_object):
+    """
+    compares the attributes of two ripe objects and returns the removed (-) and added (+) attributes
+    as list of {'op': op, 'name': name, 'value': value, 'position': position}
+    position is the index of the attribute in the old (-) or new (+) object, an empty list means no changes
+    """
+    old_attributes = ripe_attributes(old_object)
+    new_attributes = ripe_attributes(new_object)
+    changes = []
+
+    matcher = SequenceMatcher(a=old_attributes, b=new_attributes, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        changes.extend({'op': '-', 'name': name, 'value': value, 'position': position}
+                       for position, (name, value) in enumerate(old_attributes[old_start:old_end], old_start))
+        changes.extend({'op': '+', 'name': name, 'value': value, 'position': position}
+                       for position, (name, value) in enumerate(new_attributes[new_start:new_end], new_start))
+
+    return changes
+
+
+def format_changes(changes):
+    """
+    expects a list of changes from diff_ripe_attributes and returns a flat string representation
+    """
+    return ''.join(f"{change['op']} {change['name']}:\t\t{change['value']}\n" for change in changes)
+
+
 def is_v6(prefix):
     return ip_network(prefix).version == 6
 
@@ -105,18 +152,15 @@ def format_cidr(prefix):
     return f'{network[0]} - {network[-1]}'
 
 
-def notify(ripe_object, action, prefix, username, response_code, ripe_errors):
+def notify(ripe_object, action, prefix, username, response_code, ripe_errors, template=None):
     """
-    This function uses smtplib and sendmail to send mails to the local MTA
+    This function queues a mail to the local MTA, which is sent in the background
     MTA forward it to your recipient. Added to support alarming,
     when something is not working.
+    In digest mode the notification is collected and sent within a summary mail.
     """
-    # Read hostname and IP Address to send out within mail
-    hostname = socket.gethostname()
-    try:
-        ipaddr = socket.gethostbyname(hostname)
-    except socket.gaierror as err:
-        ipaddr = 'unknown'
+    # hostname and IP Address to send out within mail, resolved at startup
+    hostname, ipaddr = get_outbox().host
     # Building mail content
     msg = EmailMessage()
     ripe_errors = '\n'.join(ripe_errors)
@@ -143,17 +187,22 @@ RIPE-Service source IP: {ipaddr}
 
     logger.debug(msg)
 
-    if MAIL_REPORT == 'yes':
-        try:
-            logger.debug(f'opening SMTP connection to {SMTP}')
-            with smtplib.SMTP(SMTP) as server:
-                if SMTP_STARTTLS == 'yes':
-                    server.starttls()
-                server.send_message(msg)
-        except (ConnectionRefusedError, socket.timeout, OSError, smtplib.SMTPServerDisconnected) as err:
-            msg = f'unable to connect to SMTP server: {SMTP} - {err}'
-            logger.critical(msg)
-            raise RuntimeError(msg)
+    if MAIL_REPORT != 'yes':
+        return
+
+    if float(MAIL_DIGEST_INTERVAL) > 0 and not (status == 'failed' and MAIL_FAILURES_IMMEDIATELY == 'yes'):
+        get_digest().add({
+            'action': action,
+            'status': status,
+            'prefix': str(prefix),
+            'template': template,
+            'username': username,
+            'response_code': response_code,
+            'errors': ripe_errors,
+            'object': ripe_object,
+        })
+    else:
+        get_outbox().send(msg)
 
 
 def find(path, obj):
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+Interval tree of closed integer intervals, e.g. address ranges
+"""
+
+
+class IntervalTree:
+    """
+    Answers all intervals overlapping a query interval in O(log n + matches).
+    The intervals are sorted by start and form an implicit balanced binary search tree,
+    each node keeps the largest end of its subtree, so subtrees ending before the query are skipped.
+    """
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self.max_end = [0] * len(self.intervals)
+        if self.intervals:
+            self.build(0, len(self.intervals))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def build(self, lo, hi):
+        """
+        set the largest end of the subtree of the intervals lo to hi and return it
+        """
+        mid = (lo + hi) // 2
+        max_end = self.intervals[mid][1]
+        if lo < mid:
+            max_end = max(max_end, self.build(lo, mid))
+        if mid + 1 < hi:
+            max_end = max(max_end, self.build(mid + 1, hi))
+        self.max_end[mid] = max_end
+        return max_end
+
+    def overlapping(self, first, last):
+        """
+        return list of (start, end, value) of all intervals sharing at least one point with first to last,
+        ordered by start
+        """
+        matches = []
+        stack = [(0, len(self.intervals))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self.max_end[mid] < first:
+                continue
+
+            stack.append((lo, mid))
+            start, end, value = self.intervals[mid]
+            # intervals right of mid start even later
+            if start <= last:
+                if end >= first:
+                    matches.append(self.intervals[mid])
+                stack.append((mid + 1, hi))
+
+        return sorted(matches, key=lambda interval: (interval[0], interval[1]))
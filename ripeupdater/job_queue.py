@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import random
+import sqlite3
+import time
+
+from contextlib import contextmanager
+
+from .log_manager import LogManager
+from .configuration import *
+
+# Name of the sqlite database inside DATA_DIR
+QUEUE_FILE = 'queue.sqlite3'
+# Seconds a claimed job stays locked, before another worker may pick it up again
+JOB_LEASE = 900
+# Seconds a broadcast is kept, processes polling less often miss it
+BROADCAST_RETENTION = 3600
+# Longest delay between two attempts of a job
+MAX_RETRY_DELAY = 3600
+
+PENDING = 'pending'
+RUNNING = 'running'
+# status of jobs kept by earlier versions after their first failure, they are moved to the dead letters
+FAILED = 'failed'
+DEAD = 'dead'
+
+
+def retry_delay(attempts):
+    """
+    return seconds to wait before the next attempt of a job, which failed attempts times
+    the delay doubles with each attempt, half of it is random, so jobs failed together are not retried together
+    """
+    delay = min(float(JOB_RETRY_DELAY) * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class JobQueue:
+    """
+    Persistent queue of NetBox webhooks, stored in a local sqlite database.
+    Jobs are keyed by prefix, jobs of the same prefix are never processed in parallel.
+    Failed jobs are retried with backoff, jobs which run out of retries are moved to the dead letters.
+    """
+    def __init__(self, path=None):
+        self.logger = LogManager().logger
+        self.path = path or os.path.join(DATA_DIR, QUEUE_FILE)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        with self.connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                events INTEGER NOT NULL DEFAULT 1,
+                created REAL NOT NULL,
+                available REAL NOT NULL,
+                locked_until REAL,
+                error TEXT
+            )""")
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available)')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)')
+            db.execute("""CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            )""")
+            db.execute("""CREATE TABLE IF NOT EXISTS dead_letters (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                created REAL NOT NULL,
+                failed REAL NOT NULL,
+                error TEXT
+            )""")
+            db.execute('BEGIN IMMEDIATE')
+            db.execute("""INSERT OR IGNORE INTO dead_letters (id, key, payload, attempts, created, failed, error)
+                          SELECT id, key, payload, attempts, created, created, error FROM jobs WHERE status = ?""",
+                       (FAILED,))
+            db.execute('DELETE FROM jobs WHERE status = ?', (FAILED,))
+            db.execute('COMMIT')
+
+    @contextmanager
+    def connect(self):
+        """
+        yields a new connection in autocommit mode, sqlite connections must not be shared between threads
+        """
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def put(self, key, webhook):
+        """
+        add a webhook to the queue and return the id of the job
+        a webhook for a key, which is still waiting in the queue, replaces the waiting payload,
+        so only the last state of a prefix is applied, it also supersedes dead letters of the key
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute(
+                    'SELECT id, events FROM jobs WHERE key = ? AND status = ? ORDER BY id DESC LIMIT 1',
+                    (key, PENDING)
+                ).fetchone()
+
+                if row:
+                    job_id, events = row
+                    # a job waiting for its retry gets all retries again for the new state
+                    db.execute(
+                        'UPDATE jobs SET payload = ?, events = events + 1, attempts = 0, '
+                        'available = MIN(available, ?) WHERE id = ?',
+                        (json.dumps(webhook), now + float(COALESCE_WINDOW), job_id)
+                    )
+                else:
+                    events = 0
+                    job_id = db.execute(
+                        'INSERT INTO jobs (key, payload, status, created, available) VALUES (?, ?, ?, ?, ?)',
+                        (key, json.dumps(webhook), PENDING, now, now + float(COALESCE_WINDOW))
+                    ).lastrowid
+                superseded = db.execute('DELETE FROM dead_letters WHERE key = ?', (key,)).rowcount
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+
+        if superseded:
+            self.logger.info(f'dropped {superseded} dead letters of {key}, superseded by job {job_id}')
+        if events:
+            self.logger.info(f'coalesced webhook for {key} into job {job_id}, {events + 1} events')
+        else:
+            self.logger.info(f'queued job {job_id} for {key}')
+        return job_id
+
+    def claim(self):
+        """
+        lock the oldest available job and return it as (id, webhook), None if the queue is empty
+        jobs with an expired lock were left behind by a dead worker and are picked up again
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute(
+                    """SELECT id, payload FROM jobs
+                       WHERE ((status = ? AND available <= ?) OR (status = ? AND locked_until < ?))
+                         AND key NOT IN (SELECT key FROM jobs WHERE status = ? AND locked_until >= ?)
+                       ORDER BY available, id LIMIT 1""",
+                    (PENDING, now, RUNNING, now, RUNNING, now)
+                ).fetchone()
+
+                if row is not None:
+                    db.execute(
+                        'UPDATE jobs SET status = ?, locked_until = ?, attempts = attempts + 1 WHERE id = ?',
+                        (RUNNING, now + JOB_LEASE, row[0])
+                    )
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+
+        if row is None:
+            return None
+
+        job_id, payload = row
+        return job_id, json.loads(payload)
+
+    def done(self, job_id):
+        """
+        remove a finished job from the queue
+        """
+        with self.connect() as db:
+            db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def failed(self, job_id, error, retry=True):
+        """
+        schedule the next attempt of a failed job, jobs without retries left are moved to the dead letters
+        a job superseded by a newer job of its key is dropped, so its older state is never applied
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT key, attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                if row is None:
+                    db.execute('COMMIT')
+                    return
+                key, attempts = row
+                newer = db.execute('SELECT id FROM jobs WHERE key = ? AND id > ? ORDER BY id DESC LIMIT 1',
+                                   (key, job_id)).fetchone()
+                if newer:
+                    delay = None
+                    db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+                elif retry and attempts <= int(JOB_RETRIES):
+                    delay = retry_delay(attempts)
+                    db.execute(
+                        'UPDATE jobs SET status = ?, locked_until = NULL, available = ?, error = ? WHERE id = ?',
+                        (PENDING, now + delay, str(error), job_id)
+                    )
+                else:
+                    delay = None
+                    db.execute(
+                        """INSERT INTO dead_letters (id, key, payload, attempts, created, failed, error)
+                           SELECT id, key, payload, attempts, created, ?, ? FROM jobs WHERE id = ?""",
+                        (now, str(error), job_id)
+                    )
+                    db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+
+        if newer:
+            self.logger.warning(f'job {job_id} for {key} failed, dropped as it is superseded by job {newer[0]}')
+        elif delay is None:
+            self.logger.error(f'job {job_id} for {key} failed {attempts} times, moved to dead letters')
+        else:
+            self.logger.warning(f'job {job_id} for {key} failed {attempts} times, retry in {delay:.0f} seconds')
+
+    def dead_letters(self):
+        """
+        return list of all dead letters as dict with id, key, attempts, created, failed, error and webhook
+        """
+        with self.connect() as db:
+            rows = db.execute(
+                'SELECT id, key, attempts, created, failed, error, payload FROM dead_letters ORDER BY id'
+            ).fetchall()
+
+        return [{'id': letter_id, 'key': key, 'attempts': attempts, 'created': created, 'failed': failed,
+                 'error': error, 'webhook': json.loads(payload)}
+                for letter_id, key, attempts, created, failed, error, payload in rows]
+
+    def replay(self, ids=None):
+        """
+        queue all or the given dead letters again as one batch and return the ids of the queued jobs
+        dead letters of keys with a queued job are dropped, as the queued job is newer
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = db.execute('SELECT id, key, payload, created FROM dead_letters ORDER BY id').fetchall()
+                if ids is not None:
+                    ids = set(ids)
+                    rows = [row for row in rows if row[0] in ids]
+                queued = {key for key, in db.execute('SELECT DISTINCT key FROM jobs')}
+                job_ids = []
+                for letter_id, key, payload, created in rows:
+                    db.execute('DELETE FROM dead_letters WHERE id = ?', (letter_id,))
+                    if key in queued:
+                        continue
+                    queued.add(key)
+                    job_ids.append(db.execute(
+                        'INSERT INTO jobs (key, payload, status, created, available) VALUES (?, ?, ?, ?, ?)',
+                        (key, payload, PENDING, created, now)
+                    ).lastrowid)
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+
+        self.logger.info(f'replayed {len(rows)} dead letters as {len(job_ids)} jobs')
+        return job_ids
+
+    def broadcast(self, webhook):
+        """
+        store a webhook, which every process sharing the queue has to see, e.g. to drop cached data
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.execute('DELETE FROM broadcasts WHERE created < ?', (now - BROADCAST_RETENTION,))
+            broadcast_id = db.execute(
+                'INSERT INTO broadcasts (payload, created) VALUES (?, ?)',
+                (json.dumps(webhook), now)
+            ).lastrowid
+
+        self.logger.info(f"broadcasting {webhook.get('model')} webhook {broadcast_id}")
+        return broadcast_id
+
+    def last_broadcast(self):
+        """
+        return id of the latest broadcast, 0 if there is none
+        """
+        with self.connect() as db:
+            return db.execute('SELECT COALESCE(MAX(id), 0) FROM broadcasts').fetchone()[0]
+
+    def broadcasts(self, after):
+        """
+        return list of (id, webhook) of all broadcasts newer than the id after
+        """
+        with self.connect() as db:
+            rows = db.execute('SELECT id, payload FROM broadcasts WHERE id > ? ORDER BY id', (after,)).fetchall()
+
+        return [(broadcast_id, json.loads(payload)) for broadcast_id, payload in rows]
+
+    def stats(self):
+        """
+        return number of jobs per status, dead letters are counted as status dead
+        """
+        with self.connect() as db:
+            rows = db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+            dead = db.execute('SELECT COUNT(*) FROM dead_letters').fetchone()[0]
+
+        stats = {status: count for status, count in rows}
+        if dead:
+            stats[DEAD] = dead
+        return stats
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import smtplib
+import socket
+import threading
+import time
+
+from collections import Counter
+from email.message import EmailMessage
+from .log_manager import LogManager
+from .configuration import *
+
+# Seconds the connection to the SMTP server is kept open without sending a mail
+IDLE_TIMEOUT = 60
+# Seconds to wait before the first retry of a mail, doubled with each further retry
+RETRY_DELAY = 1
+
+_outbox = None
+_outbox_lock = threading.Lock()
+_digest = None
+_digest_lock = threading.Lock()
+
+
+def resolve_host():
+    """
+    return hostname and IP address of this host
+    """
+    hostname = socket.gethostname()
+    try:
+        ipaddr = socket.gethostbyname(hostname)
+    except socket.gaierror:
+        ipaddr = 'unknown'
+    return hostname, ipaddr
+
+
+class Outbox:
+    """
+    Queue of mails, sent by a background thread over a single SMTP connection.
+    Sending never blocks or fails the caller, mails which cannot be delivered are logged and dropped.
+    host is the (hostname, IP address) named in the mails, resolved once when the outbox is built
+    """
+    def __init__(self, size=None, retries=None, host=None):
+        self.logger = LogManager().logger
+        self.host = host or resolve_host()
+        self.queue = queue.Queue(int(MAIL_QUEUE_SIZE) if size is None else size)
+        self.retries = int(MAIL_RETRIES) if retries is None else retries
+        self.server = None
+        self.sent = 0
+        self.dropped = 0
+
+        thread = threading.Thread(target=self.run, name='mail-outbox', daemon=True)
+        thread.start()
+
+    def send(self, msg):
+        """
+        queue a mail for delivery
+        """
+        try:
+            self.queue.put_nowait(msg)
+        except queue.Full:
+            self.dropped += 1
+            self.logger.critical(f"mail outbox is full, dropping mail {msg['Subject']}")
+
+    def flush(self, timeout=None):
+        """
+        wait until all queued mails were sent or dropped, returns False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def connect(self):
+        self.logger.debug(f'opening SMTP connection to {SMTP}')
+        server = smtplib.SMTP(SMTP, timeout=30)
+        if SMTP_STARTTLS == 'yes':
+            server.starttls()
+        self.server = server
+
+    def disconnect(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (OSError, smtplib.SMTPException):
+                self.server.close()
+            self.server = None
+
+    def deliver(self, msg):
+        """
+        send a mail over the open connection, reconnecting and retrying on errors
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                if self.server is None:
+                    self.connect()
+                self.server.send_message(msg)
+                self.sent += 1
+                return
+            except (OSError, smtplib.SMTPException) as err:
+                self.logger.error(f'unable to send mail via SMTP server {SMTP}, attempt {attempt + 1}: {err}')
+                self.disconnect()
+                if attempt < self.retries:
+                    time.sleep(RETRY_DELAY * 2 ** attempt)
+
+        self.dropped += 1
+        self.logger.critical(f"dropping mail {msg['Subject']} after {self.retries + 1} attempts")
+
+    def run(self):
+        """
+        main loop of the sender thread
+        """
+        while True:
+            try:
+                msg = self.queue.get(timeout=IDLE_TIMEOUT if self.server is not None else None)
+            except queue.Empty:
+                self.logger.debug('closing idle SMTP connection')
+                self.disconnect()
+                continue
+
+            try:
+                self.deliver(msg)
+            except Exception as err:
+                self.dropped += 1
+                self.logger.exception(f'unable to send mail: {err!r}')
+            finally:
+                self.queue.task_done()
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'sent': self.sent,
+            'dropped': self.dropped,
+        }
+
+
+def get_outbox():
+    """
+    return the outbox shared by the whole process
+    """
+    global _outbox
+
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+        return _outbox
+
+
+class Digest:
+    """
+    Collects notifications and queues them as a single summary mail every interval seconds
+    """
+    def __init__(self, interval=None, outbox=None):
+        self.logger = LogManager().logger
+        self.interval = float(MAIL_DIGEST_INTERVAL) if interval is None else interval
+        self.outbox = outbox or get_outbox()
+        self.lock = threading.Lock()
+        self.events = []
+
+        thread = threading.Thread(target=self.run, name='mail-digest', daemon=True)
+        thread.start()
+
+    def add(self, event):
+        """
+        collect a notification, a dict with action, status, prefix, template, username,
+        response_code, errors and object
+        """
+        with self.lock:
+            self.events.append(event)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.send()
+            except Exception as err:
+                self.logger.exception(f'unable to send digest: {err!r}')
+
+    def send(self):
+        """
+        queue a summary mail of all collected notifications
+        """
+        with self.lock:
+            events, self.events = self.events, []
+
+        if events:
+            self.logger.info(f'sending digest of {len(events)} notifications')
+            self.outbox.send(digest_message(events, self.outbox.host))
+
+
+def digest_message(events, host):
+    """
+    return a summary mail of notifications, grouped by action, status and template
+    the RIPE objects and changes of each prefix are attached, host is the (hostname, IP address) of the sender
+    """
+    groups = Counter((event['action'], event['status'], event['template'] or '-') for event in events)
+    failed = sum(1 for event in events if event['status'] == 'failed')
+    hostname, ipaddr = host
+
+    lines = [f'{len(events)} RIPE DB operations, {failed} failed', '', 'count  action  status     template']
+    lines += [f'{count:>5}  {action:<6}  {status:<9}  {template}'
+              for (action, status, template), count in sorted(groups.items())]
+    lines += ['', 'action  status     code  prefix                                       template  triggered by']
+    lines += [f"{event['action']:<6}  {event['status']:<9}  {event['response_code']:<4}  {event['prefix']:<43}  "
+              f"{event['template'] or '-':<8}  {event['username']}" for event in events]
+
+    errors = [f"{event['prefix']}: {event['errors']}" for event in events if event['errors']]
+    if errors:
+        lines += ['', 'Errors:'] + errors
+
+    lines += ['', '----------------', f'FQDN: {hostname}', f'RIPE-Service source IP: {ipaddr}',
+              'The RIPE objects and changes of each prefix are attached.']
+
+    changes = ''.join(f"### {event['action']} {event['prefix']} {event['status']}\n{event['object']}\n"
+                      for event in events)
+
+    msg = EmailMessage()
+    msg.set_content('\n'.join(lines) + '\n')
+    msg.add_attachment(changes, filename='changes.txt')
+    msg['Subject'] = f'RIPE digest: {len(events)} operations, {failed} failed'
+    msg['From'] = SENDER_MAIL
+    msg['To'] = RECIPIENT_MAIL
+    return msg
+
+
+def get_digest():
+    """
+    return the digest shared by the whole process
+    """
+    global _digest
+
+    with _digest_lock:
+        if _digest is None:
+            _digest = Digest()
+        return _digest
+
+
+def flush(timeout=None):
+    """
+    send collected notifications and wait until all queued mails were sent, returns False on timeout
+    """
+    if _digest is not None:
+        _digest.send()
+    return get_outbox().flush(timeout)
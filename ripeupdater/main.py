@@ -8,18 +8,35 @@ Inet6num automatically.
 It catches webhooks from NetBox and initializes HTTP queries also to NetBox, to build at the end
 a valid RIPE Object.
 """
+import json
 import os
+import threading
 
-from flask import Flask, abort, request, render_template
+from flask import Flask, Response, abort, request, render_template, stream_with_context
 from flask.logging import default_handler
 
 from .backup_manager import BackupManager
+from .export import FORMATS, TAR, export, select_keys
+from .job_queue import JobQueue
 from .log_manager import LogManager
-from .netbox import ObjectBuilder
-from .ripe import RipeObjectManager
-from .exceptions import (RipeUpdaterException, NotRoutedNetwork, ErrorSmallPrefix)
+from .mailer import get_outbox
+from .netbox import FetchData, warm_up, site_countries, region_parents, aggregate_index, prefix_index
+from .mirror import get_mirror
+from .netbox_client import get_netbox_client
+from .restore import RestoreJournal, parse_time, select_backups, start_restore
+from .ripe_client import get_ripe_client
+from .template_store import get_template_store
+from .worker import WorkerPool, handle_webhook
+from .exceptions import (RipeUpdaterException, NotRoutedNetwork, ErrorSmallPrefix, BadRequest)
 from .configuration import *
 
+# values of the dry_run parameter or X-Dry-Run header, which enable a dry run, also used for other flags
+DRY_RUN_VALUES = ['1', 'true', 'yes']
+# number of backups on a page of /backups
+BACKUPS_PER_PAGE = 100
+# models, whose webhooks drop cached NetBox data in all processes
+CACHED_MODELS = ['site', 'region', 'aggregate']
+
 logmgr = LogManager()
 logger = logmgr.logger
 
@@ -30,6 +47,26 @@ app = Flask(__name__)
 app.logger.removeHandler(default_handler)
 app.logger.addHandler(logger)
 backup = BackupManager()
+queue = JobQueue()
+workers = WorkerPool(queue, backup)
+workers.start()
+# resolves hostname and IP address for the mails before the first webhook
+get_outbox()
+restores = RestoreJournal()
+# threads of the restores running in this process by restore id
+restore_threads = {}
+restore_lock = threading.Lock()
+
+
+def warm_up_netbox_cache():
+    try:
+        warm_up(FetchData().nb)
+    except Exception as err:
+        logger.error(f'Could not warm up NetBox cache: {err!r}')
+
+
+if NETBOX_CACHE_WARMUP == 'yes':
+    threading.Thread(target=warm_up_netbox_cache, name='netbox-warmup', daemon=True).start()
 
 
 @app.route('/health')
@@ -40,21 +77,114 @@ def check_health():
 
 @app.route('/backups')
 def list_backups():
+    """
+    /backups lists the backups page by page, ?search= filters them by a network or the beginning of their key
+    with ?format=json the page is returned as json
+    """
     logger.info('list backups')
-    return render_template('backups.html', backups=backup.list())
+    search = request.args.get('search', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', BACKUPS_PER_PAGE, type=int), 1), 1000)
+
+    backups = backup.list(search)
+    listing = {
+        'backups': backups[(page - 1) * per_page:page * per_page],
+        'page': page,
+        'per_page': per_page,
+        'pages': max((len(backups) + per_page - 1) // per_page, 1),
+        'total': len(backups),
+        'search': search,
+    }
+
+    if request.args.get('format') == 'json':
+        return listing
+    return render_template('backups.html', **listing)
 
 
-@app.route('/backup/<name>')
+@app.route('/backup/<path:name>')
 def get_backup(name):
     logger.info('get backup')
     return backup.get(name)
 
 
+@app.route('/export')
+def export_backups():
+    """
+    /export streams all backups as json lines, or with ?format=tar as tar.gz archive
+    ?search= filters them like /backups, with ?latest=yes only the latest version of each prefix is exported
+    """
+    logger.info('export backups')
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return f"format must be one of {', '.join(FORMATS)}", 400
+
+    keys = select_keys(backup, request.args.get('search'), request.args.get('latest', 'no').lower() in DRY_RUN_VALUES)
+    if fmt == TAR:
+        return Response(stream_with_context(export(backup, keys, TAR)), mimetype='application/gzip',
+                        headers={'Content-Disposition': 'attachment; filename=backups.tar.gz'})
+    return Response(stream_with_context(export(backup, keys)), mimetype='application/x-ndjson')
+
+
+@app.route('/restore', methods=['POST'])
+def restore():
+    """
+    /restore writes backups back to RIPE DB in the background and returns 202 with the id of the restore
+    the JSON payload selects the backups by {"prefixes": [...], "at": time, "manifest": {...}},
+    {"resume": id} resumes an interrupted restore
+    """
+    if request.headers.get('Authorisation') != UPDATE_TOKEN:
+        logger.error('token missmatch')
+        abort(401)
+
+    payload = request.json
+    if not isinstance(payload, dict):
+        return 'request payload must be a JSON object', 400
+
+    try:
+        if payload.get('resume') is not None:
+            restore_id = int(payload['resume'])
+            if restores.progress(restore_id) is None:
+                return f'restore {restore_id} not found', 404
+        else:
+            at = payload.get('at')
+            selection = select_backups(backup, payload.get('prefixes'), payload.get('manifest'),
+                                       None if at is None else parse_time(str(at)))
+            if not selection:
+                return 'no backups match', 400
+            restore_id = restores.create(selection, json.dumps({key: payload.get(key) for key in ('prefixes', 'at')}))
+    except (BadRequest, TypeError, ValueError) as err:
+        return f'{err}', 400
+
+    with restore_lock:
+        thread = restore_threads.get(restore_id)
+        if thread is None or not thread.is_alive():
+            restore_threads[restore_id] = start_restore(backup, restores, restore_id)
+
+    return {'restore': restore_id}, 202
+
+
+@app.route('/restore/<int:restore_id>')
+def restore_progress(restore_id):
+    """
+    /restore/<id> returns the progress of a restore and the errors of failed objects
+    """
+    progress = restores.progress(restore_id)
+    if progress is None:
+        abort(404)
+    thread = restore_threads.get(restore_id)
+    progress['running'] = thread is not None and thread.is_alive()
+    return progress
+
+
 @app.route('/update', methods=['POST'])
 def update():
     """
-    /update is a route which accepts JSON HTTP requests and returns 200
-    if the incoming webhook is prefix.
+    /update is a route which accepts JSON HTTP requests and returns 202
+    if the incoming webhook is a prefix. The webhook is queued and processed
+    by the queue workers.
+    Webhooks of sites, regions and aggregates drop the cached NetBox data of all processes.
+    With ?dry_run=yes or the header X-Dry-Run: yes, the webhook is processed
+    immediately and the planned change is returned without writing anything.
     """
     if request.headers.get('Authorisation') != UPDATE_TOKEN:
         logger.error('token missmatch')
@@ -71,18 +201,24 @@ def update():
 
     # ensure valid netbox request
     try:
+        if webhook.get('model') in CACHED_MODELS:
+            broadcast_id = queue.broadcast(webhook)
+            workers.notify()
+            return {'broadcast': broadcast_id}, 202
         if webhook['model'] != 'prefix':
-            msg = 'only prefixes are supported'
+            msg = 'only prefixes, aggregates, sites and regions are supported'
             logger.error(msg)
             return msg, 400
+        event = webhook['event']
     except KeyError as e:
         msg = f'not a valid netbox request. Key not found: {e}'
         logger.error(msg)
         return msg, 400
 
-    # ensure presence of custom fields
+    # ensure presence of prefix and custom fields
     try:
         data = webhook['data']
+        prefix = data['prefix']
         custom_fields = data['custom_fields']
         ripe_report = custom_fields['ripe_report']
     except (KeyError, TypeError) as e:
@@ -90,34 +226,71 @@ def update():
         logger.error(msg)
         return msg, 400
 
-    try:
-        # If ripe_report not selected or false then delete object from RIPE-DB
-        if ripe_report is not True:
-            logger.info(f"ripe_report is false, deleting prefix {webhook['data']['prefix']}")
-            netbox_object = ObjectBuilder(webhook)
-            ripe = RipeObjectManager(netbox_object, backup)
-            ripe.delete_object()
+    dry_run = request.args.get('dry_run', request.headers.get('X-Dry-Run', 'no'))
+    if dry_run.lower() in DRY_RUN_VALUES:
+        try:
+            return handle_webhook(webhook, backup, dry_run=True)
+        except (NotRoutedNetwork, ErrorSmallPrefix) as err:
+            return {'prefix': prefix, 'action': 'SKIPPED', 'error': str(err)}
+        except RipeUpdaterException as err:
+            return f'{err=}', 500
 
-        else:
-            # If the incoming webhook updated or created, (not deleted) then push webhook to
-            # RIPE-DB
-            if webhook['event'] != 'deleted':
-                logger.info(f"updating prefix {webhook['data']['prefix']}")
-                netbox_object = ObjectBuilder(webhook)
-                ripe = RipeObjectManager(netbox_object, backup)
-                ripe.push_object()
-            else:
-                # If the incoming webhook is selected as deleted then also delete if from
-                # RIPE-DB
-                logger.info(f"prefix deleted in NetBox, deleting prefix {webhook['data']['prefix']} in RIPE DB")
-                netbox_object = ObjectBuilder(webhook)
-                ripe = RipeObjectManager(netbox_object, backup)
-                ripe.delete_object()
-    except NotRoutedNetwork:
-        return 'NotRoutedNetwork, skipping request', 200
-    except ErrorSmallPrefix:
-        return 'ErrorSmallPrefix, skipping request', 200
-    except RipeUpdaterException as err:
-        return f'{err=}', 500
-
-    return '', 204
+    job_id = queue.put(prefix, webhook)
+    # keeps the prefix index of every process up to date
+    queue.broadcast(webhook)
+    workers.notify()
+
+    return {'job': job_id}, 202
+
+
+@app.route('/stats')
+def stats():
+    logger.debug('calling /stats')
+    return {
+        'ripe': get_ripe_client().stats(),
+        'netbox': get_netbox_client().stats(),
+        'mail': get_outbox().stats(),
+        'backup': backup.stats(),
+        'templates': get_template_store(TEMPLATES_DIR).stats(),
+        'netbox_cache': {
+            'sites': site_countries.stats(),
+            'regions': region_parents.stats(),
+            'aggregates': aggregate_index.stats(),
+            'prefixes': prefix_index.stats(),
+        },
+        'mirror': get_mirror().stats() if get_mirror() else None,
+    }
+
+
+@app.route('/queue')
+def queue_stats():
+    logger.debug('calling /queue')
+    return queue.stats()
+
+
+@app.route('/queue/dead')
+def dead_letters():
+    """
+    /queue/dead lists the jobs which ran out of retries
+    """
+    logger.debug('calling /queue/dead')
+    return {'dead_letters': queue.dead_letters()}
+
+
+@app.route('/queue/replay', methods=['POST'])
+def replay_dead_letters():
+    """
+    /queue/replay queues all dead letters again, or those given by {"ids": [...]}
+    """
+    if request.headers.get('Authorisation') != UPDATE_TOKEN:
+        logger.error('token missmatch')
+        abort(401)
+
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get('ids') if isinstance(payload, dict) else None
+    if ids is not None and not (isinstance(ids, list) and all(isinstance(i, int) for i in ids)):
+        return 'ids must be a list of integers', 400
+
+    job_ids = queue.replay(ids)
+    workers.notify()
+    return {'jobs': job_ids}, 202
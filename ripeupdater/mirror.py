@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local mirror of the inetnum and inet6num objects of our maintainers, loaded from the split dump files of the RIPE DB
+"""
+import gzip
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from contextlib import contextmanager
+from ipaddress import ip_address, ip_network
+
+from .exceptions import ConfigError, RipeDBError
+from .functions import find
+from .interval_tree import IntervalTree
+from .log_manager import LogManager
+from .configuration import *
+
+# Name of the sqlite database inside DATA_DIR
+MIRROR_FILE = 'mirror.sqlite3'
+# Object types held by the mirror
+OBJECT_TYPES = ['inetnum', 'inet6num']
+# Seconds to wait for the download of a dump file to start or continue
+DOWNLOAD_TIMEOUT = 60
+# Seconds an interval tree of the mirrored ranges is used, before writes of other processes are picked up
+TREE_TTL = 300
+# returned by get and overlapping, if the mirror cannot tell whether an object exists
+NOT_LOADED = object()
+# values the RIPE DB puts in place of personal data in its dump files, e.g. of admin-c, tech-c and notify
+DUMMY_VALUES = ['DUMY-RIPE', 'unread@ripe.net']
+
+logger = LogManager().logger
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def parse_rpsl(lines):
+    """
+    yield each object of RPSL text lines, e.g. a dump file, as list of (name, value, comment)
+    continuation lines are joined to their attribute, comments and remarks of the file are skipped
+    """
+    attributes = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            if attributes:
+                yield attributes
+                attributes = []
+            continue
+
+        if line[0] in '#%':
+            continue
+
+        if line[0] in ' \t+':
+            if attributes:
+                name, value, comment = attributes[-1]
+                attributes[-1] = (name, f'{value} {line[1:].split("#")[0].strip()}'.strip(), comment)
+            continue
+
+        name, sep, value = line.partition(':')
+        if sep:
+            value, sep, comment = value.partition('#')
+            attributes.append((name.strip().lower(), value.strip(), comment.strip() if sep else None))
+
+    if attributes:
+        yield attributes
+
+
+def object_range(objecttype, key):
+    """
+    return (first, last) address as integers of an inetnum range like 198.51.100.0 - 198.51.100.255,
+    an inet6num or a prefix
+    """
+    if ' - ' in str(key):
+        first, last = str(key).split(' - ')
+        return int(ip_address(first.strip())), int(ip_address(last.strip()))
+
+    network = ip_network(key, strict=False)
+    return int(network.network_address), int(network.broadcast_address)
+
+
+def rpsl_object(attributes):
+    """
+    return a ripe_object dict like the REST API of the RIPE DB of parsed attributes
+    """
+    objecttype, pkey = attributes[0][0], attributes[0][1]
+    return {'objects': {'object': [{
+        'type': objecttype,
+        'source': {'id': next((value for name, value, comment in attributes if name == 'source'), RIPE_DB)},
+        'primary-key': {'attribute': [{'name': objecttype, 'value': pkey}]},
+        'attributes': {'attribute': [dict(name=name, value=value, **({'comment': comment} if comment else {}))
+                                     for name, value, comment in attributes]},
+    }]}}
+
+
+def open_dump(source):
+    """
+    return a text stream of a dump file, given as URL or local path, gzip compressed or not
+    """
+    if source.startswith(('http://', 'https://')):
+        response = requests.get(source, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        if not response.ok:
+            raise RipeDBError(f'Could not download {source}: {response.status_code}')
+        stream = gzip.GzipFile(fileobj=response.raw) if source.endswith('.gz') else response.raw
+    else:
+        stream = gzip.open(source) if source.endswith('.gz') else open(source, 'rb')
+
+    return io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+
+
+def maintained_by(attributes, maintainers):
+    return any(name == 'mnt-by' and value.upper() in maintainers for name, value, comment in attributes)
+
+
+def without_dummy_remarks(attributes):
+    """
+    return the attributes of a dump object up to source, the RIPE DB appends remarks about replaced personal data
+    """
+    end = next((i for i, (name, value, comment) in enumerate(attributes) if name == 'source'), len(attributes) - 1)
+    return attributes[:end + 1]
+
+
+def without_dummies(mirrored, ripe_object):
+    """
+    return both ripe_object dicts without the attributes, which hold dummy values in the mirrored object,
+    so an object loaded from a dump file can be compared with a generated one
+    """
+    def attributes(obj):
+        if not obj:
+            return []
+        obj = (find('objects.object', obj) or [obj])[0]
+        return find('attributes.attribute', obj) or []
+
+    dummies = {attr['name'].lower() for attr in attributes(mirrored) if attr.get('value') in DUMMY_VALUES}
+    if not dummies:
+        return mirrored, ripe_object
+
+    def strip(obj):
+        if not obj:
+            return obj
+        return {'attributes': {'attribute': [attr for attr in attributes(obj) if attr['name'].lower() not in dummies]}}
+
+    return strip(mirrored), strip(ripe_object)
+
+
+class RipeMirror:
+    """
+    Objects of our maintainers, stored in a local sqlite database by type and address range.
+    The dump files are streamed, so loading needs little memory, objects of other maintainers are dropped.
+    Dumps are published once a day and personal data in them is replaced, so the mirror serves reads and
+    planning, while writes are confirmed by the REST API.
+    A dump is loaded into a temporary staging table first, which replaces the mirrored objects in a short transaction.
+    """
+    def __init__(self, path=None, max_age=None):
+        self.path = path or os.path.join(DATA_DIR, MIRROR_FILE)
+        self.max_age = float(RIPE_MIRROR_MAX_AGE) if max_age is None else max_age
+        # (built, loaded, tree) by object type
+        self.trees = {}
+        self.trees_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        with self.connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute("""CREATE TABLE IF NOT EXISTS objects (
+                objecttype TEXT NOT NULL,
+                first TEXT NOT NULL,
+                last TEXT NOT NULL,
+                pkey TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (objecttype, first, last)
+            )""")
+            db.execute("""CREATE TABLE IF NOT EXISTS loads (
+                objecttype TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                loaded REAL NOT NULL,
+                objects INTEGER NOT NULL
+            )""")
+
+    @contextmanager
+    def connect(self):
+        """
+        yields a new connection in autocommit mode, sqlite connections must not be shared between threads
+        """
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def row(objecttype, key):
+        """
+        return the key columns of an object, addresses are hex encoded, so they sort like numbers
+        """
+        first, last = object_range(objecttype, key)
+        return objecttype, f'{first:032x}', f'{last:032x}'
+
+    def load(self, objecttype, source=None, maintainers=None):
+        """
+        replace all objects of a type by the objects of our maintainers in a dump file and return their number
+        source is an URL or a local file, by default RIPE_MIRROR_URL
+        """
+        source = source or RIPE_MIRROR_URL.format(objecttype=objecttype)
+        maintainers = {mnt.strip().upper() for mnt in (maintainers or RIPE_MIRROR_MNT.split(',')) if mnt.strip()}
+        if not maintainers:
+            raise ConfigError('Please set RIPE_MIRROR_MNT to the maintainers of your objects')
+
+        logger.info(f'loading {objecttype} objects of {", ".join(sorted(maintainers))} from {source}')
+        start = time.monotonic()
+        count = 0
+
+        def rows(lines):
+            nonlocal count
+            for attributes in parse_rpsl(lines):
+                if attributes[0][0] != objecttype or not maintained_by(attributes, maintainers):
+                    continue
+                try:
+                    key = self.row(objecttype, attributes[0][1])
+                except ValueError:
+                    logger.warning(f'skipping {objecttype} {attributes[0][1]}, invalid primary key')
+                    continue
+                count += 1
+                yield key + (attributes[0][1], json.dumps(rpsl_object(without_dummy_remarks(attributes))))
+
+        with self.connect() as db:
+            # the staging table is private to this connection, so the download locks out no writer
+            db.execute('CREATE TEMP TABLE staging AS SELECT * FROM objects WHERE 0')
+            db.execute('CREATE UNIQUE INDEX temp.staging_key ON staging (objecttype, first, last)')
+            with open_dump(source) as lines:
+                db.execute('BEGIN')
+                try:
+                    db.executemany('INSERT OR REPLACE INTO staging (objecttype, first, last, pkey, payload) '
+                                   'VALUES (?, ?, ?, ?, ?)', rows(lines))
+                    db.execute('COMMIT')
+                except BaseException:
+                    db.execute('ROLLBACK')
+                    raise
+
+            # readers keep seeing the previous load until the new one is committed
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute('DELETE FROM objects WHERE objecttype = ?', (objecttype,))
+                db.execute('INSERT INTO objects SELECT * FROM staging')
+                db.execute('INSERT OR REPLACE INTO loads (objecttype, source, loaded, objects) VALUES (?, ?, ?, ?)',
+                           (objecttype, source, time.time(), count))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+
+        self.trees.pop(objecttype, None)
+        logger.info(f'loaded {count} {objecttype} objects in {time.monotonic() - start:.1f} seconds')
+        return count
+
+    def loaded(self, objecttype):
+        """
+        return the unix timestamp of the last load of an object type, None if it was never loaded
+        """
+        with self.connect() as db:
+            row = db.execute('SELECT loaded FROM loads WHERE objecttype = ?', (objecttype,)).fetchone()
+        return row[0] if row else None
+
+    def fresh(self, objecttype):
+        """
+        return True if the objects of a type were loaded within the maximum age
+        """
+        loaded = self.loaded(objecttype)
+        return loaded is not None and time.time() - loaded <= self.max_age
+
+    def get(self, objecttype, key):
+        """
+        return the mirrored ripe_object dict of a prefix or range, None if we maintain no such object
+        NOT_LOADED if the mirror is outdated or the type was never loaded
+        """
+        if not self.fresh(objecttype):
+            return NOT_LOADED
+
+        with self.connect() as db:
+            row = db.execute('SELECT payload FROM objects WHERE objecttype = ? AND first = ? AND last = ?',
+                             self.row(objecttype, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def objects(self, objecttype):
+        """
+        yield (primary key, ripe_object dict) of all mirrored objects of a type, ordered by address
+        """
+        with self.connect() as db:
+            for pkey, payload in db.execute('SELECT pkey, payload FROM objects WHERE objecttype = ? ORDER BY first, last',
+                                            (objecttype,)):
+                yield pkey, json.loads(payload)
+
+    def store(self, obj):
+        """
+        replace the mirrored object by an object written to the RIPE DB
+        """
+        obj = (find('objects.object', obj) or [obj])[0]
+        objecttype = obj['attributes']['attribute'][0]['name']
+        pkey = obj['attributes']['attribute'][0]['value']
+        attributes = [(attr['name'], attr['value'], attr.get('comment')) for attr in obj['attributes']['attribute']]
+        with self.connect() as db:
+            db.execute('INSERT OR REPLACE INTO objects (objecttype, first, last, pkey, payload) VALUES (?, ?, ?, ?, ?)',
+                       self.row(objecttype, pkey) + (pkey, json.dumps(rpsl_object(attributes))))
+        self.trees.pop(objecttype, None)
+
+    def remove(self, objecttype, key):
+        """
+        remove an object deleted in the RIPE DB
+        """
+        with self.connect() as db:
+            db.execute('DELETE FROM objects WHERE objecttype = ? AND first = ? AND last = ?',
+                       self.row(objecttype, key))
+        self.trees.pop(objecttype, None)
+
+    def tree(self, objecttype, loaded):
+        """
+        return an interval tree of the ranges of all mirrored objects of a type, with (primary key, status) as values
+        """
+        with self.trees_lock:
+            built, tree_loaded, tree = self.trees.get(objecttype, (0, None, None))
+            if tree is None or tree_loaded != loaded or time.monotonic() - built > TREE_TTL:
+                with self.connect() as db:
+                    rows = db.execute('SELECT first, last, pkey, payload FROM objects WHERE objecttype = ?',
+                                      (objecttype,)).fetchall()
+                intervals = []
+                for first, last, pkey, payload in rows:
+                    attributes = json.loads(payload)['objects']['object'][0]['attributes']['attribute']
+                    status = next((attr['value'] for attr in attributes if attr['name'] == 'status'), None)
+                    intervals.append((int(first, 16), int(last, 16), (pkey, status)))
+                tree = IntervalTree(intervals)
+                self.trees[objecttype] = (time.monotonic(), loaded, tree)
+                logger.debug(f'built interval tree of {len(tree)} {objecttype} objects')
+            return tree
+
+    def overlapping(self, objecttype, key):
+        """
+        return list of (primary key, status) of all mirrored objects overlapping, covering or within
+        a prefix or range, including the object of the range itself, ordered by address
+        NOT_LOADED if the mirror is outdated or the type was never loaded
+        """
+        loaded = self.loaded(objecttype)
+        if loaded is None or time.time() - loaded > self.max_age:
+            return NOT_LOADED
+
+        first, last = object_range(objecttype, key)
+        return [value for start, end, value in self.tree(objecttype, loaded).overlapping(first, last)]
+
+    def stats(self):
+        """
+        return number of objects, source and age of each loaded object type
+        """
+        with self.connect() as db:
+            loads = db.execute('SELECT objecttype, source, loaded FROM loads').fetchall()
+            counts = dict(db.execute('SELECT objecttype, COUNT(*) FROM objects GROUP BY objecttype').fetchall())
+
+        return {objecttype: {'objects': counts.get(objecttype, 0), 'source': source,
+                             'age_seconds': time.time() - loaded, 'fresh': time.time() - loaded <= self.max_age}
+                for objecttype, source, loaded in loads}
+
+
+def get_mirror():
+    """
+    return the mirror shared by the whole process, None if RIPE_MIRROR is disabled
+    """
+    global _mirror
+
+    if RIPE_MIRROR != 'yes':
+        return None
+
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = RipeMirror()
+        return _mirror
@@ -1,31 +1,248 @@
 # -*- coding: utf-8 -*-
 
+import json
 import os
+import threading
+import time
 
-import pynetbox
-
+from ipaddress import ip_network
 from iso3166 import countries_by_alpha2, countries_by_name
+from .cache import TTLCache
 from .exceptions import MissingDataFromNetbox
-from .functions import read_json_file
 from .log_manager import LogManager
+from .netbox_client import get_netbox_client
+from .prefix_tree import PrefixTree
+from .template_store import get_template_store
 from .configuration import *
 
 # Name of Lir Org mapping template
 LIR_ORG = 'lir_org.json'
 
+# marks values not found in a cache, as None is a valid value
+_MISSING = object()
+
+# levels of parent regions fetched with a site via GraphQL, deeper regions are fetched one by one
+GRAPHQL_REGION_DEPTH = 6
+
+# slug of a site -> ISO3166-II country of the site
+site_countries = TTLCache(float(NETBOX_CACHE_TTL), int(NETBOX_CACHE_SIZE))
+# slug of a region -> slug of its parent region
+region_parents = TTLCache(float(NETBOX_CACHE_TTL), int(NETBOX_CACHE_SIZE))
+
+logger = LogManager().logger
+
+
+class NetboxIndex:
+    """
+    PrefixTree of all objects of a NetBox model, shared by the whole process
+    The tree is loaded again after NETBOX_INDEX_REFRESH_INTERVAL seconds or after it was invalidated.
+    """
+    def __init__(self, name, load):
+        self.name = name
+        self.load = load
+        self.lock = threading.Lock()
+        self.tree = None
+        self.loaded_at = None
+        self.refreshes = 0
+
+    def get(self, fetch_data):
+        """
+        return the current tree, None if it could not be loaded
+        """
+        tree, loaded_at = self.tree, self.loaded_at
+        if tree is not None and time.monotonic() - loaded_at < float(NETBOX_INDEX_REFRESH_INTERVAL):
+            return tree
+
+        with self.lock:
+            # another thread may have loaded the tree in the meantime
+            if self.tree is not None and self.loaded_at != loaded_at:
+                return self.tree
+            try:
+                return self.refresh(fetch_data)
+            except Exception as err:
+                logger.error(f'Could not load {self.name} from NetBox: {err!r}')
+                return self.tree
+
+    def refresh(self, fetch_data):
+        """
+        load all objects from NetBox and return the new tree
+        """
+        tree = self.load(fetch_data)
+        self.tree, self.loaded_at = tree, time.monotonic()
+        self.refreshes += 1
+        logger.info(f'indexed {len(tree)} {self.name}')
+        return tree
+
+    def invalidate(self):
+        self.loaded_at = float('-inf')
+
+    def stats(self):
+        return {
+            self.name: len(self.tree) if self.tree is not None else None,
+            'refreshes': self.refreshes,
+        }
+
+
+def load_aggregates(fetch_data):
+    """
+    return PrefixTree of all aggregates and their lir
+    """
+    tree = PrefixTree()
+    for aggregate in fetch_data.nb.ipam.aggregates.all():
+        tree.insert(aggregate.prefix, fetch_data.lir(aggregate))
+    return tree
+
+
+def load_prefixes(fetch_data):
+    """
+    return PrefixTree of all prefixes, each mapped to the ids of the NetBox prefixes of all VRFs
+    """
+    tree = PrefixTree()
+    for prefix in fetch_data.nb.ipam.prefixes.all():
+        tree.insert(prefix.prefix, tree.get(prefix.prefix, frozenset()) | {prefix.id})
+    return tree
+
+
+aggregate_index = NetboxIndex('aggregates', load_aggregates)
+prefix_index = NetboxIndex('prefixes', load_prefixes)
+
+
+def update_prefix_index(webhook):
+    """
+    apply a prefix webhook to the prefix index, without loading all prefixes again
+    """
+    tree = prefix_index.tree
+    if tree is None:
+        return
+
+    data = webhook.get('data') or {}
+    prechange = (webhook.get('snapshots') or {}).get('prechange') or {}
+    prefix_id = data.get('id')
+
+    with prefix_index.lock:
+        for prefix in {data.get('prefix'), prechange.get('prefix')}:
+            if prefix:
+                ids = tree.get(prefix, frozenset()) - {prefix_id}
+                if ids:
+                    tree.insert(prefix, ids)
+                else:
+                    tree.remove(prefix)
+
+        if webhook.get('event') != 'deleted' and data.get('prefix'):
+            tree.insert(data['prefix'], tree.get(data['prefix'], frozenset()) | {prefix_id})
+
+
+def country_of_region(region_slug, parent_of):
+    """
+    walk up the region tree until a region is named like a country and return the country in ISO3166-II format
+    parent_of returns the slug of the parent of a region
+    """
+    while region_slug:
+        country = region_slug.upper()
+        logger.debug(f'testing region {country}')
+        if country in countries_by_name:
+            return countries_by_name[country].alpha2
+
+        region_slug = parent_of(region_slug)
+
+    return None
+
+
+def warm_up(nb):
+    """
+    fill the caches with all regions and sites of NetBox
+    """
+    parents = {region.slug: region.parent.slug if region.parent else None for region in nb.dcim.regions.all()}
+    for region_slug, parent_slug in parents.items():
+        region_parents.set(region_slug, parent_slug)
+
+    sites = 0
+    for site in nb.dcim.sites.all():
+        site_countries.set(site.slug, country_of_region(site.region.slug if site.region else None, parents.get))
+        sites += 1
+
+    logger.info(f'cached {len(parents)} regions and {sites} sites')
+
+
+def invalidate(webhook):
+    """
+    drop or update cached data changed by a webhook
+    """
+    model = webhook.get('model')
+    if model == 'site':
+        prechange = (webhook.get('snapshots') or {}).get('prechange') or {}
+        for slug in {(webhook.get('data') or {}).get('slug'), prechange.get('slug')}:
+            if slug:
+                logger.info(f'dropping cached country of site {slug}')
+                site_countries.pop(slug)
+
+    elif model == 'region':
+        # a region may be the parent of any region or site
+        logger.info('dropping cached regions and sites')
+        site_countries.clear()
+        region_parents.clear()
+
+    elif model == 'aggregate':
+        logger.info('dropping indexed aggregates')
+        aggregate_index.invalidate()
+
+    elif model == 'prefix':
+        update_prefix_index(webhook)
+
+
+def lir_of(custom_fields):
+    """
+    return lir custom field in lower case
+    """
+    netbox_lir = (custom_fields or {}).get('lir')
+    if not netbox_lir:
+        return None
+    # be compatible with older netbox api
+    if type(netbox_lir) is dict:
+        netbox_lir = netbox_lir['label']
+    return netbox_lir.lower()
+
+
+def site_slug_of(webhook):
+    """
+    return slug of the site of a prefix webhook, None if it has no site
+    """
+    site = (webhook.get('data') or {}).get('site')
+    return site.get('slug') if type(site) is dict else None
+
+
+def create_fetch_data():
+    """
+    return FetchData of the configured NetBox API
+    """
+    return GraphqlFetchData() if NETBOX_GRAPHQL == 'yes' else FetchData()
+
 
 class FetchData:
     def __init__(self):
         self.logger = LogManager().logger
-        self.nb = pynetbox.api(NETBOX_URL, token=NETBOX_TOKEN)
+        self.nb = get_netbox_client().api
+
+    def prefetch(self, webhooks):
+        """
+        fetch data needed by many webhooks at once, lookups are answered one by one otherwise
+        """
+        pass
 
     def authorize_delete_overlapped_candidate(self, overlapped_candidate):
         """
         if overlapped_candidated is not a prefix nor an aggregate in netbox
         return True to indicate this candidate should be deleted from RIPE DB
         """
-        is_prefix = bool(self.nb.ipam.prefixes.get(prefix=str(overlapped_candidate)))
-        is_aggregate = bool(self.nb.ipam.aggregates.get(prefix=str(overlapped_candidate)))
+        prefixes = prefix_index.get(self)
+        aggregates = aggregate_index.get(self)
+        if prefixes is not None and aggregates is not None:
+            # the lir of an aggregate may be None
+            is_prefix = prefixes.get(overlapped_candidate, _MISSING) is not _MISSING
+            is_aggregate = aggregates.get(overlapped_candidate, _MISSING) is not _MISSING
+        else:
+            is_prefix = bool(self.nb.ipam.prefixes.get(prefix=str(overlapped_candidate)))
+            is_aggregate = bool(self.nb.ipam.aggregates.get(prefix=str(overlapped_candidate)))
         self.logger.debug(f'Searched inside netbox for {overlapped_candidate=}, result: \
                           {is_prefix=} {is_aggregate=}')
 
@@ -39,58 +256,176 @@ class FetchData:
                         authorized to delete it from RIPE-DB')
             return True
 
+    def related_prefixes(self, network):
+        """
+        return all NetBox prefixes covering network or inside of it, the largest first
+        """
+        tree = prefix_index.get(self)
+        if tree is None:
+            msg = 'No prefixes could be loaded from NetBox'
+            self.logger.error(msg)
+            raise MissingDataFromNetbox(msg)
+
+        covering = [str(prefix) for prefix, ids in tree.covering(network)]
+        inside = [str(prefix) for prefix, ids in tree.inside(network)]
+        return covering + [prefix for prefix in inside if prefix not in covering]
+
     def org(self, prefix):
         """
-        lookup lir in parent aggregate for prefix and return matching RIPE org
+        lookup lir in the smallest aggregate containing prefix and return matching RIPE org
         """
-        template = f'{TEMPLATES_DIR}/{LIR_ORG}'
-        dict_template = read_json_file(template)
-        dict_template = dict_template['templates']['lir_org'].items()
+        tree = aggregate_index.get(self)
+        match = tree.lookup(prefix) if tree is not None else None
+        if match is not None:
+            aggregate, netbox_lir = match
+            return self.org_of_lir(netbox_lir)
 
+        # the aggregate may have been created after the index was loaded
         aggregate = self.nb.ipam.aggregates.get(q=prefix)
-        netbox_lir = aggregate.custom_fields['lir']
-        # be compatible with older netbox api
-        if type(netbox_lir) is dict:
-            netbox_lir = netbox_lir['label']
-        netbox_lir = netbox_lir.lower()
+        if aggregate is None:
+            msg = f'No aggregate found for {prefix}'
+            self.logger.error(msg)
+            raise MissingDataFromNetbox(msg)
 
-        self.logger.info('Defining the suitable RIPE Org attribute')
-        for lir, org in dict_template:
-            if netbox_lir == lir:
-                return org
+        return self.org_of_lir(self.lir(aggregate))
 
-        return None
+    def lir(self, aggregate):
+        """
+        return lir custom field of an aggregate in lower case
+        """
+        return lir_of(aggregate.custom_fields)
+
+    def org_of_lir(self, netbox_lir):
+        """
+        return RIPE org of a lir from the lir_org template
+        """
+        self.logger.info('Defining the suitable RIPE Org attribute')
+        return get_template_store(TEMPLATES_DIR).file(LIR_ORG)['templates']['lir_org'].get(netbox_lir)
 
     def country(self, site_slug):
         """
         This methode get for a prefix's country in ISO3166-II format
         ISO3166-II is expected from RIPE database
         """
+        country = site_countries.get(site_slug, _MISSING)
+        if country is not _MISSING:
+            return country
+
         site = self.nb.dcim.sites.get(slug=site_slug)
         region = self.nb.dcim.regions.get(slug=site.region.slug)
+        region_parents.set(region.slug, region.parent.slug if region.parent else None)
 
         self.logger.info('Finding the suitable ISO country name, which RIPE accepts')
-        while region:
-            country = region.slug.upper()
-            self.logger.debug(f'testing region {country}')
-            if country in countries_by_name:
-                country_alpha2 = countries_by_name[country].alpha2
-                return country_alpha2
-            
-            region = region.parent
+        country = country_of_region(region.slug, self.region_parent)
+        site_countries.set(site_slug, country)
+        return country
 
-        return None
+    def region_parent(self, region_slug):
+        """
+        return slug of the parent of a region
+        """
+        parent_slug = region_parents.get(region_slug, _MISSING)
+        if parent_slug is _MISSING:
+            region = self.nb.dcim.regions.get(slug=region_slug)
+            parent_slug = region.parent.slug if region and region.parent else None
+            region_parents.set(region_slug, parent_slug)
+
+        return parent_slug
+
+
+class PrefetchedData(FetchData):
+    """
+    Loads all regions, sites, aggregates and prefixes at once, so lookups are answered from the caches.
+    Used when processing many prefixes at once.
+    """
+    def __init__(self):
+        super().__init__()
+        self.logger.info('Fetching all regions, sites, aggregates and prefixes from NetBox')
+        warm_up(self.nb)
+        aggregate_index.refresh(self)
+        prefix_index.refresh(self)
+
+
+class GraphqlFetchData(FetchData):
+    """
+    Fetches sites with their region ancestry and the aggregates of many prefixes
+    in a single request to the GraphQL API of NetBox.
+    Lookups, which were not prefetched or failed, are answered by the REST API.
+    """
+    def __init__(self):
+        super().__init__()
+        # prefix -> lir of the smallest aggregate containing it
+        self.lirs = {}
+
+    def prefetch(self, webhooks):
+        site_slugs = sorted({site_slug_of(webhook) for webhook in webhooks} - {None})
+        site_slugs = [slug for slug in site_slugs if site_countries.get(slug, _MISSING) is _MISSING]
+
+        tree = aggregate_index.get(self)
+        prefixes = sorted({(webhook.get('data') or {}).get('prefix') for webhook in webhooks} - {None})
+        prefixes = [prefix for prefix in prefixes
+                    if prefix not in self.lirs and (tree is None or tree.lookup(prefix) is None)]
+
+        if not site_slugs and not prefixes:
+            return
+
+        region = '{ slug }'
+        for i in range(GRAPHQL_REGION_DEPTH):
+            region = f'{{ slug parent {region} }}'
+
+        fields = []
+        if site_slugs:
+            fields.append(f'sites: site_list(slug: {json.dumps(site_slugs)}) {{ slug region {region} }}')
+        for i, prefix in enumerate(prefixes):
+            fields.append(f'aggregate{i}: aggregate_list(q: {json.dumps(prefix)}) {{ prefix custom_fields }}')
+
+        self.logger.info(f'Fetching {len(site_slugs)} sites and {len(prefixes)} aggregates via GraphQL')
+        try:
+            data = get_netbox_client().graphql('{ ' + ' '.join(fields) + ' }')
+        except Exception as err:
+            self.logger.warning(f'GraphQL prefetch failed, using REST API: {err!r}')
+            return
+
+        for site in data.get('sites') or []:
+            region = site.get('region')
+            region_slug = region['slug'] if region else None
+            while region:
+                # the parent of the deepest fetched region is unknown
+                if 'parent' not in region:
+                    break
+                parent = region['parent']
+                region_parents.set(region['slug'], parent['slug'] if parent else None)
+                region = parent
+            site_countries.set(site['slug'], country_of_region(region_slug, self.region_parent))
+
+        for i, prefix in enumerate(prefixes):
+            network = ip_network(prefix)
+            covering = [(ip_network(aggregate['prefix']), lir_of(aggregate.get('custom_fields')))
+                        for aggregate in data.get(f'aggregate{i}') or []]
+            covering = [(aggregate, lir) for aggregate, lir in covering
+                        if aggregate.version == network.version and network.subnet_of(aggregate)]
+            if covering:
+                self.lirs[prefix] = max(covering, key=lambda aggregate: aggregate[0].prefixlen)[1]
+
+    def org(self, prefix):
+        if prefix in self.lirs:
+            return self.org_of_lir(self.lirs[prefix])
+        return super().org(prefix)
 
 
 class ObjectBuilder:
     """
     This class describs methodes to return catchable data from Netbox webhook
     """
-    def __init__(self, webhook):
+    def __init__(self, webhook, fetch_data=None):
         self.logger = LogManager().logger
         self.webhook = webhook
         self.logger.info('Parsing incoming prefix from Netbox')
-        fetch_data = FetchData()
+        if fetch_data is None:
+            fetch_data = create_fetch_data()
+        if type(webhook) is dict:
+            fetch_data.prefetch([webhook])
+        self.fetch_data = fetch_data
         self.country_netbox = fetch_data.country
         self.org_netbox = fetch_data.org
 
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+import time
+
+import pynetbox
+import requests
+
+from collections import Counter
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from .exceptions import MissingDataFromNetbox
+from .log_manager import LogManager
+from .configuration import *
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter applying a default timeout, as pynetbox doesn't pass one
+    """
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class NetboxSession(requests.Session):
+    """
+    Session reporting each request to the client, to count requests and latency per endpoint
+    requests without response and server errors are counted as errors
+    """
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.monotonic()
+        failed = True
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.client.count(method, url, time.monotonic() - start, failed)
+
+
+class NetboxClient:
+    """
+    Thread-safe pynetbox api of the whole process.
+    Connections to NetBox are kept alive in a pool shared by all threads.
+    """
+    def __init__(self, pool_size=None, timeout=None):
+        self.logger = LogManager().logger
+        self.pool_size = int(NETBOX_POOL_SIZE) if pool_size is None else pool_size
+        self.timeout = float(NETBOX_TIMEOUT) if timeout is None else timeout
+
+        self.adapter = TimeoutHTTPAdapter(self.timeout, pool_maxsize=self.pool_size, pool_block=True)
+        self.session = NetboxSession(self)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self.api = pynetbox.api(NETBOX_URL, token=NETBOX_TOKEN)
+        self.api.http_session = self.session
+
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.errors = Counter()
+        self.seconds = Counter()
+
+    def graphql(self, query):
+        """
+        send a query to the GraphQL API of NetBox and return its data
+        """
+        response = self.session.post(f"{NETBOX_URL.rstrip('/')}/graphql/", json={'query': query},
+                                     headers={'Authorization': f'Token {NETBOX_TOKEN}',
+                                              'Accept': 'application/json'})
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+
+        if not response.ok or result.get('errors') or 'data' not in result:
+            msg = f"GraphQL query failed with {response.status_code}: {result.get('errors')}"
+            self.logger.error(msg)
+            raise MissingDataFromNetbox(msg)
+
+        return result['data']
+
+    def count(self, method, url, seconds, failed):
+        # ids are removed, so requests are counted per endpoint
+        endpoint = f"{method.upper()} {re.sub(r'/[0-9]+/', '/<id>/', urlsplit(url).path)}"
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.seconds[endpoint] += seconds
+            if failed:
+                self.errors[endpoint] += 1
+
+    def stats(self):
+        """
+        return request counters and average latency per endpoint
+        """
+        with self.lock:
+            return {
+                'pool_size': self.pool_size,
+                'requests': dict(self.requests),
+                'errors': dict(self.errors),
+                'avg_seconds': {endpoint: self.seconds[endpoint] / count for endpoint, count in self.requests.items()},
+                'total_seconds': sum(self.seconds.values()),
+            }
+
+
+def get_netbox_client():
+    """
+    return the client shared by the whole process
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = NetboxClient()
+        return _client
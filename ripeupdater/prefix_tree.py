@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+Binary radix tree of IPv4 and IPv6 networks
+"""
+from ipaddress import ip_network
+
+
+class PrefixTree:
+    """
+    Maps networks to values and answers longest prefix matches.
+    Each node is a list [child for bit 0, child for bit 1, (network, value) or None].
+    """
+    def __init__(self):
+        self.roots = {4: [None, None, None], 6: [None, None, None]}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def bits(network):
+        """
+        yield the bits of the network part of a network
+        """
+        address = int(network.network_address)
+        for i in range(network.max_prefixlen - 1, network.max_prefixlen - network.prefixlen - 1, -1):
+            yield (address >> i) & 1
+
+    def insert(self, network, value):
+        """
+        add a network, an existing value of the same network is replaced
+        """
+        network = ip_network(network)
+        node = self.roots[network.version]
+        for bit in self.bits(network):
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+
+        if node[2] is None:
+            self.size += 1
+        node[2] = (network, value)
+
+    def node(self, network):
+        """
+        return the node of a network, None if there is none
+        """
+        network = ip_network(network)
+        node = self.roots[network.version]
+        for bit in self.bits(network):
+            node = node[bit]
+            if node is None:
+                return None
+        return node
+
+    def get(self, network, default=None):
+        """
+        return the value of exactly this network
+        """
+        node = self.node(network)
+        if node is None or node[2] is None:
+            return default
+        return node[2][1]
+
+    def remove(self, network):
+        """
+        remove a network, empty nodes are kept
+        """
+        node = self.node(network)
+        if node is not None and node[2] is not None:
+            node[2] = None
+            self.size -= 1
+
+    def covering(self, network):
+        """
+        return list of (network, value) of all networks containing network, the largest first
+        """
+        network = ip_network(network)
+        node = self.roots[network.version]
+        matches = [node[2]] if node[2] is not None else []
+        for bit in self.bits(network):
+            node = node[bit]
+            if node is None:
+                break
+            if node[2] is not None:
+                matches.append(node[2])
+
+        return matches
+
+    def inside(self, network):
+        """
+        return list of (network, value) of network and all networks within it
+        """
+        node = self.node(network)
+        matches = []
+        stack = [node] if node is not None else []
+        while stack:
+            node = stack.pop()
+            if node[2] is not None:
+                matches.append(node[2])
+            stack.extend(child for child in node[1::-1] if child is not None)
+
+        return matches
+
+    def lookup(self, network):
+        """
+        return (network, value) of the smallest network containing network, None if there is none
+        """
+        matches = self.covering(network)
+        return matches[-1] if matches else None
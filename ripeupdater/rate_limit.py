@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+Rate limits and adaptive concurrency limits of outgoing requests
+"""
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average and bursts of up to burst requests, a rate of 0 allows any rate.
+    Waiting requests reserve their token, so they are spread evenly once tokens are available again.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self.tokens = self.burst
+        # time of the last refill, in the future while paused
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self):
+        """
+        take a token, waits until it is available and returns the seconds waited
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            wait = self.updated - now
+            if self.rate > 0:
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait += -self.tokens / self.rate
+            self.waited += wait
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """
+        hand out no tokens for seconds, e.g. on Retry-After, afterwards tokens are refilled from one
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            if now + seconds > self.updated:
+                self.updated = now + seconds
+                self.tokens = min(self.tokens, 1)
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the requests in flight by additive increase, multiplicative decrease (AIMD):
+    the limit grows by one per round of successful requests and is halved on overload,
+    i.e. errors, throttling or latency above the target.
+    """
+    def __init__(self, maximum, latency_target, minimum=1):
+        self.maximum = max(maximum, minimum)
+        self.minimum = minimum
+        self.latency_target = latency_target
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.decreased = 0.0
+        self.decreases = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """
+        wait until the request may be sent and hold a slot while it is in flight
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify()
+
+    def feedback(self, seconds, overloaded=False):
+        """
+        adjust the limit by the latency of a finished request and whether the server was overloaded
+        """
+        with self.condition:
+            if overloaded or seconds > self.latency_target:
+                now = time.monotonic()
+                # requests sent before the last decrease don't show its effect yet
+                if now - seconds >= self.decreased:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.decreased = now
+                    self.decreases += 1
+            elif self.limit < self.maximum:
+                previous = int(self.limit)
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                if int(self.limit) > previous:
+                    self.condition.notify()
+
+
+class RateLimit:
+    """
+    Rate and adaptive concurrency limit of a class of requests
+    """
+    def __init__(self, rate, concurrency, latency_target):
+        self.bucket = TokenBucket(rate)
+        self.concurrency = AdaptiveConcurrency(concurrency, latency_target)
+
+    @contextmanager
+    def slot(self):
+        """
+        wait for a token and a free slot, held while the request is in flight
+        """
+        self.bucket.acquire()
+        with self.concurrency.slot():
+            yield
+
+    def feedback(self, seconds, overloaded=False):
+        self.concurrency.feedback(seconds, overloaded)
+
+    def pause(self, seconds):
+        self.bucket.pause(seconds)
+
+    def stats(self):
+        return {
+            'rate': self.bucket.rate,
+            'waited_seconds': self.bucket.waited,
+            'concurrency': int(self.concurrency.limit),
+            'in_flight': self.concurrency.in_flight,
+            'decreases': self.concurrency.decreases,
+        }
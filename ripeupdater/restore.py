@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""
+Restores RIPE objects from backups
+Each restore is recorded in a journal in DATA_DIR, so an interrupted restore can be resumed.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from ipaddress import ip_network
+
+from .backup_manager import key_network
+from .exceptions import BadRequest
+from .functions import find
+from .log_manager import LogManager
+from .netbox import create_fetch_data
+from .ripe import RipeObjectManager
+from .configuration import *
+
+# Name of the sqlite database inside DATA_DIR
+RESTORE_FILE = 'restore.sqlite3'
+# attributes generated by the RIPE DB, which are not restored
+GENERATED_ATTRIBUTES = ['created', 'last-modified']
+# Username used in notifications of restored objects
+RESTORE_USER = 'ripeupdater restore'
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+logger = LogManager().logger
+
+
+def parse_time(value):
+    """
+    return unix timestamp of a unix timestamp or an ISO 8601 time, times without timezone are UTC
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise BadRequest(f'invalid time {value}')
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def select_backups(backup, prefixes=None, manifest=None, at=None):
+    """
+    return {name: key} of the backups to restore
+    the version of each prefix in effect at the unix timestamp at, by default the latest version, is taken from
+    the manifest, by default the current one, prefixes limits the restore to these prefixes
+    prefixes unchanged since at are left out
+    """
+    selection = {name: key for name, key in backup.snapshot(at, manifest).items() if key_network(name)}
+    if prefixes:
+        try:
+            networks = {ip_network(prefix) for prefix in prefixes}
+        except ValueError as err:
+            raise BadRequest(str(err))
+        selection = {name: key for name, key in selection.items() if key_network(name) in networks}
+
+    return selection
+
+
+def restored_object(stored):
+    """
+    return a ripe_object dict to write a backup to the RIPE DB, generated attributes are removed
+    """
+    obj = find('objects.object', stored)
+    obj = obj[0] if obj else stored
+    attributes = [{'name': attr['name'], 'value': attr['value']} for attr in find('attributes.attribute', obj)
+                  if str(attr.get('name')).lower() not in GENERATED_ATTRIBUTES]
+
+    return {'objects': {'object': [{'source': {'id': RIPE_DB}, 'attributes': {'attribute': attributes}}]}}
+
+
+class BackupObject:
+    """
+    Takes the place of the NetBox object of a prefix, so a backup is written like a pushed prefix
+    """
+    def __init__(self, key, fetch_data=None):
+        self.key = key
+        self.fetch_data = fetch_data or create_fetch_data()
+
+    def prefix(self):
+        return str(key_network(self.key))
+
+    def username(self):
+        return RESTORE_USER
+
+    def netbox_template(self):
+        return None
+
+    def org(self):
+        return None
+
+    def country(self):
+        return None
+
+
+def restore_object(backup, name, key, client=None, fetch_data=None):
+    """
+    write the backup key of the object name to the RIPE DB and return the action
+    the current object is backed up before it is overwritten, an equal object is not written
+    """
+    new_object = restored_object(json.loads(backup.get(key)))
+    ripe = RipeObjectManager(BackupObject(key, fetch_data), backup, client)
+    action = ripe.push_object(new_object)
+
+    logger.info(f'restored {ripe.prefix} from {key}: {action}')
+    return action
+
+
+class RestoreJournal:
+    """
+    Records the objects of each restore and their results in a local sqlite database
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, RESTORE_FILE)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        with self.connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute("""CREATE TABLE IF NOT EXISTS restores (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                description TEXT NOT NULL,
+                created REAL NOT NULL
+            )""")
+            db.execute("""CREATE TABLE IF NOT EXISTS items (
+                restore_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                action TEXT,
+                error TEXT,
+                updated REAL,
+                PRIMARY KEY (restore_id, name)
+            )""")
+
+    @contextmanager
+    def connect(self):
+        """
+        yields a new connection in autocommit mode, sqlite connections must not be shared between threads
+        """
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def create(self, selection, description):
+        """
+        record a restore of {name: key} and return its id
+        """
+        with self.connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            restore_id = db.execute('INSERT INTO restores (description, created) VALUES (?, ?)',
+                                    (description, time.time())).lastrowid
+            db.executemany('INSERT INTO items (restore_id, name, key, status) VALUES (?, ?, ?, ?)',
+                           [(restore_id, name, key, PENDING) for name, key in sorted(selection.items())])
+            db.execute('COMMIT')
+
+        logger.info(f'created restore {restore_id} of {len(selection)} objects: {description}')
+        return restore_id
+
+    def unfinished(self, restore_id):
+        """
+        return list of (name, key) of all objects, which are not restored yet or failed
+        """
+        with self.connect() as db:
+            return db.execute('SELECT name, key FROM items WHERE restore_id = ? AND status != ? ORDER BY name',
+                              (restore_id, DONE)).fetchall()
+
+    def finish(self, restore_id, name, action=None, error=None):
+        """
+        record the result of an object
+        """
+        with self.connect() as db:
+            db.execute('UPDATE items SET status = ?, action = ?, error = ?, updated = ? WHERE restore_id = ? AND name = ?',
+                       (FAILED if error else DONE, action, error, time.time(), restore_id, name))
+
+    def progress(self, restore_id):
+        """
+        return the number of objects per status and action and the errors of failed objects, None for unknown ids
+        """
+        with self.connect() as db:
+            restore = db.execute('SELECT description, created FROM restores WHERE id = ?', (restore_id,)).fetchone()
+            if restore is None:
+                return None
+            statuses = db.execute('SELECT status, COUNT(*) FROM items WHERE restore_id = ? GROUP BY status',
+                                  (restore_id,)).fetchall()
+            actions = db.execute('SELECT action, COUNT(*) FROM items WHERE restore_id = ? AND status = ? GROUP BY action',
+                                 (restore_id, DONE)).fetchall()
+            failed = db.execute('SELECT name, error FROM items WHERE restore_id = ? AND status = ? ORDER BY name',
+                                (restore_id, FAILED)).fetchall()
+
+        return {
+            'restore': restore_id,
+            'description': restore[0],
+            'created': restore[1],
+            'total': sum(count for status, count in statuses),
+            'status': dict(statuses),
+            'actions': dict(actions),
+            'failed': [{'name': name, 'error': error} for name, error in failed],
+        }
+
+
+def run_restore(backup, journal, restore_id, workers=None):
+    """
+    restore all unfinished objects of a restore on a pool of worker threads
+    yields {'name', 'key', 'action'} or {'name', 'key', 'error'} for each object as it is done
+    """
+    workers = int(SYNC_WORKERS) if workers is None else workers
+    items = journal.unfinished(restore_id)
+    logger.info(f'restoring {len(items)} objects of restore {restore_id}')
+
+    def run(item):
+        name, key = item
+        try:
+            action = restore_object(backup, name, key)
+        except Exception as err:
+            logger.error(f'restore of {name} from {key} failed: {err!r}')
+            journal.finish(restore_id, name, error=repr(err))
+            return {'name': name, 'key': key, 'error': repr(err)}
+
+        journal.finish(restore_id, name, action=action)
+        return {'name': name, 'key': key, 'action': action}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(run, items)
+
+
+def start_restore(backup, journal, restore_id, workers=None):
+    """
+    run a restore in a background thread and return the thread
+    """
+    def run():
+        results = list(run_restore(backup, journal, restore_id, workers))
+        failed = sum(1 for result in results if 'error' in result)
+        logger.info(f'restore {restore_id} finished, {len(results)} objects, {failed} failed')
+
+    thread = threading.Thread(target=run, name=f'restore-{restore_id}', daemon=True)
+    thread.start()
+    return thread
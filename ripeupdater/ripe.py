@@ -2,16 +2,17 @@
 
 import os
 
-import requests
 import json
 
-from difflib import ndiff
 from ipaddress import (ip_network, ip_address, summarize_address_range)
 from .exceptions import (BadRequest, ConfigError, RipeDBError)
-from .functions import (validate_prefix, is_v6, notify, read_json_file, format_ripe_object, find,
-                                    format_cidr)
+from .functions import (validate_prefix, is_v6, notify, format_ripe_object, find,
+                                    format_cidr, diff_ripe_attributes, format_changes, ripe_attributes)
 from .log_manager import LogManager
-from .netbox import FetchData
+from .attribute_plan import compile_plan
+from .mirror import NOT_LOADED, get_mirror, without_dummies
+from .ripe_client import get_ripe_client
+from .template_store import get_template_store
 from .configuration import *
 
 # Inetnum defines how Inetnum (IPv4) object look likes in the RIPE-DB
@@ -22,19 +23,33 @@ STATUS_INETNUM = 'ASSIGNED PA'
 INET6NUM = 'inet6num'
 # Status of each object (IPv6), which has to be setten by the outgoing object query
 STATUS_INET6NUM = 'ASSIGNED'
-# Which headers must be used by each query to RIPE
-RIPE_HEADERS = {'Content-Type': 'application/json',
-                'Accept': 'application/json; charset=utf-8'}
 RIPE_PARAMS = {'password': RIPE_MNT_PASSWORD}
 
+# REST API of each RIPE DB
+DATABASES = {
+        'RIPE': 'https://rest.db.ripe.net/ripe',
+        'TEST': 'https://rest-test.db.ripe.net/test',
+        }
+SEARCH_URLS = {
+        'RIPE': 'https://rest.db.ripe.net/search',
+        'TEST': 'https://rest-test.db.ripe.net/search',
+        }
+
 # The main templates file
 TEMPLATES = 'templates.json'
 
+# Actions of a planned change
+CREATE = 'CREATE'
+UPDATE = 'UPDATE'
+DELETE = 'DELETE'
+UNCHANGED = 'UNCHANGED'
+
 
 class RipeObjectManager():
-    def __init__(self, netbox_object, backup):
+    def __init__(self, netbox_object, backup, client=None):
         logmgr = LogManager()
         self.backup = backup
+        self.client = client or get_ripe_client()
         self.logger = logmgr.logger
         self.prefix = netbox_object.prefix()
 
@@ -47,45 +62,50 @@ class RipeObjectManager():
             self.objecttype = INETNUM
             self.status = STATUS_INETNUM
 
-        databases = {
-                'RIPE': 'https://rest.db.ripe.net/ripe',
-                'TEST': 'https://rest-test.db.ripe.net/test',
-                }
-        searchurls = {
-                'RIPE': 'https://rest.db.ripe.net/search',
-                'TEST': 'https://rest-test.db.ripe.net/search',
-                }
+        if RIPE_DB == 'TEST':
+            # override status, as parent objects with mnt-lower may not be present in TEST-DB
+            self.status = RIPE_TEST_STATUS_V6 if is_v6(self.prefix) else RIPE_TEST_STATUS_V4
 
-        self.baseurl = databases.get(RIPE_DB)
+        self.baseurl = DATABASES.get(RIPE_DB)
 
         if not self.baseurl:
             raise ConfigError('Please set RIPE_DB to RIPE or TEST')
 
         self.url = f'{self.baseurl}/{self.objecttype}'
-        self.searchurl = searchurls.get(RIPE_DB)
+        self.searchurl = SEARCH_URLS.get(RIPE_DB)
         self.username = netbox_object.username()
         self.org = netbox_object.org()
         self.netbox_template = netbox_object.netbox_template()
         self.country = netbox_object.country()
+        self.fetch_data = netbox_object.fetch_data
+        self.mirror = get_mirror()
 
-        # always create a backup
-        self.backup_ripe_object()
+        # objects fetched from RIPE DB by prefix, shared by backup, create-vs-update decision and diff
+        self.old_objects = {}
 
     def get_old_object(self):
         """
         get old object from RIPE DB and returns it as json
+        each prefix is only fetched once, until it is written
         """
+        key = str(self.prefix)
+        if key in self.old_objects:
+            self.logger.debug(f'Using fetched ripe object {key}')
+            return self.old_objects[key]
+
         self.logger.info(f'Getting old ripe object {self.prefix}')
-        response = requests.get(f'{self.url}/{self.prefix}?unfiltered', headers=RIPE_HEADERS)
+        response = self.client.get(f'{self.url}/{self.prefix}?unfiltered')
 
         # return object if found
         if response.ok:
             self.logger.info(f'Getting old object has succeeded Return Code: {response.status_code}')
-            return response.json()
+            self.old_objects[key] = response.json()
+            return self.old_objects[key]
 
         # return None if object is not found
         elif response.status_code == 404:
             self.logger.info(f'Object is not existing in RIPE-DB Return Code: {response.status_code}')
+            self.old_objects[key] = None
             return None
 
         else:
@@ -93,169 +113,194 @@ class RipeObjectManager():
             # This raise is important to prevent the application from going further
             raise BadRequest('Bad request, something went wrong!')
 
-    def backup_ripe_object(self):
+    def get_mirrored_object(self):
+        """
+        return the object from the local mirror of the RIPE DB, NOT_LOADED if there is no usable mirror
+        the mirror may be a day behind, so writes must be based on get_old_object
+        """
+        if self.mirror is None:
+            return NOT_LOADED
+        return self.mirror.get(self.objecttype, self.prefix)
+
+    def get_known_object(self):
+        """
+        return the object from the local mirror of the RIPE DB, from the RIPE DB if there is no usable mirror
+        """
+        mirrored = self.get_mirrored_object()
+        if mirrored is not NOT_LOADED:
+            self.logger.debug(f'Using mirrored ripe object {self.prefix}')
+            return mirrored
+        return self.get_old_object()
+
+    def update_mirror(self, ripe_object=None):
+        """
+        apply a written object, or the deletion of the object without one, to the local mirror
+        """
+        if self.mirror is None:
+            return
+        try:
+            if ripe_object:
+                self.mirror.store(ripe_object)
+            else:
+                self.mirror.remove(self.objecttype, self.prefix)
+        except Exception as err:
+            self.logger.error(f'Could not update mirror for {self.prefix}: {err!r}')
+
+    def backup_ripe_object(self, ripe_object=None):
         """
-        save json string of an ripe object
+        save json string of an ripe object, the object is fetched from RIPE DB if not given
         """
-        filename = f"prefix_{self.prefix.replace('/', '_')}.json"
+        filename = f"prefix_{str(self.prefix).replace('/', '_')}.json"
 
-        ripe_object = self.get_old_object()
+        if ripe_object is None:
+            ripe_object = self.get_old_object()
         if ripe_object:
             self.logger.info(f'saving ripe object {filename}')
             self.backup.put(filename, json.dumps(ripe_object))
 
-    def read_local_template(self):
-        netbox_template = self.netbox_template
-        file = f'{TEMPLATES_DIR}/{TEMPLATES}'
-        self.logger.info(f'Reading {netbox_template} in templates file: {file}')
-        templates = read_json_file(file)
-        selected_template = templates['templates'][netbox_template]
-        return selected_template
-
-    def read_master_template(self):
-        inherit = self.read_local_template()['inherit']
-        file = f'{TEMPLATES_DIR}/{inherit}'
-        self.logger.info(f'Reading template file: {file}')
-        master_attributes = read_json_file(file)
-        master_attributes = master_attributes['attributes']
-        return master_attributes
-
-    def overlapped_with(self):
-        """
-        Checks if there is overlapping and return a candidate, it there is not it returns False
-        the overlapped object must be network prefix
-        """
-        params = {
-            'source': RIPE_DB,
-            'type-filter': self.objecttype,
-            'flags': 'no-referenced',
-            'query-string': self.prefix
-        }
-        request = requests.get(self.searchurl, params=params, headers=RIPE_HEADERS)
+    def overlap(self, pkey, status=None):
+        """
+        return (key, networks, status) of an object, key is its network, or its range if it is no single network
+        """
+        if self.objecttype == INET6NUM:
+            network = ip_network(pkey)
+            return network, [network], status
 
-        # found matching entry in RIPE DB, this could be the prefix itself or an overlapping prefix
-        if request.status_code == 200:
-            overlap = request.json()['objects']['object'][0]['primary-key']['attribute'][0]['value']
-            if is_v6(self.prefix):
-                prefix = ip_network(overlap)
-            else:
-                cidr = overlap.split(' - ')
-                prefix = next(summarize_address_range(ip_address(cidr[0]), ip_address(cidr[1])))
+        first, last = pkey.split(' - ')
+        networks = list(summarize_address_range(ip_address(first.strip()), ip_address(last.strip())))
+        return (networks[0] if len(networks) == 1 else pkey), networks, status
+
+    def overlaps(self, mirrored=True, maintainers=None):
+        """
+        return list of (key, networks, status) of all objects overlapping, covering or within the prefix,
+        except the object of the prefix itself
+        the overlaps are answered by the mirror, if it is usable and mirrored is set, by searches in the RIPE DB otherwise
+        maintainers limits the searches to objects maintained by one of them, the mirror only holds our objects
+        """
+        found = self.mirror.overlapping(self.objecttype, self.prefix) if mirrored and self.mirror else NOT_LOADED
+        if found is NOT_LOADED:
+            found = self.search_overlaps(maintainers)
 
-            if prefix != ip_network(self.prefix):
-                self.logger.info(f'May overlapped with: {prefix}')
-                return prefix
+        overlaps = [self.overlap(pkey, status) for pkey, status in found]
+        overlaps = [overlap for overlap in overlaps if overlap[1] != [ip_network(self.prefix)]]
+        for key, networks, status in overlaps:
+            self.logger.info(f'{self.prefix} overlaps with {key} {status}')
+        return overlaps
 
-            return False
+    def search_overlaps(self, maintainers=None):
+        """
+        return list of (primary key, status) of all objects in the RIPE DB covering or within the prefix,
+        with maintainers only those maintained by one of them
+        """
+        found = {}
+        # all less and more specific objects can't be queried at once
+        for flag in ['all-less', 'all-more']:
+            params = {
+                'source': RIPE_DB,
+                'type-filter': self.objecttype,
+                'flags': ['no-referenced', flag],
+                'query-string': self.prefix
+            }
+            request = self.client.get(self.searchurl, params=params)
+
+            # if no prefix is found there is no overlapping prefix
+            if request.status_code == 404:
+                continue
+            if request.status_code != 200:
+                raise RipeDBError(f'Could not query RIPE DB for {self.prefix}: {request}')
+
+            for obj in find('objects.object', request.json()) or []:
+                attributes = ripe_attributes(obj)
+                if maintainers is not None and not any(name == 'mnt-by' and value.upper() in maintainers
+                                                       for name, value in attributes):
+                    continue
+                pkey = obj['primary-key']['attribute'][0]['value']
+                found[pkey] = next((value for name, value in attributes if name == 'status'), None)
+
+        return list(found.items())
+
+    def maintainers(self, ripe_object):
+        """
+        return the maintainers of a ripe object in upper case
+        """
+        return {value.upper() for name, value in ripe_attributes(ripe_object) if name == 'mnt-by'}
 
-        # if no prefix is found there is no overlapping prefix
-        if request.status_code == 404:
-            self.logger.info(f'No overlapping prefix for {self.prefix} found')
-            return False
+    def conflicts(self, overlaps):
+        """
+        return the overlaps, which keep the object from being created: assignments and objects of its own status
+        allocations are never returned, they belong to the LIR, the RIR or IANA
+        """
+        return [(key, networks, status) for key, networks, status in overlaps
+                if status and 'ALLOCATED' not in status.upper()
+                and (status.upper().startswith('ASSIGNED') or status == self.status)]
 
-        # something went wrong
-        raise RipeDBError(f'Could not query RIPE DB for {self.prefix}: {request}')
+    def resolve_overlaps(self, overlaps):
+        """
+        delete the overlapping objects, if all of them are neither prefix nor aggregate in NetBox
+        returns the keys of the deleted objects and the errors of the overlaps, which must be kept
+        """
+        errors = [f'Overlap found for {self.prefix}: {key}' for key, networks, status in overlaps
+                  if not all(self.fetch_data.authorize_delete_overlapped_candidate(network) for network in networks)]
+        # the object can't be created anyway, so nothing is deleted
+        if errors:
+            return [], errors
+
+        deleted = []
+        for key, networks, status in overlaps:
+            # Saving old prefix to push after delete
+            cache_prefix = self.prefix
+            self.prefix = key
+            try:
+                self.delete_object()
+            except BadRequest as err:
+                errors.append(f'Could not delete overlap {key} of {self.prefix}: {err}')
+                continue
+            finally:
+                self.prefix = cache_prefix
+            deleted.append(key)
+
+        return deleted, errors
+
+    def attribute_plan(self):
+        """
+        returns the compiled attributes of the selected template, compiled once per template and RIPE DB
+        """
+        def compile_template(files):
+            template = files[TEMPLATES]['templates'].get(self.netbox_template)
+            if template is None:
+                msg = f'Template {self.netbox_template} not found in {TEMPLATES}'
+                self.logger.error(msg)
+                raise ConfigError(msg)
+
+            self.logger.info(f'Compiling template {self.netbox_template} inheriting {template.get("inherit")}')
+            master_attributes = files[template['inherit']]['attributes'] if template.get('inherit') else []
+            test_values = {'org': RIPE_TEST_ORG, 'mnt': RIPE_TEST_MNT, 'person': RIPE_TEST_PERSON}
+            return compile_plan(template['attributes'], master_attributes, RIPE_DB, test_values)
+
+        store = get_template_store(TEMPLATES_DIR)
+        # ensure existence of the templates file, before compiling
+        store.file(TEMPLATES)
+        return store.cached((TEMPLATES, self.netbox_template, RIPE_DB), compile_template)
 
     def generate_object(self):
         """
         generates the new object for RIPE DB based on selected template
         """
-        # Defining list to gather attributes to prioritize the master_fields
-        templates_fields = []
-        # Defining list to gather attributes to prioritize the dynamic generated attributes
-        master_fields = []
-        # Defining list to gather all attributes together
-        all_fields = []
-
-        # List of attributes in template
-        template_attributes = self.read_local_template()['attributes']
-        # List of attributes in master template
-        master_attributes = self.read_master_template()
-
-        # Parsing template attributes to check which ones have a value
-        for t_attribute in template_attributes:
-            for t_name, t_value in t_attribute.items():
-                if t_value:
-                    if t_name != 'org':
-                        templates_fields.append({t_name: t_value})
-                    else:
-                        self.org = t_value
-                    for m_attribute in master_attributes:
-                        for m_name, m_value in m_attribute.items():
-                            if m_value:
-                                master_fields.append({m_name: m_value})
-                                if m_name in t_attribute.keys() and m_name != 'descr':
-                                    if m_name in t_attribute.keys() and m_name != 'country':
-                                        master_fields.remove({m_name: m_value})
-                                if m_name == 'org':
-                                    self.org = m_value
-                                    master_fields.remove({m_name: m_value})
-
-        # List of dynamic generated attributes from prefix, This list is to guarantee the sequence
-        dynamic_attributes = [{self.objecttype: self.prefix if is_v6(self.prefix) else format_cidr(self.prefix)},
-                              {'netname': self.netbox_template},
-                              {'org': self.org},
-                              {'country': self.country}]
-
-        # Gathering all templates in one list all_fields
-        all_fields.extend(dynamic_attributes)
-        all_fields.extend(templates_fields)
-        all_fields.extend(master_fields)
-
-        # List for sorted fields, will be used to insert fields in specific sequence inside it
-        sorted_fields = []
-        i_descr = 0  # Helps to sort one and many descr fields
-        i_country = 0  # Helps to sort one and many country fields
-
-        for item in all_fields:
-            for key in item.keys():
-                if RIPE_DB == 'TEST':
-                    # patch attributes, that don't exist in TEST DB
-                    if key == 'org':
-                        item[key] = RIPE_TEST_ORG
-                    if key in ['mnt-by', 'mnt-ref', 'mnt-lower', 'mnt-domains', 'mnt-routes', 'mnt-irt']:
-                        item[key] = RIPE_TEST_MNT
-                    if key in ['admin-c', 'tech-c', 'abuse-c']:
-                        item[key] = RIPE_TEST_PERSON
-                    if key == 'source':
-                        item[key] = RIPE_DB
-                    if key == 'status':
-                        # override status, as parent objects with mnt-lower may not be present in TEST-DB
-                        item[key] = RIPE_TEST_STATUS_V6 if is_v6(self.prefix) else RIPE_TEST_STATUS_V4
-                    self.status = RIPE_TEST_STATUS_V6 if is_v6(self.prefix) else RIPE_TEST_STATUS_V4
-
-                if key == 'descr':
-                    # Sort descr fields up second place. Counting from 0
-                    sorted_fields.insert(i_descr + 2, item)
-                    i_descr += 1
-                elif key == 'country':
-                    # Sort country fields up fourth place. Counting from 0
-                    if i_descr != 0:
-                        sorted_fields.insert(i_country + i_descr + 4, item)
-                        i_country += 1
-                    else:
-                        sorted_fields.insert(i_country + i_descr + 4, item)
-                        i_country += 1
-                else:
-                    sorted_fields.append(item)
-
-                # This condition make it possible to overwrite status field
-                if key == 'status':
-                    status_overwritted = sorted_fields.pop(all_fields.index(item))
-                else:
-                    status_overwritted = False
-
-        if status_overwritted:
-            sorted_fields.insert(len(all_fields)-1, item)
-        else:
-            sorted_fields.insert(len(all_fields)-1, {'status': self.status})
+        attributes = self.attribute_plan().render(
+            self.objecttype,
+            self.prefix if is_v6(self.prefix) else format_cidr(self.prefix),
+            netname=self.netbox_template,
+            org=self.org,
+            country=self.country,
+            status=self.status,
+        )
 
         obj = {
                 'objects': {
                     'object': [{
                         'source': {'id': RIPE_DB},
                         'attributes': {
-                            'attribute': [{'name': k, 'value': v} for a in sorted_fields for k, v in a.items() if v]
+                            'attribute': attributes
                         }
                     }]
                 }
@@ -266,46 +311,41 @@ class RipeObjectManager():
         return obj
 
     def post_object(self, new_object):
+        deleted = []
+        if self.mirror is not None and self.mirror.fresh(self.objecttype):
+            # assignments can neither be nested nor overlap, the mirror tells them before the first attempt
+            deleted, errors = self.resolve_overlaps(self.conflicts(self.overlaps()))
+
         # Create object
         self.logger.info(f'CREATE {self.url}')
-        request = requests.post(self.url, json=new_object, headers=RIPE_HEADERS, params=RIPE_PARAMS)
-
+        request = self.client.post(self.url, json=new_object, params=RIPE_PARAMS)
         ripe_object, ripe_errors = self.handle_request(request)
 
+        if request.status_code == 400:
+            # overlaps unknown to the mirror are searched in the RIPE DB and resolved at once,
+            # only objects maintained by the maintainers of the new object are considered
+            overlaps = self.overlaps(mirrored=False, maintainers=self.maintainers(new_object))
+            deleted_now, errors = self.resolve_overlaps(self.conflicts(overlaps))
+            if deleted_now:
+                deleted += deleted_now
+                request = self.client.post(self.url, json=new_object, params=RIPE_PARAMS)
+                ripe_object, ripe_errors = self.handle_request(request)
+            if not request.ok:
+                ripe_errors += errors
+
         if request.ok:
+            self.update_mirror(ripe_object)
+            if deleted:
+                msg = f"I had to delete overlapped: {', '.join(str(key) for key in deleted)}"
+                ripe_errors = [msg]
+                self.logger.info(msg)
             notify(format_ripe_object(ripe_object, '+ '), request.request.method, self.prefix, self.username,
-                   request.status_code, ripe_errors)
+                   request.status_code, ripe_errors, self.netbox_template)
 
             return
-        elif request.status_code == 400:
-            overlapped = self.overlapped_with()
-            if overlapped:
-                netbox = FetchData()
-                authorize = netbox.authorize_delete_overlapped_candidate(overlapped)
-                if authorize:
-                    # Saving old prefix to push after delete
-                    cache_prefix = self.prefix
-
-                    self.prefix = overlapped
-                    self.delete_object()
-
-                    self.prefix = cache_prefix
-                    post = requests.post(self.url, json=new_object, headers=RIPE_HEADERS, params=RIPE_PARAMS)
-                    ripe_object, ripe_errors = self.handle_request(post)
-
-                    if post.ok:
-                        msg = f'I had to delete overlapped: {overlapped}'
-                        ripe_errors = [msg]
-                        self.logger.info(msg)
-                        notify(format_ripe_object(ripe_object, '+ '), post.request.method, self.prefix, self.username,
-                               post.status_code, ripe_errors)
-
-                        return
-                else:
-                    ripe_errors.append(f'Overlap found for {self.prefix}: {overlapped}')
 
         notify(format_ripe_object(ripe_object, '+ '), request.request.method, self.prefix, self.username,
-               request.status_code, ripe_errors)
+               request.status_code, ripe_errors, self.netbox_template)
 
         msg = f'Could not create prefix {self.prefix}'
         self.logger.error(msg)
@@ -313,45 +353,104 @@ class RipeObjectManager():
 
     def put_object(self, old_object, new_object):
         # Update object
-        self.logger.info(f'CREATE {self.url}')
-        request = requests.put(f'{self.url}/{self.prefix if is_v6(self.prefix) else format_cidr(self.prefix)}',
-                               json=new_object, headers=RIPE_HEADERS, params=RIPE_PARAMS)
+        self.logger.info(f'UPDATE {self.url}')
+        request = self.client.put(f'{self.url}/{self.prefix if is_v6(self.prefix) else format_cidr(self.prefix)}',
+                                  json=new_object, params=RIPE_PARAMS)
 
         ripe_object, ripe_errors = self.handle_request(request)
 
-        diff = ndiff(format_ripe_object(old_object['objects']['object'][0]).splitlines(keepends=True),
-                     format_ripe_object(ripe_object).splitlines(keepends=True))
-
         if not request.ok:
             msg = f'UPDATE for {self.prefix} failed: {request=} {ripe_errors=}'
             self.logger.error(msg)
             raise BadRequest(msg)
 
-        notify(''.join(diff), request.request.method, self.prefix, self.username,
-               request.status_code, ripe_errors)
+        self.update_mirror(ripe_object)
+        changes = format_changes(diff_ripe_attributes(old_object, ripe_object))
+        self.logger.info(f'updated {self.prefix}:\n{changes}')
+        notify(changes, request.request.method, self.prefix, self.username,
+               request.status_code, ripe_errors, self.netbox_template)
 
-    def push_object(self):
+    def push_object(self, new_object=None):
         """
         entry point if report_ripe is set to true
         determines if post (create) or put (update) should be executed
+        new_object is written instead of the object generated from the templates, e.g. a backup
+        returns the executed action: CREATE, UPDATE or UNCHANGED
         """
+        new_object = new_object or self.generate_object()
+        # objects up to date in the mirror are not fetched, changes are confirmed by the RIPE DB
+        mirrored = self.get_mirrored_object()
+        if mirrored not in (None, NOT_LOADED) and not diff_ripe_attributes(mirrored, new_object):
+            self.logger.info(f'{self.prefix} is up to date in mirror, skipping UPDATE')
+            return UNCHANGED
+
         old_object = self.get_old_object()
-        new_object = self.generate_object()
         self.logger.debug(f'{old_object=}')
         self.logger.debug(f'{new_object=}')
 
         # if old object exists run update, otherwise create
         if old_object:
+            # skip update and notification, if nothing has changed
+            if not diff_ripe_attributes(old_object, new_object):
+                self.logger.info(f'{self.prefix} is up to date, skipping UPDATE')
+                return UNCHANGED
+
+            # always create a backup before overwriting an object
+            self.backup_ripe_object(old_object)
             self.put_object(old_object, new_object)
-        else:
-            self.post_object(new_object)
+            return UPDATE
+
+        self.post_object(new_object)
+        return CREATE
+
+    def plan_push(self):
+        """
+        returns the change push_object would apply, without writing anything
+        """
+        old_object = self.get_known_object()
+        new_object = self.generate_object()
+        # personal data is replaced in mirrored objects and can't be compared
+        changes = diff_ripe_attributes(*without_dummies(old_object, new_object))
+
+        plan = {
+            'prefix': self.prefix,
+            'template': self.netbox_template,
+            'action': (UPDATE if changes else UNCHANGED) if old_object else CREATE,
+            'changes': changes,
+        }
+        if not old_object:
+            # the overlaps post_object would resolve
+            overlaps = self.overlaps(maintainers=self.maintainers(new_object))
+            plan['overlaps'] = [str(key) for key, networks, status in self.conflicts(overlaps)]
+
+        self.logger.info(f"planned {plan['action']} for {self.prefix}")
+        return plan
+
+    def plan_delete(self):
+        """
+        returns the change delete_object would apply, without writing anything
+        """
+        old_object = self.get_known_object()
+
+        plan = {
+            'prefix': self.prefix,
+            'template': self.netbox_template,
+            'action': DELETE if old_object else UNCHANGED,
+            'changes': diff_ripe_attributes(without_dummies(old_object, None)[0], None),
+        }
+
+        self.logger.info(f"planned {plan['action']} for {self.prefix}")
+        return plan
 
     def delete_object(self):
         """
         delete object from RIPE DB
         """
+        # always create a backup before deleting an object
+        self.backup_ripe_object()
+
         self.logger.info(f'DELETE {self.url}')
-        request = requests.delete(f'{self.url}/{self.prefix}', headers=RIPE_HEADERS, params=RIPE_PARAMS)
+        request = self.client.delete(f'{self.url}/{self.prefix}', params=RIPE_PARAMS)
 
         ripe_object, ripe_errors = self.handle_request(request)
 
@@ -363,10 +462,15 @@ class RipeObjectManager():
             if request.status_code != 404:
                 raise BadRequest(msg)
 
+        self.update_mirror()
+
         notify(format_ripe_object(ripe_object, '-'), request.request.method, self.prefix, self.username,
-               request.status_code, ripe_errors)
+               request.status_code, ripe_errors, self.netbox_template)
 
     def handle_request(self, request):
+        # the object of the current prefix has been written, a fetched copy is outdated
+        self.old_objects.pop(str(self.prefix), None)
+
         self.logger.debug(request)
         response = request.json()
         self.logger.debug(response)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+
+import requests
+
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from .exceptions import RipeDBError
+from .log_manager import LogManager
+from .rate_limit import RateLimit
+from .configuration import *
+
+# Which headers must be used by each query to RIPE
+RIPE_HEADERS = {'Content-Type': 'application/json',
+                'Accept': 'application/json; charset=utf-8'}
+
+# Methods limited by RIPE_READ_RATE, all others are limited by RIPE_WRITE_RATE
+READ_METHODS = ['GET', 'HEAD']
+# Methods which are retried on server errors and connection errors, as repeating them has the same effect
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'PUT']
+# Status codes of overload, which are retried, 429 is retried for all methods as the request was not processed
+RETRY_STATUS = [429, 502, 503, 504]
+# Seconds to wait before the first retry without Retry-After, doubled with each further retry
+RETRY_DELAY = 1
+# Longest Retry-After which is honoured
+MAX_RETRY_AFTER = 300
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class RipeClient:
+    """
+    Thread-safe HTTP client for the RIPE REST API.
+    Connections are kept alive in a pool shared by all threads.
+    Requests are limited by separate budgets for reads and writes, throttled requests are retried.
+    """
+    def __init__(self, pool_size=None, timeout=None, read_rate=None, write_rate=None, retries=None):
+        self.logger = LogManager().logger
+        self.pool_size = int(RIPE_POOL_SIZE) if pool_size is None else pool_size
+        self.timeout = float(RIPE_TIMEOUT) if timeout is None else timeout
+        self.retries = int(RIPE_RETRIES) if retries is None else retries
+        latency_target = float(RIPE_LATENCY_TARGET)
+        self.limits = {
+            'read': RateLimit(float(RIPE_READ_RATE) if read_rate is None else read_rate, self.pool_size, latency_target),
+            'write': RateLimit(float(RIPE_WRITE_RATE) if write_rate is None else write_rate, self.pool_size,
+                               latency_target),
+        }
+
+        # pool_block makes threads wait for a free connection instead of opening throwaway connections
+        self.adapter = HTTPAdapter(pool_maxsize=self.pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.headers.update(RIPE_HEADERS)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.errors = Counter()
+        self.seconds = Counter()
+        self.retried = Counter()
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        send a request to the RIPE DB, a timeout in seconds overrides the default of the client
+        throttled requests and failed idempotent requests are retried, honouring Retry-After
+        """
+        limit = self.limits['read' if method in READ_METHODS else 'write']
+        attempt = 0
+        while True:
+            with limit.slot():
+                start = time.monotonic()
+                try:
+                    response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+                except requests.RequestException as err:
+                    limit.feedback(time.monotonic() - start, overloaded=True)
+                    with self.lock:
+                        self.errors[method] += 1
+                    msg = f'{method} {url} failed: {err}'
+                    self.logger.error(msg)
+                    if method not in IDEMPOTENT_METHODS or attempt >= self.retries:
+                        raise RipeDBError(msg) from err
+                    response = None
+                finally:
+                    seconds = time.monotonic() - start
+                    with self.lock:
+                        self.requests[method] += 1
+                        self.seconds[method] += seconds
+
+            if response is not None:
+                self.logger.debug(f'{method} {url} returned {response.status_code} in {response.elapsed}')
+                limit.feedback(seconds, overloaded=response.status_code in RETRY_STATUS)
+                if not self.retryable(method, response.status_code) or attempt >= self.retries:
+                    return response
+
+            delay = self.retry_after(response)
+            if delay is not None:
+                # the RIPE DB throttles by client, so reads and writes are paused
+                for other in self.limits.values():
+                    other.pause(delay)
+            else:
+                delay = random.uniform(0.5, 1) * RETRY_DELAY * 2 ** attempt
+                time.sleep(delay)
+
+            attempt += 1
+            with self.lock:
+                self.retried[method] += 1
+            status = 'failed' if response is None else f'returned {response.status_code}'
+            self.logger.warning(f'{method} {url} {status}, retry {attempt} in {delay:.1f} seconds')
+
+    @staticmethod
+    def retryable(method, status_code):
+        return status_code == 429 or (status_code in RETRY_STATUS and method in IDEMPOTENT_METHODS)
+
+    @staticmethod
+    def retry_after(response):
+        """
+        return the seconds of the Retry-After header of a response or 1 for 429 without it, None if there is none
+        """
+        if response is None:
+            return None
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return RETRY_DELAY if response.status_code == 429 else None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return RETRY_DELAY
+        return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        """
+        return request counters and connection pool statistics
+        """
+        pools = self.adapter.poolmanager.pools
+        connections = {}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool:
+                connections[f'{pool.scheme}://{pool.host}:{pool.port}'] = {
+                    'opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'free_slots': pool.pool.qsize() if pool.pool else 0,
+                }
+
+        with self.lock:
+            return {
+                'pool_size': self.pool_size,
+                'requests': dict(self.requests),
+                'errors': dict(self.errors),
+                'retries': dict(self.retried),
+                'avg_seconds': {method: self.seconds[method] / count for method, count in self.requests.items()},
+                'limits': {name: limit.stats() for name, limit in self.limits.items()},
+                'connections': connections,
+            }
+
+
+def get_ripe_client():
+    """
+    return the client shared by the whole process
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = RipeClient()
+        return _client
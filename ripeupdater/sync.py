@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reconciles all NetBox prefixes with ripe_report set against the RIPE DB
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from .log_manager import LogManager
+from .netbox import ObjectBuilder, PrefetchedData, GraphqlFetchData
+from .ripe import RipeObjectManager
+from .exceptions import (NotRoutedNetwork, ErrorSmallPrefix)
+from .configuration import *
+
+# results of a synced prefix, besides the actions of a RipeObjectManager
+SKIPPED = 'SKIPPED'
+FAILED = 'FAILED'
+
+# prefixes, whose NetBox data is fetched at once via GraphQL
+PAGE_SIZE = 100
+
+logger = LogManager().logger
+
+
+def prefix_webhooks(fetch_data):
+    """
+    yield a webhook like dict for each prefix in NetBox, which should be reported to RIPE
+    """
+    for prefix in fetch_data.nb.ipam.prefixes.filter(cf_ripe_report=True):
+        yield {
+            'event': 'updated',
+            'model': 'prefix',
+            'username': 'ripeupdater sync',
+            'data': dict(prefix),
+        }
+
+
+def sync_prefix(webhook, fetch_data, backup):
+    """
+    create or update a single prefix in RIPE DB, if it differs from NetBox
+    """
+    netbox_object = ObjectBuilder(webhook, fetch_data)
+    try:
+        ripe = RipeObjectManager(netbox_object, backup)
+    except (NotRoutedNetwork, ErrorSmallPrefix) as err:
+        logger.info(f"skipping {webhook['data']['prefix']}: {err}")
+        return {'prefix': webhook['data']['prefix'], 'action': SKIPPED, 'error': str(err)}
+
+    return {'prefix': ripe.prefix, 'action': ripe.push_object()}
+
+
+def plan_prefix(webhook, fetch_data):
+    """
+    return the planned change of a single prefix, without writing anything
+    """
+    netbox_object = ObjectBuilder(webhook, fetch_data)
+    try:
+        ripe = RipeObjectManager(netbox_object, None)
+    except (NotRoutedNetwork, ErrorSmallPrefix) as err:
+        return {'prefix': webhook['data']['prefix'], 'action': SKIPPED, 'error': str(err)}
+
+    return ripe.plan_push()
+
+
+def run_all(func, workers=None):
+    """
+    call func(webhook, fetch_data) for all prefixes on a pool of worker threads and yield the results in order
+    """
+    workers = int(SYNC_WORKERS) if workers is None else workers
+    fetch_data = GraphqlFetchData() if NETBOX_GRAPHQL == 'yes' else PrefetchedData()
+
+    def run(webhook):
+        try:
+            return func(webhook, fetch_data)
+        except Exception as err:
+            logger.exception(f"sync of {webhook['data']['prefix']} failed: {err!r}")
+            return {'prefix': webhook['data']['prefix'], 'action': FAILED, 'error': repr(err)}
+
+    webhooks = prefix_webhooks(fetch_data)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while page := list(islice(webhooks, PAGE_SIZE)):
+            fetch_data.prefetch(page)
+            yield from executor.map(run, page)
+
+
+def sync(backup, workers=None):
+    """
+    sync all prefixes, returns the number of prefixes per action
+    """
+    results = Counter(result['action'] for result in
+                      run_all(lambda webhook, fetch_data: sync_prefix(webhook, fetch_data, backup), workers))
+
+    logger.info(f'sync finished: {dict(results)}')
+    return results
+
+
+def plan(workers=None):
+    """
+    yield the planned change of each prefix, without writing anything
+    """
+    yield from run_all(plan_prefix, workers)
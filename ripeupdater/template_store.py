@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+
+from .exceptions import ConfigError
+from .log_manager import LogManager
+from .configuration import *
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def is_example(name):
+    """
+    return True for example templates like templates.example.json, which are shipped, but never used
+    """
+    return name.endswith('.example.json')
+
+
+class TemplateStore:
+    """
+    Keeps all json templates of a directory in memory.
+    A background thread watches the modification times of the files and reloads and validates
+    the whole set, when a file has changed. An invalid set is rejected and the previous one is kept.
+    """
+    def __init__(self, directory, interval=None):
+        self.logger = LogManager().logger
+        self.directory = directory
+        self.interval = float(TEMPLATES_RELOAD_INTERVAL) if interval is None else interval
+        self.reloads = 0
+        self.loaded_at = None
+        # (files, mtimes, cache) is replaced at once, readers always see a complete set
+        self.snapshot = ({}, {}, {})
+
+        self.load()
+
+        if self.interval > 0:
+            thread = threading.Thread(target=self.watch, name='template-watcher', daemon=True)
+            thread.start()
+
+    def scan(self):
+        """
+        return modification times of all json files in the directory
+        """
+        mtimes = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json') and entry.is_file():
+                    mtimes[entry.name] = entry.stat().st_mtime_ns
+        return mtimes
+
+    def load(self):
+        """
+        read and validate all templates and replace the current set
+        """
+        try:
+            mtimes = self.scan()
+            files = {}
+            for name in mtimes:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    files[name] = json.load(f)
+        except (OSError, ValueError) as err:
+            msg = f'Could not read templates in {self.directory}: {err}'
+            self.logger.critical(msg)
+            raise ConfigError(msg)
+
+        errors = validate_templates(files)
+        if errors:
+            msg = f'Invalid templates in {self.directory}: ' + ', '.join(errors)
+            self.logger.critical(msg)
+            raise ConfigError(msg)
+
+        self.snapshot = (files, mtimes, {})
+        self.reloads += 1
+        self.loaded_at = time.time()
+        self.logger.info(f'loaded {len(files)} templates from {self.directory}')
+
+    def watch(self):
+        """
+        reload templates, whenever a file has been added, changed or removed
+        """
+        while True:
+            time.sleep(self.interval)
+            try:
+                if self.scan() != self.snapshot[1]:
+                    self.logger.info(f'templates in {self.directory} have changed, reloading')
+                    self.load()
+            except ConfigError:
+                self.logger.error('keeping previous templates')
+            except OSError as err:
+                self.logger.error(f'Could not watch templates in {self.directory}: {err}')
+
+    def file(self, name):
+        """
+        return the content of a template file
+        """
+        files = self.snapshot[0]
+        if name not in files:
+            msg = f'No template file {name} in {self.directory}'
+            self.logger.critical(msg)
+            raise ConfigError(msg)
+
+        return files[name]
+
+    def cached(self, key, factory):
+        """
+        return factory(files) computed once per loaded set of templates, e.g. a compiled template
+        """
+        files, mtimes, cache = self.snapshot
+        if key not in cache:
+            cache[key] = factory(files)
+
+        return cache[key]
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'files': len(self.snapshot[0]),
+            'reloads': self.reloads,
+            'loaded_at': self.loaded_at,
+        }
+
+
+def validate_templates(files):
+    """
+    check the structure of a set of templates and return a list of errors
+    example files may inherit base templates, which are not part of the set
+    """
+    errors = []
+
+    def valid_attributes(attributes):
+        return type(attributes) is list and all(type(a) is dict and a for a in attributes)
+
+    for name, content in files.items():
+        if type(content) is not dict:
+            errors.append(f'{name} must contain an object')
+            continue
+
+        if 'attributes' in content and not valid_attributes(content['attributes']):
+            errors.append(f'{name}: attributes must be a list of attribute objects')
+
+        templates = content.get('templates', {})
+        if type(templates) is not dict:
+            errors.append(f'{name}: templates must be an object')
+            continue
+
+        for template_name, template in templates.items():
+            if template_name == 'lir_org':
+                if type(template) is not dict or not all(type(org) is str for org in template.values()):
+                    errors.append(f'{name}: lir_org must map each lir to an organisation')
+                continue
+
+            if type(template) is not dict or not valid_attributes(template.get('attributes')):
+                errors.append(f'{name}: {template_name} must contain a list of attributes')
+                continue
+
+            inherit = template.get('inherit')
+            if inherit is not None:
+                if inherit not in files:
+                    if is_example(name):
+                        continue
+                    errors.append(f'{name}: {template_name} inherits missing file {inherit}')
+                elif not valid_attributes(files[inherit].get('attributes') if type(files[inherit]) is dict else None):
+                    errors.append(f'{name}: {template_name} inherits {inherit} without attributes')
+
+    return errors
+
+
+def get_template_store(directory):
+    """
+    return the store of a directory, shared by the whole process
+    """
+    key = os.path.realpath(directory)
+
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = TemplateStore(key)
+        return _stores[key]
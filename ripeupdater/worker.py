@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from .log_manager import LogManager
+from .netbox import ObjectBuilder, invalidate
+from .ripe import RipeObjectManager
+from .exceptions import (NotRoutedNetwork, ErrorSmallPrefix, ConfigError)
+from .configuration import *
+
+# Seconds an idle worker waits before looking into the queue again
+POLL_INTERVAL = 1
+
+logger = LogManager().logger
+
+
+def handle_webhook(webhook, backup, dry_run=False):
+    """
+    apply a validated NetBox prefix webhook to the RIPE DB
+    with dry_run set, nothing is written and the planned change is returned
+    """
+    ripe_report = webhook['data']['custom_fields']['ripe_report']
+    netbox_object = ObjectBuilder(webhook)
+    ripe = RipeObjectManager(netbox_object, backup)
+
+    # If ripe_report not selected or false then delete object from RIPE-DB
+    if ripe_report is not True:
+        logger.info(f"ripe_report is false, deleting prefix {webhook['data']['prefix']}")
+        delete = True
+
+    # If the incoming webhook updated or created, (not deleted) then push webhook to
+    # RIPE-DB
+    elif webhook['event'] != 'deleted':
+        logger.info(f"updating prefix {webhook['data']['prefix']}")
+        delete = False
+
+    # If the incoming webhook is selected as deleted then also delete if from
+    # RIPE-DB
+    else:
+        logger.info(f"prefix deleted in NetBox, deleting prefix {webhook['data']['prefix']} in RIPE DB")
+        delete = True
+
+    if dry_run:
+        return ripe.plan_delete() if delete else ripe.plan_push()
+
+    if delete:
+        ripe.delete_object()
+    else:
+        ripe.push_object()
+
+
+def handle_broadcast(webhook):
+    """
+    apply a webhook, which was broadcast to all processes
+    """
+    if webhook.get('model') in ['site', 'region', 'aggregate', 'prefix']:
+        invalidate(webhook)
+    else:
+        logger.warning(f"ignoring broadcast of unknown model {webhook.get('model')}")
+
+
+class WorkerPool:
+    """
+    threads draining the job queue
+    the threads also apply broadcasts to their process, without workers a single thread polls the broadcasts
+    """
+    def __init__(self, queue, backup, size=None):
+        self.queue = queue
+        self.backup = backup
+        self.size = int(QUEUE_WORKERS) if size is None else size
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.broadcast_lock = threading.Lock()
+        self.last_broadcast = None
+
+    def start(self):
+        """
+        start all worker threads
+        """
+        # broadcasts from before the start are already reflected in the empty caches of this process
+        self.last_broadcast = self.queue.last_broadcast()
+        logger.info(f'starting {self.size} queue workers')
+        for i in range(self.size):
+            thread = threading.Thread(target=self.run, name=f'queue-worker-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+        # the caches of a process without workers must be invalidated as well
+        if self.size == 0:
+            thread = threading.Thread(target=self.listen, name='queue-broadcasts', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """
+        let all workers finish their current job and stop
+        """
+        self.stopped.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def notify(self):
+        """
+        wake up idle workers, e.g. after a new job was queued
+        """
+        self.wakeup.set()
+
+    def run(self):
+        """
+        main loop of a worker thread
+        """
+        while not self.stopped.is_set():
+            self.receive_broadcasts()
+            if not self.run_once():
+                self.wakeup.wait(POLL_INTERVAL)
+                self.wakeup.clear()
+
+    def listen(self):
+        """
+        main loop of the broadcast thread of a pool without workers
+        """
+        while not self.stopped.is_set():
+            self.receive_broadcasts()
+            self.stopped.wait(POLL_INTERVAL)
+
+    def receive_broadcasts(self):
+        """
+        apply new broadcasts, only one thread of the pool does so at a time
+        """
+        if not self.broadcast_lock.acquire(blocking=False):
+            return
+
+        try:
+            if self.last_broadcast is None:
+                self.last_broadcast = self.queue.last_broadcast()
+            for broadcast_id, webhook in self.queue.broadcasts(self.last_broadcast):
+                self.last_broadcast = broadcast_id
+                try:
+                    handle_broadcast(webhook)
+                except Exception as err:
+                    logger.exception(f'broadcast {broadcast_id} failed: {err!r}')
+        except Exception as err:
+            logger.error(f'Could not receive broadcasts: {err!r}')
+        finally:
+            self.broadcast_lock.release()
+
+    def run_once(self):
+        """
+        process a single job, returns False if the queue was empty
+        """
+        job = self.queue.claim()
+        if job is None:
+            return False
+
+        job_id, webhook = job
+        logger.info(f"processing job {job_id} for {webhook['data']['prefix']}")
+        try:
+            handle_webhook(webhook, self.backup)
+        except NotRoutedNetwork:
+            logger.info(f'job {job_id}: NotRoutedNetwork, skipping request')
+        except ErrorSmallPrefix:
+            logger.info(f'job {job_id}: ErrorSmallPrefix, skipping request')
+        except Exception as err:
+            logger.exception(f'job {job_id} failed: {err!r}')
+            # a broken configuration needs a fix and a replay, not retries
+            self.queue.failed(job_id, repr(err), retry=not isinstance(err, ConfigError))
+            return True
+
+        self.queue.done(job_id)
+        return True
@@ -0,0 +1,19 @@
+import pytest
+
+from ripeupdater import netbox, netbox_client, ripe_client
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """
+    module level caches must not leak between tests
+    """
+    netbox.site_countries.clear()
+    netbox.region_parents.clear()
+    netbox.aggregate_index.tree = None
+    netbox.prefix_index.tree = None
+    # pynetbox.api is patched per test
+    netbox_client._client = None
+    # rate limits must not carry over
+    ripe_client._client = None
+    yield
@@ -0,0 +1,80 @@
+from ripeupdater.attribute_plan import compile_plan
+
+test_values = {"org": "ORG-TEST", "mnt": "TEST-MNT", "person": "TEST-PERSON"}
+master = [
+    {"org": ""},
+    {"descr": "Base"},
+    {"remarks": "Managed by ripeupdater"},
+    {"admin-c": "AA1-RIPE"},
+    {"mnt-by": "EXAMPLE-MNT"},
+    {"source": "RIPE"},
+]
+
+
+def render(plan):
+    return [(a["name"], a["value"]) for a in plan.render("inetnum", "198.51.100.0 - 198.51.100.255", netname="POOL",
+                                                         org="ORG-LIR", country="DE", status="ASSIGNED PA")]
+
+
+def test_order():
+    plan = compile_plan([{"descr": "Pool"}, {"remarks": "Template"}], master, "RIPE")
+
+    assert render(plan) == [
+        ("inetnum", "198.51.100.0 - 198.51.100.255"),
+        ("netname", "POOL"),
+        ("descr", "Pool"),
+        ("descr", "Base"),
+        ("org", "ORG-LIR"),
+        ("country", "DE"),
+        ("remarks", "Template"),
+        ("admin-c", "AA1-RIPE"),
+        ("mnt-by", "EXAMPLE-MNT"),
+        ("status", "ASSIGNED PA"),
+        ("source", "RIPE"),
+    ]
+
+
+def test_overrides():
+    plan = compile_plan([{"descr": "Pool"}, {"org": "ORG-TEMPLATE"}, {"country": "NL"}, {"status": "LEGACY"},
+                         {"admin-c": "BB1-RIPE"}], master, "RIPE")
+
+    assert render(plan) == [
+        ("inetnum", "198.51.100.0 - 198.51.100.255"),
+        ("netname", "POOL"),
+        ("descr", "Pool"),
+        ("descr", "Base"),
+        ("org", "ORG-TEMPLATE"),
+        ("country", "DE"),
+        ("country", "NL"),
+        ("admin-c", "BB1-RIPE"),
+        ("remarks", "Managed by ripeupdater"),
+        ("mnt-by", "EXAMPLE-MNT"),
+        ("status", "LEGACY"),
+        ("source", "RIPE"),
+    ]
+
+
+def test_empty_values():
+    plan = compile_plan([], [{"remarks": "Base"}], "RIPE")
+
+    assert [a["name"] for a in plan.render("inet6num", "2001:db8::/48", netname="POOL", org=None,
+                                           country=None, status="ASSIGNED")] == \
+        ["inet6num", "netname", "remarks", "status"]
+
+
+def test_test_database():
+    plan = compile_plan([{"descr": "Pool"}, {"status": "LEGACY"}], master, "TEST", test_values)
+
+    assert render(plan) == [
+        ("inetnum", "198.51.100.0 - 198.51.100.255"),
+        ("netname", "POOL"),
+        ("descr", "Pool"),
+        ("descr", "Base"),
+        ("org", "ORG-TEST"),
+        ("country", "DE"),
+        ("remarks", "Managed by ripeupdater"),
+        ("admin-c", "TEST-PERSON"),
+        ("mnt-by", "TEST-MNT"),
+        ("status", "ASSIGNED PA"),
+        ("source", "TEST"),
+    ]
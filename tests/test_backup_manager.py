@@ -0,0 +1,126 @@
+import gzip
+import json
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+from ripeupdater.backup_manager import BackupManager
+
+
+@patch("ripeupdater.backup_manager.S3_BACKUP", "yes")
+@patch("ripeupdater.backup_manager.boto3.client")
+def test_unchanged_backups_are_skipped(client, tmp_path):
+    backup = BackupManager(tmp_path / "backups.sqlite3")
+    s3 = client.return_value
+
+    key = backup.put("prefix_198.51.100.0_24.json", '{"a": 1}')
+    assert key.startswith("prefix_198.51.100.0_24/")
+    assert backup.put("prefix_198.51.100.0_24.json", '{"a": 1}') is None
+    assert backup.flush(5)
+    uploads = {call.kwargs["Key"]: call.kwargs["Body"] for call in s3.put_object.call_args_list}
+    assert uploads[key] == b'{"a": 1}'
+
+    # still unchanged after the upload and after a restart
+    restarted = BackupManager(tmp_path / "backups.sqlite3")
+    assert restarted.put("prefix_198.51.100.0_24.json", '{"a": 1}') is None
+    # only the first manager uploads the next version
+    restarted.stop()
+    assert backup.put("prefix_198.51.100.0_24.json", '{"a": 2}')
+    assert backup.flush(5)
+    assert len({call.kwargs["Key"] for call in s3.put_object.call_args_list} - {"manifest.json"}) == 2
+    assert backup.stats() == {"pending": 0, "uploaded": 2, "skipped": 1}
+
+
+@patch("ripeupdater.backup_manager.S3_BACKUP", "yes")
+@patch("ripeupdater.backup_manager.BACKUP_GZIP", "yes")
+@patch("ripeupdater.backup_manager.UPLOAD_RETRY_DELAY", 0)
+@patch("ripeupdater.backup_manager.boto3.client")
+def test_gzip_and_retry(client, tmp_path):
+    backup = BackupManager(tmp_path / "backups.sqlite3")
+    s3 = client.return_value
+    s3.put_object.side_effect = [RuntimeError("s3 down"), {}, {}]
+
+    key = backup.put("prefix_198.51.100.0_24.json", '{"a": 1}')
+    assert backup.flush(5)
+    assert [call.kwargs["Key"] for call in s3.put_object.call_args_list] == [key, key, "manifest.json"]
+    kwargs = s3.put_object.call_args_list[1].kwargs
+    assert kwargs["ContentEncoding"] == "gzip"
+    assert gzip.decompress(kwargs["Body"]) == b'{"a": 1}'
+
+    s3.get_object.return_value = {"Body": type("Body", (), {"read": lambda self: kwargs["Body"]})(),
+                                  "ContentEncoding": "gzip"}
+    assert backup.get("prefix_198.51.100.0_24.json") == b'{"a": 1}'
+
+
+@patch("ripeupdater.backup_manager.S3_BACKUP", "yes")
+@patch("ripeupdater.backup_manager.boto3.client")
+@patch("ripeupdater.backup_manager.time.time")
+def test_versions_and_manifest(now, client, tmp_path):
+    s3 = client.return_value
+    s3.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+    backup = BackupManager(tmp_path / "backups.sqlite3")
+
+    for timestamp, name, content in [(1000, "prefix_198.51.100.0_24.json", "1"),
+                                     (2000, "prefix_203.0.113.0_24.json", "2"),
+                                     (3000, "prefix_198.51.100.0_24.json", "3")]:
+        now.return_value = timestamp
+        backup.put(name, content)
+    assert backup.flush(5)
+
+    manifest = json.loads(s3.put_object.call_args.kwargs["Body"])
+    assert s3.put_object.call_args.kwargs["Key"] == "manifest.json"
+    assert [version for version, size, digest in manifest["objects"]["prefix_198.51.100.0_24.json"]] == \
+        ["19700101T001640.000000Z", "19700101T005000.000000Z"]
+    assert backup.versions("prefix_198.51.100.0_24.json", manifest)[0] == {
+        "key": "prefix_198.51.100.0_24/19700101T001640.000000Z.json",
+        "version": "19700101T001640.000000Z",
+        "size": 1,
+        "sha256": "6b86b273ff34fce19d6b804eff5a3f5747ada4eaa22f1d49c01e52ddb7875b4b",
+    }
+    assert backup.snapshot(manifest=manifest) == {
+        "prefix_198.51.100.0_24.json": "prefix_198.51.100.0_24/19700101T005000.000000Z.json",
+        "prefix_203.0.113.0_24.json": "prefix_203.0.113.0_24/19700101T003320.000000Z.json",
+    }
+    # versions hold the object before it was overwritten, so the next version was in effect
+    assert backup.snapshot(1500, manifest) == {
+        "prefix_198.51.100.0_24.json": "prefix_198.51.100.0_24/19700101T005000.000000Z.json",
+        "prefix_203.0.113.0_24.json": "prefix_203.0.113.0_24/19700101T003320.000000Z.json",
+    }
+    assert backup.snapshot(500) == {
+        "prefix_198.51.100.0_24.json": "prefix_198.51.100.0_24/19700101T001640.000000Z.json",
+        "prefix_203.0.113.0_24.json": "prefix_203.0.113.0_24/19700101T003320.000000Z.json",
+    }
+    # the current objects were in effect
+    assert backup.snapshot(2500) == {
+        "prefix_198.51.100.0_24.json": "prefix_198.51.100.0_24/19700101T005000.000000Z.json",
+    }
+    assert backup.snapshot(3000) == {}
+
+    # a lost index is restored from the manifest
+    s3.get_object.side_effect = None
+    s3.get_object.return_value = {"Body": type("Body", (), {"read": lambda self: json.dumps(manifest).encode()})()}
+    restored = BackupManager(tmp_path / "restored.sqlite3")
+    assert restored.manifest()["objects"] == manifest["objects"]
+
+
+@patch("ripeupdater.backup_manager.S3_BACKUP", "yes")
+@patch("ripeupdater.backup_manager.boto3.client")
+def test_list(client, tmp_path):
+    s3 = client.return_value
+    s3.get_paginator.return_value.paginate.return_value = [
+        {"Contents": [{"Key": "manifest.json"}, {"Key": "prefix_198.51.100.0_24.json"}]},
+        {"Contents": [{"Key": "prefix_198.51.100.0_25/20221231T235959.000000Z.json"},
+                      {"Key": "prefix_2001:db8::_48/20221231T235959.000000Z.json"}]},
+        {},
+    ]
+    backup = BackupManager(tmp_path / "backups.sqlite3")
+
+    assert len(backup.list()) == 4
+    assert backup.list("198.51.100.0/23") == [
+        "prefix_198.51.100.0_24.json",
+        "prefix_198.51.100.0_25/20221231T235959.000000Z.json",
+    ]
+    assert backup.list("198.51.100.128/25") == []
+    assert backup.list("2001:db8::/32") == ["prefix_2001:db8::_48/20221231T235959.000000Z.json"]
+    assert backup.list("prefix_198.51.100.0_24") == ["prefix_198.51.100.0_24.json"]
+    s3.get_paginator.return_value.paginate.assert_called_once_with(Bucket=None)
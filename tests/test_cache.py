@@ -0,0 +1,37 @@
+from unittest.mock import patch
+
+from ripeupdater.cache import TTLCache
+
+
+def test_get_set():
+    cache = TTLCache(60, 10)
+    cache.set("a", None)
+
+    assert cache.get("a", "missing") is None
+    assert cache.get("b", "missing") == "missing"
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+@patch("ripeupdater.cache.time.monotonic")
+def test_expiry(monotonic):
+    monotonic.return_value = 100
+    cache = TTLCache(60, 10)
+    cache.set("a", 1)
+
+    monotonic.return_value = 159
+    assert cache.get("a") == 1
+    monotonic.return_value = 161
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(60, 2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
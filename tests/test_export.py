@@ -0,0 +1,61 @@
+import io
+import json
+import tarfile
+from unittest.mock import Mock
+
+from ripeupdater.export import TAR, export, fetch, select_keys
+
+
+def backup_of(objects):
+    backup = Mock()
+
+    def get(key):
+        if objects[key] is None:
+            raise RuntimeError("not found")
+        return objects[key]
+
+    backup.get.side_effect = get
+    return backup
+
+
+objects = {
+    "prefix_198.51.100.0_24/20221231T235959.000000Z.json": b'{"a": 1}',
+    "prefix_203.0.113.0_24/20221231T235959.000000Z.json": b'{"b": 2}',
+    "prefix_192.0.2.0_24/20221231T235959.000000Z.json": None,
+}
+
+
+def test_fetch_keeps_order():
+    keys = [f"key{i}" for i in range(50)]
+    backup = backup_of({key: key.encode() for key in keys})
+
+    assert [body for key, body, error in fetch(backup, keys, workers=3)] == [key.encode() for key in keys]
+
+
+def test_export_ndjson():
+    lines = b"".join(export(backup_of(objects), list(objects))).decode().splitlines()
+
+    assert [json.loads(line) for line in lines] == [
+        {"key": "prefix_198.51.100.0_24/20221231T235959.000000Z.json", "object": {"a": 1}},
+        {"key": "prefix_203.0.113.0_24/20221231T235959.000000Z.json", "object": {"b": 2}},
+        {"key": "prefix_192.0.2.0_24/20221231T235959.000000Z.json", "error": "RuntimeError('not found')"},
+    ]
+
+
+def test_export_tar():
+    data = b"".join(export(backup_of(objects), list(objects), TAR, workers=2))
+
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+        assert archive.getnames() == list(objects)[:2]
+        assert archive.extractfile(list(objects)[1]).read() == b'{"b": 2}'
+
+
+def test_select_latest():
+    backup = Mock()
+    backup.snapshot.return_value = {
+        "prefix_203.0.113.0_24.json": "prefix_203.0.113.0_24/20221231T235959.000000Z.json",
+        "prefix_198.51.100.0_24.json": "prefix_198.51.100.0_24/20221231T235959.000000Z.json",
+    }
+
+    assert select_keys(backup, "198.51.100.0/23", latest=True) == ["prefix_198.51.100.0_24/20221231T235959.000000Z.json"]
+    assert select_keys(backup, latest=True) == sorted(backup.snapshot.return_value.values())
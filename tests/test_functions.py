@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from pytest import raises
 
 from ripeupdater.functions import *
@@ -62,5 +64,30 @@ def test_notify():
     notify(obj, "POST", "198.51.100.0/24", "testuser", 200, [])
 
 
+@patch("ripeupdater.functions.MAIL_REPORT", "yes")
+@patch("ripeupdater.functions.get_outbox")
+def test_notify_queues_mail(get_outbox):
+    get_outbox.return_value.host = ("ripeupdater.example.com", "192.0.2.1")
+    notify("", "DELETE", "198.51.100.0/24", "testuser", 500, ["error"])
+
+    msg = get_outbox.return_value.send.call_args.args[0]
+    assert msg["Subject"] == "DELETE 198.51.100.0/24 has failed"
+    assert "FQDN: ripeupdater.example.com" in msg.get_content()
+
+
 def test_find():
-    assert find("elem1.elem2", {"elem1": {"elem2": "foo"}}) == "foo"
\ No newline at end of file
+    assert find("elem1.elem2", {"elem1": {"elem2": "foo"}}) == "foo"
+
+def test_diff_ripe_attributes():
+    old = {"attributes": {"attribute": [{"name": "netname","value": "OLD"},{"name": "country","value": "DE"},{"name": "created","value": "2022-01-01T00:00:00Z"},{"name": "source","value": "RIPE"}]}}
+    new = {"objects": {"object": [{"attributes": {"attribute": [{"name": "netname","value": "NEW"},{"name": "country","value": " DE"},{"name": "remarks","value": "foo"}]}}]}}
+
+    changes = diff_ripe_attributes(old, new)
+    assert changes == [
+        {"op": "-", "name": "netname", "value": "OLD", "position": 0},
+        {"op": "+", "name": "netname", "value": "NEW", "position": 0},
+        {"op": "+", "name": "remarks", "value": "foo", "position": 2},
+    ]
+    assert format_changes(changes).splitlines()[0] == "- netname:\t\tOLD"
+    assert diff_ripe_attributes(new, new) == []
+    assert diff_ripe_attributes(None, new)[0] == {"op": "+", "name": "netname", "value": "NEW", "position": 0}
@@ -0,0 +1,27 @@
+import random
+
+from ripeupdater.interval_tree import IntervalTree
+
+
+def test_overlapping():
+    tree = IntervalTree([(0, 255, "a"), (10, 20, "b"), (30, 40, "c"), (256, 511, "d"), (15, 300, "e")])
+
+    assert [value for start, end, value in tree.overlapping(18, 32)] == ["a", "b", "e", "c"]
+    assert [value for start, end, value in tree.overlapping(256, 256)] == ["e", "d"]
+    assert tree.overlapping(512, 1000) == []
+    assert IntervalTree().overlapping(0, 1) == []
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(4)
+    intervals = []
+    for i in range(500):
+        start = rng.randrange(10000)
+        intervals.append((start, start + rng.randrange(500), i))
+    tree = IntervalTree(intervals)
+
+    for i in range(200):
+        first = rng.randrange(10500)
+        last = first + rng.randrange(100)
+        expected = {value for start, end, value in intervals if start <= last and end >= first}
+        assert {value for start, end, value in tree.overlapping(first, last)} == expected
@@ -0,0 +1,225 @@
+import time
+from unittest.mock import patch
+
+from ripeupdater.exceptions import ConfigError
+from ripeupdater.job_queue import JobQueue, DEAD, PENDING, RUNNING, retry_delay
+from ripeupdater.worker import WorkerPool
+
+webhook = {
+    "event": "updated",
+    "model": "prefix",
+    "data": {
+        "prefix": "2001:1234:4567::/64",
+        "custom_fields": {
+            "ripe_report": True,
+        }
+    },
+}
+
+
+@patch("ripeupdater.job_queue.COALESCE_WINDOW", 0)
+def test_put_claim_done(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    job_id = queue.put("2001:1234:4567::/64", webhook)
+
+    assert queue.claim() == (job_id, webhook)
+    assert queue.claim() is None
+    assert queue.stats() == {RUNNING: 1}
+
+    queue.done(job_id)
+    assert queue.stats() == {}
+
+
+@patch("ripeupdater.job_queue.COALESCE_WINDOW", 0)
+def test_jobs_survive_restart(tmp_path):
+    job_id = JobQueue(tmp_path / "queue.sqlite3").put("2001:1234:4567::/64", webhook)
+
+    assert JobQueue(tmp_path / "queue.sqlite3").claim() == (job_id, webhook)
+
+
+@patch("ripeupdater.job_queue.COALESCE_WINDOW", 0)
+def test_same_prefix_not_in_parallel(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    first = queue.put("2001:1234:4567::/64", webhook)
+    assert queue.claim()[0] == first
+
+    second = queue.put("2001:1234:4567::/64", webhook)
+    other = queue.put("198.51.100.0/24", webhook)
+    assert second != first
+    assert queue.claim()[0] == other
+    assert queue.claim() is None
+
+    queue.done(first)
+    assert queue.claim()[0] == second
+
+
+def test_coalesce(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    deleted = dict(webhook, event="deleted")
+    first = queue.put("2001:1234:4567::/64", webhook)
+    assert queue.put("2001:1234:4567::/64", webhook) == first
+    assert queue.put("2001:1234:4567::/64", deleted) == first
+
+    # held back during the window
+    assert queue.claim() is None
+
+    with patch("ripeupdater.job_queue.time.time", return_value=time.time() + 60):
+        assert queue.claim() == (first, deleted)
+
+
+@patch("ripeupdater.job_queue.COALESCE_WINDOW", 0)
+@patch("ripeupdater.job_queue.JOB_LEASE", -1)
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    job_id = queue.put("2001:1234:4567::/64", webhook)
+
+    assert queue.claim()[0] == job_id
+    assert queue.claim()[0] == job_id
+
+
+@patch("ripeupdater.job_queue.COALESCE_WINDOW", 0)
+@patch("ripeupdater.worker.handle_webhook")
+def test_worker(handle_webhook, tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    workers = WorkerPool(queue, None, size=1)
+
+    queue.put("2001:1234:4567::/64", webhook)
+    assert workers.run_once()
+    handle_webhook.assert_called_once_with(webhook, None)
+    assert queue.stats() == {}
+
+    handle_webhook.side_effect = RuntimeError("boom")
+    queue.put("2001:1234:4567::/64", webhook)
+    assert workers.run_once()
+    assert queue.stats() == {PENDING: 1}
+
+    # waiting for the retry
+    assert not workers.run_once()
+
+    handle_webhook.side_effect = ConfigError("RIPE_DB")
+    queue.put("198.51.100.0/24", webhook)
+    assert workers.run_once()
+    assert queue.stats() == {PENDING: 1, DEAD: 1}
+
+
+def test_retry_delay():
+    with patch("ripeupdater.job_queue.JOB_RETRY_DELAY", "30"):
+        assert 15 <= retry_delay(1) <= 30
+        assert 60 <= retry_delay(3) <= 120
+        assert 1800 <= retry_delay(20) <= 3600
+
+
+@patch("ripeupdater.job_queue.COALESCE_WINDOW", 0)
+@patch("ripeupdater.job_queue.JOB_RETRIES", "2")
+def test_retries_and_dead_letters(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    job_id = queue.put("2001:1234:4567::/64", webhook)
+    later = time.time() + 10000
+
+    for attempt in range(3):
+        with patch("ripeupdater.job_queue.time.time", return_value=later + attempt * 10000):
+            assert queue.claim()[0] == job_id
+        queue.failed(job_id, "RipeDBError('503')")
+        assert queue.claim() is None
+
+    assert queue.stats() == {DEAD: 1}
+    [letter] = queue.dead_letters()
+    assert letter["id"] == job_id
+    assert letter["attempts"] == 3
+    assert letter["webhook"] == webhook
+    assert letter["error"] == "RipeDBError('503')"
+
+    assert queue.replay() == [job_id + 1]
+    assert queue.dead_letters() == []
+    assert queue.claim() == (job_id + 1, webhook)
+
+
+@patch("ripeupdater.job_queue.COALESCE_WINDOW", 0)
+def test_replay_batch(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    for prefix in ["198.51.100.0/24", "203.0.113.0/24", "192.0.2.0/24"]:
+        queue.put(prefix, webhook)
+        queue.failed(queue.claim()[0], "boom", retry=False)
+    ids = [letter["id"] for letter in queue.dead_letters()]
+
+    # a queued job is newer than the dead letter of its prefix
+    queue.put("203.0.113.0/24", dict(webhook, event="deleted"))
+    assert [letter["key"] for letter in queue.dead_letters()] == ["198.51.100.0/24", "192.0.2.0/24"]
+
+    assert len(queue.replay([ids[0]])) == 1
+    assert [letter["key"] for letter in queue.dead_letters()] == ["192.0.2.0/24"]
+
+
+@patch("ripeupdater.job_queue.COALESCE_WINDOW", 0)
+def test_failed_job_superseded_by_newer_job(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    deleted = dict(webhook, event="deleted")
+    old = queue.put("2001:1234:4567::/64", webhook)
+    assert queue.claim()[0] == old
+    new = queue.put("2001:1234:4567::/64", deleted)
+
+    # the older state must not be applied after the newer one
+    queue.failed(old, "RipeDBError('503')")
+    assert queue.claim() == (new, deleted)
+    assert queue.claim() is None
+
+    queue.put("198.51.100.0/24", webhook)
+    old = queue.claim()[0]
+    queue.put("198.51.100.0/24", deleted)
+    queue.failed(old, "boom", retry=False)
+    assert queue.dead_letters() == []
+    assert queue.stats() == {PENDING: 1, RUNNING: 1}
+
+
+def test_failed_jobs_of_old_versions_become_dead_letters(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    job_id = queue.put("2001:1234:4567::/64", webhook)
+    with queue.connect() as db:
+        db.execute("UPDATE jobs SET status = 'failed', error = 'boom' WHERE id = ?", (job_id,))
+
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    assert queue.stats() == {DEAD: 1}
+    assert queue.dead_letters()[0]["error"] == "boom"
+
+
+@patch("ripeupdater.worker.invalidate")
+def test_broadcast(invalidate, tmp_path):
+    site = {"event": "updated", "model": "site", "data": {"slug": "myslug"}}
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    old = queue.broadcast(site)
+
+    # every process applies the broadcasts after its start
+    first = WorkerPool(JobQueue(tmp_path / "queue.sqlite3"), None, size=0)
+    second = WorkerPool(JobQueue(tmp_path / "queue.sqlite3"), None, size=0)
+    first.start()
+    second.start()
+    # received by hand below
+    first.stop()
+    second.stop()
+    assert first.last_broadcast == old
+
+    new = queue.broadcast(site)
+    assert queue.broadcasts(old) == [(new, site)]
+
+    first.receive_broadcasts()
+    second.receive_broadcasts()
+    first.receive_broadcasts()
+    assert invalidate.call_count == 2
+    assert second.last_broadcast == new
+
+
+@patch("ripeupdater.worker.POLL_INTERVAL", 0.01)
+@patch("ripeupdater.worker.invalidate")
+def test_broadcast_without_workers(invalidate, tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    workers = WorkerPool(queue, None, size=0)
+    workers.start()
+    assert [thread.name for thread in workers.threads] == ["queue-broadcasts"]
+
+    queue.broadcast({"event": "updated", "model": "site", "data": {"slug": "myslug"}})
+    for i in range(200):
+        if invalidate.called:
+            break
+        time.sleep(0.01)
+    workers.stop()
+    invalidate.assert_called_once()
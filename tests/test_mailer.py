@@ -0,0 +1,83 @@
+import smtplib
+from email.message import EmailMessage
+from unittest.mock import patch, Mock
+
+from ripeupdater.functions import notify
+from ripeupdater.mailer import Digest, Outbox
+
+
+def message(subject):
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg.set_content("text")
+    return msg
+
+
+@patch("ripeupdater.mailer.smtplib.SMTP")
+def test_mails_share_a_connection(smtp):
+    outbox = Outbox(size=10, retries=0, host=("ripeupdater.example.com", "192.0.2.1"))
+    assert outbox.host == ("ripeupdater.example.com", "192.0.2.1")
+    outbox.send(message("first"))
+    outbox.send(message("second"))
+
+    assert outbox.flush(5)
+    smtp.assert_called_once()
+    assert smtp.return_value.send_message.call_count == 2
+    assert outbox.stats() == {"queued": 0, "sent": 2, "dropped": 0}
+
+
+@patch("ripeupdater.mailer.RETRY_DELAY", 0)
+@patch("ripeupdater.mailer.smtplib.SMTP")
+def test_reconnect_and_drop(smtp):
+    outbox = Outbox(size=10, retries=1)
+    smtp.return_value.send_message.side_effect = [smtplib.SMTPServerDisconnected(), None]
+    outbox.send(message("retried"))
+    assert outbox.flush(5)
+    assert smtp.call_count == 2
+    assert outbox.stats()["sent"] == 1
+
+    smtp.side_effect = ConnectionRefusedError()
+    outbox.send(message("dropped"))
+    assert outbox.flush(5)
+    assert outbox.stats() == {"queued": 0, "sent": 1, "dropped": 1}
+
+
+def test_digest():
+    outbox = Mock(host=("ripeupdater.example.com", "192.0.2.1"))
+    digest = Digest(interval=3600, outbox=outbox)
+    digest.send()
+    outbox.send.assert_not_called()
+
+    for prefix in ["198.51.100.0/24", "203.0.113.0/24"]:
+        digest.add({"action": "PUT", "status": "succeeded", "prefix": prefix, "template": "CLOUD-POOL",
+                    "username": "testuser", "response_code": 200, "errors": "", "object": "+ netname:\t\tNEW\n"})
+    digest.add({"action": "DELETE", "status": "failed", "prefix": "192.0.2.0/24", "template": None,
+                "username": "testuser", "response_code": 400, "errors": "Error: not found", "object": ""})
+    digest.send()
+    digest.send()
+
+    outbox.send.assert_called_once()
+    msg = outbox.send.call_args.args[0]
+    assert msg["Subject"] == "RIPE digest: 3 operations, 1 failed"
+    body, attachment = [part.get_content() for part in msg.iter_parts()]
+    assert "    2  PUT     succeeded  CLOUD-POOL" in body
+    assert "    1  DELETE  failed     -" in body
+    assert "192.0.2.0/24: Error: not found" in body
+    assert "RIPE-Service source IP: 192.0.2.1" in body
+    assert "### PUT 203.0.113.0/24 succeeded\n+ netname:\t\tNEW\n" in attachment
+
+
+@patch("ripeupdater.functions.MAIL_REPORT", "yes")
+@patch("ripeupdater.functions.MAIL_DIGEST_INTERVAL", "60")
+@patch("ripeupdater.functions.get_outbox")
+@patch("ripeupdater.functions.get_digest")
+def test_notify_digest(get_digest, get_outbox):
+    get_outbox.return_value.host = ("ripeupdater.example.com", "192.0.2.1")
+    notify("", "PUT", "198.51.100.0/24", "testuser", 200, [], "CLOUD-POOL")
+    assert get_digest.return_value.add.call_args.args[0]["template"] == "CLOUD-POOL"
+    get_outbox.return_value.send.assert_not_called()
+
+    # failures are sent immediately
+    notify("", "PUT", "198.51.100.0/24", "testuser", 400, ["error"], "CLOUD-POOL")
+    get_outbox.return_value.send.assert_called_once()
+    assert get_digest.return_value.add.call_count == 1
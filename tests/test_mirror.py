@@ -0,0 +1,144 @@
+import contextlib
+import gzip
+
+import pytest
+
+from ripeupdater.exceptions import ConfigError
+from ripeupdater.mirror import NOT_LOADED, RipeMirror, parse_rpsl, without_dummies
+
+DUMP = """#
+# The contents of this data file are subject to the RIPE Database Terms and Conditions
+#
+
+inetnum:        198.51.100.0 - 198.51.100.255
+netname:        EXAMPLE-NET
+descr:          first line
+                second line
+country:        DE # Germany
+mnt-by:         EXAMPLE-MNT
+source:         RIPE
+
+inetnum:        203.0.113.0 - 203.0.113.255
+netname:        OTHER-NET
+mnt-by:         OTHER-MNT
+source:         RIPE
+
+inetnum:        192.0.2.0 - 192.0.2.127
+netname:        SMALL-NET
+admin-c:        DUMY-RIPE
+mnt-by:         other-mnt
+mnt-by:         example-mnt
+source:         RIPE
+remarks:        ****************************
+remarks:        * THIS OBJECT IS MODIFIED
+remarks:        ****************************
+"""
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / "ripe.db.inetnum.gz"
+    with gzip.open(path, "wt") as dump_file:
+        dump_file.write(DUMP)
+    return str(path)
+
+
+def test_parse_rpsl():
+    objects = list(parse_rpsl(DUMP.splitlines(keepends=True)))
+
+    assert len(objects) == 3
+    assert objects[0][2] == ("descr", "first line second line", None)
+    assert objects[0][3] == ("country", "DE", "Germany")
+
+
+def test_load_and_get(dump, tmp_path):
+    mirror = RipeMirror(str(tmp_path / "mirror.sqlite3"))
+    assert mirror.get("inetnum", "198.51.100.0/24") is NOT_LOADED
+
+    assert mirror.load("inetnum", dump, ["EXAMPLE-MNT"]) == 2
+    obj = mirror.get("inetnum", "198.51.100.0/24")
+    assert obj["objects"]["object"][0]["attributes"]["attribute"][1] == {"name": "netname", "value": "EXAMPLE-NET"}
+    small = mirror.get("inetnum", "192.0.2.0 - 192.0.2.127")
+    # remarks about replaced personal data are dropped
+    assert small["objects"]["object"][0]["attributes"]["attribute"][-1] == {"name": "source", "value": "RIPE"}
+    # objects of other maintainers are not kept
+    assert mirror.get("inetnum", "203.0.113.0/24") is None
+    assert [pkey for pkey, obj in mirror.objects("inetnum")] == ["192.0.2.0 - 192.0.2.127",
+                                                                 "198.51.100.0 - 198.51.100.255"]
+    assert mirror.stats()["inetnum"]["objects"] == 2
+
+    # a reload replaces all objects
+    assert mirror.load("inetnum", dump, ["OTHER-MNT"]) == 2
+    assert mirror.get("inetnum", "198.51.100.0/24") is None
+
+
+def test_store_and_remove(dump, tmp_path):
+    mirror = RipeMirror(str(tmp_path / "mirror.sqlite3"))
+    mirror.load("inetnum", dump, ["EXAMPLE-MNT"])
+
+    mirror.store({"attributes": {"attribute": [{"name": "inetnum", "value": "203.0.113.0 - 203.0.113.255"},
+                                               {"name": "netname", "value": "NEW-NET"}]}})
+    assert mirror.get("inetnum", "203.0.113.0/24") is not None
+
+    mirror.remove("inetnum", "198.51.100.0/24")
+    assert mirror.get("inetnum", "198.51.100.0/24") is None
+
+
+def test_outdated_mirror_is_not_used(dump, tmp_path):
+    mirror = RipeMirror(str(tmp_path / "mirror.sqlite3"), max_age=60)
+    mirror.load("inetnum", dump, ["EXAMPLE-MNT"])
+    assert mirror.fresh("inetnum")
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("ripeupdater.mirror.time.time", lambda: 10 ** 12)
+        assert mirror.get("inetnum", "198.51.100.0/24") is NOT_LOADED
+
+
+def test_load_needs_maintainer(dump, tmp_path):
+    with pytest.raises(ConfigError):
+        RipeMirror(str(tmp_path / "mirror.sqlite3")).load("inetnum", dump, [])
+
+
+def test_load_does_not_block_writers(dump, tmp_path):
+    mirror = RipeMirror(str(tmp_path / "mirror.sqlite3"))
+    other = RipeMirror(str(tmp_path / "mirror.sqlite3"))
+    lines = DUMP.splitlines(keepends=True)
+
+    def slow_dump(source):
+        # another process writes, while the dump is downloaded
+        def read():
+            yield from lines[:8]
+            with other.connect() as db:
+                db.execute("PRAGMA busy_timeout = 0")
+                db.execute("INSERT INTO loads (objecttype, source, loaded, objects) VALUES ('inet6num', 'x', 0, 0)")
+            yield from lines[8:]
+        return contextlib.nullcontext(read())
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("ripeupdater.mirror.open_dump", slow_dump)
+        assert mirror.load("inetnum", dump, ["EXAMPLE-MNT"]) == 2
+    assert mirror.get("inetnum", "198.51.100.0/24") is not None
+    # a failed load keeps the previous objects
+    with pytest.raises(FileNotFoundError):
+        mirror.load("inetnum", str(tmp_path / "missing.gz"), ["OTHER-MNT"])
+    assert mirror.get("inetnum", "198.51.100.0/24") is not None
+
+
+def test_without_dummies():
+    mirrored = {"objects": {"object": [{"attributes": {"attribute": [
+        {"name": "inetnum", "value": "192.0.2.0 - 192.0.2.127"},
+        {"name": "admin-c", "value": "DUMY-RIPE"},
+        {"name": "netname", "value": "SMALL-NET"},
+    ]}}]}}
+    generated = {"attributes": {"attribute": [
+        {"name": "inetnum", "value": "192.0.2.0 - 192.0.2.127"},
+        {"name": "admin-c", "value": "EXAMPLE1-RIPE"},
+        {"name": "netname", "value": "SMALL-NET"},
+    ]}}
+
+    old, new = without_dummies(mirrored, generated)
+    assert old == new == {"attributes": {"attribute": [{"name": "inetnum", "value": "192.0.2.0 - 192.0.2.127"},
+                                                       {"name": "netname", "value": "SMALL-NET"}]}}
+    assert without_dummies(generated, None) == (generated, None)
+    # planned creates have no old object
+    assert without_dummies(None, generated) == (None, generated)
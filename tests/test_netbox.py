@@ -1,8 +1,11 @@
 import os
 
+from types import SimpleNamespace
 from unittest.mock import patch, Mock
 
-from ripeupdater.netbox import ObjectBuilder
+import requests_mock
+
+from ripeupdater.netbox import FetchData, GraphqlFetchData, ObjectBuilder, PrefetchedData, invalidate
 
 _dir_path = os.path.dirname(os.path.realpath(__file__))
 
@@ -42,4 +45,154 @@ def test_country(netbox_api):
     }
     netbox_api.return_value.dcim.regions.get.return_value = Mock(slug="germany")
     netbox_object = ObjectBuilder(webhook)
-    assert netbox_object.country() == "DE"
\ No newline at end of file
+    assert netbox_object.country() == "DE"
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+def test_prefetched_data(netbox_api):
+    nb = netbox_api.return_value
+    nb.dcim.regions.all.return_value = [
+        SimpleNamespace(slug="germany", parent=None),
+        SimpleNamespace(slug="berlin", parent=SimpleNamespace(slug="germany")),
+    ]
+    nb.dcim.sites.all.return_value = [Mock(slug="myslug", region=Mock(slug="berlin"))]
+    nb.ipam.aggregates.all.return_value = [
+        Mock(prefix="2001:1234::/32", custom_fields={"lir": "nl.examplelir2"}),
+        Mock(prefix="2001:1234:4567::/48", custom_fields={"lir": {"label": "DE.EXAMPLELIR1"}}),
+    ]
+    fetch_data = PrefetchedData()
+    netbox_object = ObjectBuilder({"data": {"prefix": "2001:1234:4567::/64", "site": {"slug": "myslug"}}}, fetch_data)
+
+    assert netbox_object.country() == "DE"
+    assert netbox_object.org() == "ORG-EIPB1-TEST"
+    assert fetch_data.org("2001:1234:1::/64") == "ORG-TT1-TEST"
+    nb.ipam.aggregates.get.assert_not_called()
+    nb.dcim.regions.get.assert_not_called()
+
+
+@patch("pynetbox.api")
+def test_country_is_cached(netbox_api):
+    nb = netbox_api.return_value
+    nb.dcim.sites.get.return_value = Mock(region=Mock(slug="berlin"))
+    nb.dcim.regions.get.side_effect = lambda slug: {
+        "berlin": SimpleNamespace(slug="berlin", parent=SimpleNamespace(slug="germany")),
+        "germany": SimpleNamespace(slug="germany", parent=None),
+    }[slug]
+    fetch_data = FetchData()
+
+    assert fetch_data.country("myslug") == "DE"
+    assert fetch_data.country("myslug") == "DE"
+    nb.dcim.sites.get.assert_called_once_with(slug="myslug")
+    nb.dcim.regions.get.assert_called_once_with(slug="berlin")
+
+    # the region tree stays cached, when a site changes
+    invalidate({"model": "site", "data": {"slug": "myslug"}})
+    assert fetch_data.country("myslug") == "DE"
+    assert nb.dcim.sites.get.call_count == 2
+    assert nb.dcim.regions.get.call_count == 2
+
+    invalidate({"model": "region", "data": {"slug": "germany"}})
+    assert fetch_data.country("myslug") == "DE"
+    assert nb.dcim.regions.get.call_count == 3
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+def test_org_from_aggregate_index(netbox_api):
+    nb = netbox_api.return_value
+    nb.ipam.aggregates.all.return_value = [Mock(prefix="2001:1234::/32", custom_fields={"lir": "nl.examplelir2"})]
+    nb.ipam.aggregates.get.return_value = Mock(custom_fields={"lir": "de.examplelir1"})
+    fetch_data = FetchData()
+
+    assert fetch_data.org("2001:1234:4567::/64") == "ORG-TT1-TEST"
+    assert fetch_data.org("2001:1234:1::/64") == "ORG-TT1-TEST"
+    nb.ipam.aggregates.all.assert_called_once()
+    nb.ipam.aggregates.get.assert_not_called()
+
+    # prefixes outside of the index are looked up in NetBox
+    assert fetch_data.org("2001:5678::/64") == "ORG-EIPB1-TEST"
+    nb.ipam.aggregates.get.assert_called_once_with(q="2001:5678::/64")
+
+    nb.ipam.aggregates.all.return_value.append(
+        Mock(prefix="2001:1234:4567::/48", custom_fields={"lir": "de.examplelir1"}))
+    invalidate({"model": "aggregate", "data": {"prefix": "2001:1234:4567::/48"}})
+    assert fetch_data.org("2001:1234:4567::/64") == "ORG-EIPB1-TEST"
+    assert nb.ipam.aggregates.all.call_count == 2
+
+
+@patch("pynetbox.api")
+def test_prefix_index(netbox_api):
+    nb = netbox_api.return_value
+    nb.ipam.prefixes.all.return_value = [
+        Mock(id=1, prefix="2001:1234:4567::/48"),
+        Mock(id=2, prefix="2001:1234:4567::/64"),
+        Mock(id=3, prefix="2001:1234:4567::/64"),
+    ]
+    nb.ipam.aggregates.all.return_value = [Mock(prefix="2001:1234::/32", custom_fields={})]
+    fetch_data = FetchData()
+
+    assert not fetch_data.authorize_delete_overlapped_candidate("2001:1234:4567::/48")
+    assert not fetch_data.authorize_delete_overlapped_candidate("2001:1234::/32")
+    assert fetch_data.authorize_delete_overlapped_candidate("2001:1234:4500::/40")
+    assert fetch_data.related_prefixes("2001:1234:4567::/56") == ["2001:1234:4567::/48", "2001:1234:4567::/64"]
+    nb.ipam.prefixes.get.assert_not_called()
+    nb.ipam.aggregates.get.assert_not_called()
+
+    # a prefix moved in one VRF is still present in the other
+    invalidate({"event": "updated", "model": "prefix", "data": {"id": 2, "prefix": "2001:1234:4568::/64"},
+                "snapshots": {"prechange": {"prefix": "2001:1234:4567::/64"}}})
+    assert fetch_data.related_prefixes("2001:1234:4567::/56") == ["2001:1234:4567::/48", "2001:1234:4567::/64"]
+    assert fetch_data.related_prefixes("2001:1234:4568::/48") == ["2001:1234:4568::/64"]
+
+    invalidate({"event": "deleted", "model": "prefix", "data": {"id": 1, "prefix": "2001:1234:4567::/48"}})
+    assert fetch_data.authorize_delete_overlapped_candidate("2001:1234:4567::/48")
+    nb.ipam.prefixes.all.assert_called_once()
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.netbox.GRAPHQL_REGION_DEPTH", 1)
+@patch("ripeupdater.netbox_client.NETBOX_URL", "https://netbox.example.com")
+def test_graphql_prefetch(netbox_api):
+    nb = netbox_api.return_value
+    nb.dcim.regions.get.return_value = SimpleNamespace(slug="europe", parent=None)
+    webhooks = [
+        {"data": {"prefix": "2001:1234:4567::/64", "site": {"slug": "myslug"}}},
+        {"data": {"prefix": "2001:1234:4568::/64", "site": {"slug": "other"}}},
+    ]
+    data = {
+        "sites": [
+            {"slug": "myslug", "region": {"slug": "berlin", "parent": {"slug": "germany"}}},
+            {"slug": "other", "region": None},
+        ],
+        "aggregate0": [{"prefix": "2001:1234::/32", "custom_fields": {"lir": "nl.examplelir2"}},
+                       {"prefix": "2001:1234:4567::/48", "custom_fields": {"lir": "de.examplelir1"}}],
+        "aggregate1": [{"prefix": "2001:1234::/32", "custom_fields": {"lir": "nl.examplelir2"}}],
+    }
+
+    with requests_mock.Mocker() as m:
+        m.post("https://netbox.example.com/graphql/", json={"data": data})
+        fetch_data = GraphqlFetchData()
+        fetch_data.prefetch(webhooks)
+
+        assert m.call_count == 1
+        query = m.last_request.json()["query"]
+        assert 'site_list(slug: ["myslug", "other"]) { slug region { slug parent { slug } } }' in query
+        assert 'aggregate1: aggregate_list(q: "2001:1234:4568::/64")' in query
+
+        # the ancestry of germany is deeper than the fetched regions
+        assert ObjectBuilder(webhooks[0], fetch_data).country() == "DE"
+        nb.dcim.regions.get.assert_not_called()
+        assert fetch_data.country("other") is None
+        assert fetch_data.org("2001:1234:4567::/64") == "ORG-EIPB1-TEST"
+        assert fetch_data.org("2001:1234:4568::/64") == "ORG-TT1-TEST"
+        nb.dcim.sites.get.assert_not_called()
+        nb.ipam.aggregates.get.assert_not_called()
+        assert m.call_count == 1
+
+        # errors of GraphQL fall back to REST
+        m.post("https://netbox.example.com/graphql/", json={"errors": [{"message": "boom"}]})
+        nb.dcim.sites.get.return_value = Mock(region=Mock(slug="europe"))
+        fetch_data.prefetch([{"data": {"prefix": "2001:1234:4567::/64", "site": {"slug": "third"}}}])
+        assert fetch_data.country("third") is None
+        nb.dcim.sites.get.assert_called_once_with(slug="third")
@@ -0,0 +1,37 @@
+from unittest.mock import patch
+
+import pynetbox
+import requests_mock
+from pytest import raises
+
+from ripeupdater.netbox_client import NetboxClient, TimeoutHTTPAdapter
+
+
+@patch("ripeupdater.netbox_client.NETBOX_URL", "https://netbox.example.com")
+def test_requests_are_counted():
+    client = NetboxClient(pool_size=2, timeout=5)
+
+    with requests_mock.Mocker() as m:
+        m.get("https://netbox.example.com/api/dcim/sites/12/", json={"id": 12, "slug": "myslug"})
+        m.get("https://netbox.example.com/api/dcim/sites/13/", json={"id": 13, "slug": "other"})
+        m.get("https://netbox.example.com/api/dcim/regions/1/", status_code=500)
+
+        assert client.api.dcim.sites.get(12).slug == "myslug"
+        assert client.api.dcim.sites.get(13).slug == "other"
+        with raises(pynetbox.RequestError):
+            client.api.dcim.regions.get(1)
+
+    stats = client.stats()
+    assert stats["pool_size"] == 2
+    assert stats["requests"] == {"GET /api/dcim/sites/<id>/": 2, "GET /api/dcim/regions/<id>/": 1}
+    assert stats["errors"] == {"GET /api/dcim/regions/<id>/": 1}
+
+
+@patch("requests.adapters.HTTPAdapter.send")
+def test_default_timeout(send):
+    adapter = TimeoutHTTPAdapter(5)
+
+    adapter.send(None)
+    assert send.call_args.kwargs["timeout"] == 5
+    adapter.send(None, timeout=1)
+    assert send.call_args.kwargs["timeout"] == 1
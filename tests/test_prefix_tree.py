@@ -0,0 +1,47 @@
+from ripeupdater.prefix_tree import PrefixTree
+
+
+def test_longest_prefix_match():
+    tree = PrefixTree()
+    tree.insert("2001:1234::/32", "a")
+    tree.insert("2001:1234:4567::/48", "b")
+    tree.insert("192.0.2.0/24", "c")
+
+    assert len(tree) == 3
+    assert tree.lookup("2001:1234:4567::/64")[1] == "b"
+    assert tree.lookup("2001:1234:4567::/48")[1] == "b"
+    assert tree.lookup("2001:1234:1::/64")[1] == "a"
+    assert str(tree.lookup("192.0.2.128/25")[0]) == "192.0.2.0/24"
+    assert tree.lookup("2001:1235::/48") is None
+    assert tree.lookup("198.51.100.0/24") is None
+
+
+def test_replace_and_default_route():
+    tree = PrefixTree()
+    tree.insert("0.0.0.0/0", "default")
+    tree.insert("10.0.0.0/8", "a")
+    tree.insert("10.0.0.0/8", "b")
+
+    assert len(tree) == 2
+    assert tree.lookup("10.1.0.0/16")[1] == "b"
+    assert tree.lookup("11.0.0.0/8")[1] == "default"
+    assert tree.lookup("2001:db8::/32") is None
+
+
+def test_covering_inside_remove():
+    tree = PrefixTree()
+    for prefix in ["2001:1234::/32", "2001:1234:4567::/48", "2001:1234:4567::/64", "2001:1234:4567:1::/64"]:
+        tree.insert(prefix, prefix)
+
+    assert [value for network, value in tree.covering("2001:1234:4567::/64")] == \
+        ["2001:1234::/32", "2001:1234:4567::/48", "2001:1234:4567::/64"]
+    assert [value for network, value in tree.inside("2001:1234:4567::/48")] == \
+        ["2001:1234:4567::/48", "2001:1234:4567::/64", "2001:1234:4567:1::/64"]
+    assert tree.get("2001:1234:4567::/48") == "2001:1234:4567::/48"
+    assert tree.get("2001:1234:4567::/56") is None
+
+    tree.remove("2001:1234:4567::/48")
+    assert len(tree) == 3
+    assert tree.get("2001:1234:4567::/48") is None
+    assert tree.lookup("2001:1234:4567::/56")[1] == "2001:1234::/32"
+    assert len(tree.inside("2001:1234:4567::/48")) == 2
@@ -0,0 +1,71 @@
+from unittest.mock import patch
+
+from ripeupdater.rate_limit import AdaptiveConcurrency, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@patch("ripeupdater.rate_limit.time", new_callable=Clock)
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=2, burst=2)
+
+    # the burst is sent at once, then one request every 0.5 seconds
+    assert [bucket.acquire() for i in range(4)] == [0, 0, 0.5, 0.5]
+    assert clock.now == 1001.0
+
+    clock.now += 10
+    assert bucket.acquire() == 0
+
+
+@patch("ripeupdater.rate_limit.time", new_callable=Clock)
+def test_token_bucket_pause(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.pause(30)
+
+    assert bucket.acquire() == 30
+    assert bucket.acquire() == 0.1
+
+    unlimited = TokenBucket(rate=0)
+    assert unlimited.acquire() == 0
+    unlimited.pause(5)
+    assert unlimited.acquire() == 5
+    assert unlimited.acquire() == 0
+
+
+@patch("ripeupdater.rate_limit.time", new_callable=Clock)
+def test_adaptive_concurrency(clock):
+    concurrency = AdaptiveConcurrency(maximum=8, latency_target=2)
+
+    concurrency.feedback(0.5, overloaded=True)
+    assert concurrency.limit == 4
+    # requests sent before the decrease don't decrease again
+    concurrency.feedback(3)
+    assert concurrency.limit == 4
+
+    clock.now += 10
+    concurrency.feedback(3)
+    assert concurrency.limit == 2
+
+    for i in range(10):
+        concurrency.feedback(0.5)
+    assert 4 < concurrency.limit < 5
+    assert concurrency.decreases == 2
+
+
+def test_slot_limits_requests_in_flight():
+    concurrency = AdaptiveConcurrency(maximum=2, latency_target=2)
+
+    with concurrency.slot(), concurrency.slot():
+        assert concurrency.in_flight == 2
+        concurrency.feedback(0, overloaded=True)
+        assert int(concurrency.limit) == 1
+    assert concurrency.in_flight == 0
@@ -0,0 +1,143 @@
+import json
+from unittest.mock import patch, Mock
+
+import pytest
+import requests
+import requests_mock
+
+from ripeupdater.backup_manager import BackupManager
+from ripeupdater.exceptions import BadRequest, RipeDBError
+from ripeupdater.restore import RestoreJournal, parse_time, restore_object, run_restore, select_backups
+from ripeupdater.ripe import CREATE, UPDATE, UNCHANGED
+
+URL = "https://rest-test.db.ripe.net/test/inetnum"
+KEY = "prefix_62.157.100.0_24/20221231T235959.000000Z.json"
+
+
+def ripe_object(netname):
+    return {"objects": {"object": [{"attributes": {"attribute": [
+        {"name": "inetnum", "value": "62.157.100.0 - 62.157.100.255"},
+        {"name": "netname", "value": netname},
+        {"name": "created", "value": "2022-01-01T00:00:00Z"},
+        {"name": "source", "value": "TEST"},
+    ]}}]}}
+
+
+def backup_of(stored):
+    backup = Mock()
+    backup.get.return_value = json.dumps(stored).encode()
+    return backup
+
+
+def test_parse_time():
+    assert parse_time("1672531199") == 1672531199.0
+    assert parse_time("2022-12-31T23:59:59Z") == 1672531199.0
+    assert parse_time("2022-12-31T23:59:59") == 1672531199.0
+    with pytest.raises(BadRequest):
+        parse_time("yesterday")
+
+
+def test_select_backups():
+    backup = Mock()
+    backup.snapshot.return_value = {
+        "prefix_62.157.100.0_24.json": KEY,
+        "prefix_203.0.113.0_24.json": "prefix_203.0.113.0_24/20221231T235959.000000Z.json",
+        "other.json": "other/20221231T235959.000000Z.json",
+    }
+
+    assert len(select_backups(backup)) == 2
+    assert select_backups(backup, ["62.157.100.0/24"], at=1672531199.0) == {"prefix_62.157.100.0_24.json": KEY}
+    backup.snapshot.assert_called_with(1672531199.0, None)
+
+
+@patch("ripeupdater.backup_manager.S3_BACKUP", "yes")
+@patch("ripeupdater.backup_manager.boto3.client")
+def test_select_backups_at(client, tmp_path):
+    backup = BackupManager(tmp_path / "backups.sqlite3")
+    backup.stop()
+    # the object was overwritten at 2022-12-31T00:00:00Z and at 2023-01-02T00:00:00Z
+    manifest = {"objects": {"prefix_62.157.100.0_24.json": [["20221231T000000.000000Z", 1, "a"],
+                                                            ["20230102T000000.000000Z", 1, "b"]]}}
+
+    assert select_backups(backup, manifest=manifest, at=parse_time("2022-12-30T00:00:00Z")) == \
+        {"prefix_62.157.100.0_24.json": "prefix_62.157.100.0_24/20221231T000000.000000Z.json"}
+    assert select_backups(backup, manifest=manifest, at=parse_time("2023-01-01T00:00:00Z")) == \
+        {"prefix_62.157.100.0_24.json": "prefix_62.157.100.0_24/20230102T000000.000000Z.json"}
+    # the current object is in effect
+    assert select_backups(backup, manifest=manifest, at=parse_time("2023-01-02T00:00:00Z")) == {}
+
+
+@patch("ripeupdater.ripe.notify")
+def test_restore_update(notify):
+    backup = backup_of(ripe_object("OLD-NET"))
+    with requests_mock.Mocker() as m:
+        m.get(f"{URL}/62.157.100.0/24?unfiltered", json=ripe_object("BAD-NET"))
+        # inetnum objects are updated by their range
+        put = m.put(f"{URL}/62.157.100.0 - 62.157.100.255", json=ripe_object("OLD-NET"))
+
+        assert restore_object(backup, "prefix_62.157.100.0_24.json", KEY, requests.Session(), Mock()) == UPDATE
+
+    attributes = put.last_request.json()["objects"]["object"][0]["attributes"]["attribute"]
+    assert [attr["name"] for attr in attributes] == ["inetnum", "netname", "source"]
+    assert attributes[1]["value"] == "OLD-NET"
+    # the overwritten object is backed up
+    backup.put.assert_called_once_with("prefix_62.157.100.0_24.json", json.dumps(ripe_object("BAD-NET")))
+    notify.assert_called_once()
+
+
+@patch("ripeupdater.ripe.notify")
+def test_restore_create_and_unchanged(notify):
+    backup = backup_of(ripe_object("OLD-NET"))
+    with requests_mock.Mocker() as m:
+        m.get(f"{URL}/62.157.100.0/24?unfiltered", status_code=404)
+        post = m.post(URL, json=ripe_object("OLD-NET"))
+        assert restore_object(backup, "prefix_62.157.100.0_24.json", KEY, requests.Session(), Mock()) == CREATE
+        assert post.called
+
+        m.get(f"{URL}/62.157.100.0/24?unfiltered", json=ripe_object("OLD-NET"))
+        assert restore_object(backup, "prefix_62.157.100.0_24.json", KEY, requests.Session(), Mock()) == UNCHANGED
+
+    backup.put.assert_not_called()
+
+
+@patch("ripeupdater.ripe.notify")
+def test_restore_fails(notify):
+    backup = backup_of(ripe_object("OLD-NET"))
+    with requests_mock.Mocker() as m:
+        m.get(f"{URL}/62.157.100.0/24?unfiltered", status_code=404)
+        m.post(URL, status_code=401, json={"errormessages": {"errormessage": [{"text": "Authorisation failed"}]}})
+        with pytest.raises(BadRequest):
+            restore_object(backup, "prefix_62.157.100.0_24.json", KEY, requests.Session(), Mock())
+
+    assert notify.call_args.args[5] == ["Authorisation failed"]
+
+
+def test_run_restore_resumes(tmp_path):
+    journal = RestoreJournal(str(tmp_path / "restore.sqlite3"))
+    selection = {f"prefix_198.51.{i}.0_24.json": f"prefix_198.51.{i}.0_24/20221231T235959.000000Z.json"
+                 for i in range(10)}
+    restore_id = journal.create(selection, "test")
+
+    def fail_once(backup, name, key):
+        if name == "prefix_198.51.3.0_24.json" and fail_once.first:
+            fail_once.first = False
+            raise RipeDBError("timeout")
+        return UPDATE
+    fail_once.first = True
+
+    with patch("ripeupdater.restore.restore_object", side_effect=fail_once) as restore:
+        results = list(run_restore(Mock(), journal, restore_id, workers=4))
+        assert [result["name"] for result in results] == sorted(selection)
+        progress = journal.progress(restore_id)
+        assert progress["status"] == {"done": 9, "failed": 1}
+        assert progress["failed"] == [{"name": "prefix_198.51.3.0_24.json", "error": "RipeDBError('timeout')"}]
+
+        # resuming retries only the failed object
+        restore.reset_mock()
+        assert [result["action"] for result in run_restore(Mock(), journal, restore_id)] == [UPDATE]
+        restore.assert_called_once()
+
+    progress = journal.progress(restore_id)
+    assert progress["status"] == {"done": 10}
+    assert progress["actions"] == {UPDATE: 10}
+    assert journal.progress(restore_id + 1) is None
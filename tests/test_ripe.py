@@ -1,10 +1,13 @@
 import os
 from unittest.mock import patch, Mock
 import requests_mock
+from pytest import raises
 
 from ripeupdater.backup_manager import BackupManager
+from ripeupdater.exceptions import BadRequest
+from ripeupdater.mirror import RipeMirror
 from ripeupdater.netbox import ObjectBuilder
-from ripeupdater.ripe import RipeObjectManager
+from ripeupdater.ripe import RipeObjectManager, CREATE, UPDATE, DELETE, UNCHANGED
 
 _dir_path = os.path.dirname(os.path.realpath(__file__))
 
@@ -93,3 +96,318 @@ def test_ripe(netbox_api):
             }
         }
 
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES", f"example.json")
+def test_plan(netbox_api):
+    webhook = {
+        "data": {
+            "prefix": "2001:1234:4567::/64",
+            "site": {
+                "slug": "myslug"
+            },
+            "custom_fields": {
+                "ripe_report": True,
+                "ripe_template": "CLOUD-POOL",
+            }
+        },
+        "username": "username",
+    }
+    netbox_api.return_value.ipam.aggregates.get.return_value = Mock(custom_fields={"lir": "de.examplelir1"})
+    netbox_api.return_value.dcim.regions.get.return_value = Mock(slug="germany")
+    old_object = {
+        "objects": {
+            "object": [
+                {
+                    "attributes": {
+                        "attribute": [
+                            {"name": "inet6num", "value": "2001:1234:4567::/64"},
+                            {"name": "netname", "value": "OLD-POOL"},
+                        ]
+                    }
+                }
+            ]
+        }
+    }
+
+    with requests_mock.Mocker() as m:
+        m.get("https://rest-test.db.ripe.net/test/inet6num/2001:1234:4567::/64?unfiltered", json=old_object)
+        ripe = RipeObjectManager(ObjectBuilder(webhook), BackupManager())
+
+        plan = ripe.plan_push()
+        assert plan["action"] == UPDATE
+        assert {"op": "-", "name": "netname", "value": "OLD-POOL", "position": 1} in plan["changes"]
+        assert {"op": "+", "name": "netname", "value": "CLOUD-POOL", "position": 1} in plan["changes"]
+
+        plan = ripe.plan_delete()
+        assert plan["action"] == DELETE
+        assert len(plan["changes"]) == 2
+
+        # the object is fetched once and nothing has been written
+        assert [r.method for r in m.request_history] == ["GET"]
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES", f"example.json")
+@patch("ripeupdater.ripe.notify")
+def test_unchanged_object_is_not_updated(notify, netbox_api):
+    webhook = {
+        "data": {
+            "prefix": "2001:1234:4567::/64",
+            "site": {
+                "slug": "myslug"
+            },
+            "custom_fields": {
+                "ripe_report": True,
+                "ripe_template": "CLOUD-POOL",
+            }
+        },
+        "username": "username",
+    }
+    netbox_api.return_value.ipam.aggregates.get.return_value = Mock(custom_fields={"lir": "de.examplelir1"})
+    netbox_api.return_value.dcim.regions.get.return_value = Mock(slug="germany")
+
+    with requests_mock.Mocker() as m:
+        ripe = RipeObjectManager(ObjectBuilder(webhook), BackupManager())
+        old_object = ripe.generate_object()
+        old_object["objects"]["object"][0]["attributes"]["attribute"].append(
+            {"name": "last-modified", "value": "2022-01-01T00:00:00Z"})
+        m.get("https://rest-test.db.ripe.net/test/inet6num/2001:1234:4567::/64?unfiltered", json=old_object)
+
+        assert ripe.push_object() == UNCHANGED
+        assert [r.method for r in m.request_history] == ["GET"]
+        notify.assert_not_called()
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES", f"example.json")
+def test_create_with_overlap(netbox_api):
+    webhook = {
+        "data": {
+            "prefix": "2001:1234:4567::/64",
+            "site": {
+                "slug": "myslug"
+            },
+            "custom_fields": {
+                "ripe_report": True,
+                "ripe_template": "CLOUD-POOL",
+            }
+        },
+        "username": "username",
+    }
+    netbox_api.return_value.ipam.aggregates.get.return_value = Mock(custom_fields={"lir": "de.examplelir1"})
+    netbox_api.return_value.dcim.regions.get.return_value = Mock(slug="germany")
+    overlapped = {"objects": {"object": [{"primary-key": {"attribute": [{"name": "inet6num", "value": "2001:1234:4567::/48"}]},
+                                          "attributes": {"attribute": [{"name": "inet6num", "value": "2001:1234:4567::/48"},
+                                                                       {"name": "status", "value": "ASSIGNED"},
+                                                                       {"name": "mnt-by", "value": "TEST-DBM-MNT"}]}}]}}
+    created = {"objects": {"object": [{"attributes": {"attribute": [{"name": "inet6num", "value": "2001:1234:4567::/64"}]}}]}}
+
+    with requests_mock.Mocker() as m:
+        ripe = RipeObjectManager(ObjectBuilder(webhook), BackupManager())
+        # overlapped prefix is neither prefix nor aggregate in netbox
+        netbox_api.return_value.ipam.aggregates.get.return_value = None
+        netbox_api.return_value.ipam.prefixes.get.return_value = None
+
+        m.get("https://rest-test.db.ripe.net/test/inet6num/2001:1234:4567::/64?unfiltered", status_code=404)
+        m.get("https://rest-test.db.ripe.net/test/inet6num/2001:1234:4567::/48?unfiltered", json=overlapped)
+        m.get("https://rest-test.db.ripe.net/search", json=overlapped)
+        m.delete("https://rest-test.db.ripe.net/test/inet6num/2001:1234:4567::/48", json=overlapped)
+        m.post("https://rest-test.db.ripe.net/test/inet6num", [{"status_code": 400, "json": {}}, {"json": created}])
+
+        # a dry run lists the overlaps, which would be deleted
+        assert ripe.plan_push()["overlaps"] == ["2001:1234:4567::/48"]
+        assert ripe.push_object() == CREATE
+        assert ripe.prefix == "2001:1234:4567::/64"
+        assert [(r.method, r.path) for r in m.request_history] == [
+            ("GET", "/test/inet6num/2001:1234:4567::/64"),
+            ("GET", "/search"),
+            ("GET", "/search"),
+            ("POST", "/test/inet6num"),
+            ("GET", "/search"),
+            ("GET", "/search"),
+            ("GET", "/test/inet6num/2001:1234:4567::/48"),
+            ("DELETE", "/test/inet6num/2001:1234:4567::/48"),
+            ("POST", "/test/inet6num"),
+        ]
+        assert ripe.old_objects == {}
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES", f"example.json")
+@patch("ripeupdater.ripe.notify")
+def test_create_keeps_allocations(notify, netbox_api):
+    webhook = {
+        "data": {
+            "prefix": "62.157.100.0/24",
+            "site": {
+                "slug": "myslug"
+            },
+            "custom_fields": {
+                "ripe_report": True,
+                "ripe_template": "CLOUD-POOL",
+            }
+        },
+        "username": "username",
+    }
+    netbox_api.return_value.ipam.aggregates.get.return_value = Mock(custom_fields={"lir": "de.examplelir1"})
+    netbox_api.return_value.dcim.regions.get.return_value = Mock(slug="germany")
+
+    def found(pkey, status, mnt):
+        return {"primary-key": {"attribute": [{"name": "inetnum", "value": pkey}]},
+                "attributes": {"attribute": [{"name": "inetnum", "value": pkey}, {"name": "status", "value": status},
+                                             {"name": "mnt-by", "value": mnt}]}}
+
+    less = {"objects": {"object": [found("0.0.0.0 - 255.255.255.255", "ALLOCATED UNSPECIFIED", "RIPE-NCC-HM-MNT"),
+                                   found("62.157.0.0 - 62.157.255.255", "ALLOCATED PA", "TEST-DBM-MNT"),
+                                   found("62.157.100.0 - 62.157.100.127", "ASSIGNED PA", "OTHER-MNT")]}}
+
+    with requests_mock.Mocker() as m:
+        ripe = RipeObjectManager(ObjectBuilder(webhook), BackupManager())
+        # none of the overlaps is prefix or aggregate in netbox
+        netbox_api.return_value.ipam.aggregates.get.return_value = None
+        netbox_api.return_value.ipam.prefixes.get.return_value = None
+
+        m.get("https://rest-test.db.ripe.net/test/inetnum/62.157.100.0/24?unfiltered", status_code=404)
+        m.get("https://rest-test.db.ripe.net/search", [{"json": less}, {"status_code": 404}] * 2)
+        m.post("https://rest-test.db.ripe.net/test/inetnum", status_code=400, json={})
+
+        # allocations and objects of other maintainers are never deleted
+        assert ripe.plan_push()["overlaps"] == []
+        with raises(BadRequest):
+            ripe.push_object()
+        assert [r.method for r in m.request_history] == ["GET", "GET", "GET", "POST", "GET", "GET"]
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES", f"example.json")
+@patch("ripeupdater.ripe.notify")
+def test_mirror(notify, netbox_api, tmp_path):
+    webhook = {
+        "data": {
+            "prefix": "2001:1234:4567::/64",
+            "site": {
+                "slug": "myslug"
+            },
+            "custom_fields": {
+                "ripe_report": True,
+                "ripe_template": "CLOUD-POOL",
+            }
+        },
+        "username": "username",
+    }
+    netbox_api.return_value.ipam.aggregates.get.return_value = Mock(custom_fields={"lir": "de.examplelir1"})
+    netbox_api.return_value.dcim.regions.get.return_value = Mock(slug="germany")
+    dump = tmp_path / "ripe.db.inet6num"
+    dump.write_text("inet6num: 2001:1234:4567::/64\nnetname: OLD-POOL\nmnt-by: TEST-DBM-MNT\n")
+    mirror = RipeMirror(str(tmp_path / "mirror.sqlite3"))
+    mirror.load("inet6num", str(dump), ["TEST-DBM-MNT"])
+
+    with requests_mock.Mocker() as m, patch("ripeupdater.ripe.get_mirror", return_value=mirror):
+        ripe = RipeObjectManager(ObjectBuilder(webhook), BackupManager())
+        new_object = ripe.generate_object()
+
+        # planned against the mirror
+        assert ripe.plan_push()["action"] == UPDATE
+        assert m.request_history == []
+
+        # changes are confirmed by the RIPE DB before they are written
+        m.get("https://rest-test.db.ripe.net/test/inet6num/2001:1234:4567::/64?unfiltered", json=new_object)
+        assert ripe.push_object() == UNCHANGED
+        assert [r.method for r in m.request_history] == ["GET"]
+
+        # objects up to date in the mirror are not fetched
+        mirror.store(new_object)
+        assert ripe.push_object() == UNCHANGED
+        assert len(m.request_history) == 1
+
+        # personal data replaced in the dump files is no change
+        dump.write_text("".join(
+            f"{attr['name']}: {'DUMY-RIPE' if attr['name'] in ['admin-c', 'tech-c'] else attr['value']}\n"
+            for attr in new_object["objects"]["object"][0]["attributes"]["attribute"]
+        ) + "remarks: * THIS OBJECT IS MODIFIED\n")
+        mirror.load("inet6num", str(dump), ["TEST-DBM-MNT"])
+        assert ripe.plan_push()["action"] == UNCHANGED
+        assert len(m.request_history) == 1
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES", f"example.json")
+@patch("ripeupdater.ripe.notify")
+def test_overlaps(notify, netbox_api, tmp_path):
+    webhook = {
+        "data": {
+            "prefix": "62.157.100.0/24",
+            "site": {
+                "slug": "myslug"
+            },
+            "custom_fields": {
+                "ripe_report": True,
+                "ripe_template": "CLOUD-POOL",
+            }
+        },
+        "username": "username",
+    }
+    netbox_api.return_value.ipam.aggregates.get.return_value = Mock(custom_fields={"lir": "de.examplelir1"})
+    netbox_api.return_value.dcim.regions.get.return_value = Mock(slug="germany")
+    dump = tmp_path / "ripe.db.inetnum"
+    dump.write_text("""inetnum: 62.157.0.0 - 62.157.255.255
+status: ALLOCATED PA
+mnt-by: TEST-DBM-MNT
+
+inetnum: 62.157.100.0 - 62.157.100.127
+status: ASSIGNED PA
+mnt-by: TEST-DBM-MNT
+
+inetnum: 62.157.100.128 - 62.157.100.200
+status: ASSIGNED PA
+mnt-by: TEST-DBM-MNT
+
+inetnum: 62.157.101.0 - 62.157.101.255
+status: ASSIGNED PA
+mnt-by: TEST-DBM-MNT
+""")
+    mirror = RipeMirror(str(tmp_path / "mirror.sqlite3"))
+    mirror.load("inetnum", str(dump), ["TEST-DBM-MNT"])
+    url = "https://rest-test.db.ripe.net/test/inetnum"
+
+    with requests_mock.Mocker() as m, patch("ripeupdater.ripe.get_mirror", return_value=mirror):
+        # the allocation is an aggregate in NetBox
+        netbox_api.return_value.ipam.aggregates.all.return_value = [
+            Mock(prefix="62.157.0.0/16", custom_fields={"lir": "de.examplelir1"})]
+        netbox_api.return_value.ipam.prefixes.all.return_value = []
+        ripe = RipeObjectManager(ObjectBuilder(webhook), BackupManager())
+
+        overlaps = ripe.overlaps()
+        assert [str(key) for key, networks, status in overlaps] == [
+            "62.157.0.0/16", "62.157.100.0/25", "62.157.100.128 - 62.157.100.200"]
+        # a range, which is no single network, is checked by all of its networks
+        assert len(overlaps[2][1]) == 3
+
+        m.get(requests_mock.ANY, status_code=404)
+        m.delete(requests_mock.ANY, json={})
+        m.post(url, json={"objects": {"object": [{"attributes": {"attribute": [
+            {"name": "inetnum", "value": "62.157.100.0 - 62.157.100.255"}]}}]}})
+
+        # both assignments are deleted before the object is created, the allocation is kept
+        assert ripe.push_object() == CREATE
+        assert [(r.method, r.path) for r in m.request_history if r.method != "GET"] == [
+            ("DELETE", "/test/inetnum/62.157.100.0/25"),
+            ("DELETE", "/test/inetnum/62.157.100.128%20-%2062.157.100.200"),
+            ("POST", "/test/inetnum"),
+        ]
+        assert [str(key) for key, networks, status in ripe.overlaps()] == ["62.157.0.0/16"]
+        assert mirror.get("inetnum", "62.157.100.0/24") is not None
@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+from pytest import raises
+import requests
+import requests_mock
+
+from ripeupdater.exceptions import RipeDBError
+from ripeupdater.ripe_client import RipeClient
+
+
+def test_request():
+    client = RipeClient(pool_size=2, timeout=5)
+
+    with requests_mock.Mocker() as m:
+        m.get("https://rest-test.db.ripe.net/test/inetnum/198.51.100.0/24", json={})
+        response = client.get("https://rest-test.db.ripe.net/test/inetnum/198.51.100.0/24")
+
+        assert response.ok
+        assert m.last_request.headers["Accept"] == "application/json; charset=utf-8"
+        assert m.last_request.timeout == 5
+
+        client.get("https://rest-test.db.ripe.net/test/inetnum/198.51.100.0/24", timeout=1)
+        assert m.last_request.timeout == 1
+
+    stats = client.stats()
+    assert stats["pool_size"] == 2
+    assert stats["requests"] == {"GET": 2}
+    assert stats["errors"] == {}
+
+
+def test_request_error():
+    client = RipeClient()
+
+    with requests_mock.Mocker() as m:
+        m.delete("https://rest-test.db.ripe.net/test/inetnum/198.51.100.0/24", exc=requests.exceptions.ConnectTimeout)
+        with raises(RipeDBError):
+            client.delete("https://rest-test.db.ripe.net/test/inetnum/198.51.100.0/24")
+
+    assert client.stats()["errors"] == {"DELETE": 1}
+
+
+@patch("ripeupdater.ripe_client.time.sleep")
+def test_retry_after(sleep):
+    client = RipeClient(read_rate=0, write_rate=0)
+    url = "https://rest-test.db.ripe.net/test/inetnum"
+
+    with requests_mock.Mocker() as m, patch.object(client.limits["write"], "pause") as pause:
+        m.post(url, [{"status_code": 429, "headers": {"Retry-After": "7"}}, {"status_code": 200, "json": {}}])
+        assert client.post(url).ok
+        pause.assert_called_once_with(7)
+
+        # writes which may have been processed are not retried
+        m.post(url, status_code=503)
+        assert client.post(url).status_code == 503
+
+    assert client.stats()["retries"] == {"POST": 1}
+    sleep.assert_not_called()
+
+
+@patch("ripeupdater.ripe_client.time.sleep")
+def test_retry_reads(sleep):
+    client = RipeClient(read_rate=0, retries=2)
+    url = "https://rest-test.db.ripe.net/test/inetnum/198.51.100.0/24"
+
+    with requests_mock.Mocker() as m:
+        m.get(url, [{"status_code": 503}, {"exc": requests.exceptions.ConnectionError}, {"status_code": 200}])
+        assert client.get(url).ok
+
+        m.get(url, status_code=502)
+        assert client.get(url).status_code == 502
+
+    assert sleep.call_count == 4
+    stats = client.stats()
+    assert stats["requests"] == {"GET": 6}
+    assert stats["retries"] == {"GET": 4}
+    assert stats["limits"]["read"]["decreases"] >= 1
+
+
+def test_retry_after_date():
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert RipeClient.retry_after(response) == 0
+
+    response.headers["Retry-After"] = "100000"
+    assert RipeClient.retry_after(response) == 300
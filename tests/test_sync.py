@@ -0,0 +1,80 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import patch, Mock
+import requests_mock
+
+from ripeupdater.backup_manager import BackupManager
+from ripeupdater.netbox import PrefetchedData
+from ripeupdater.sync import sync_prefix, SKIPPED
+from ripeupdater.ripe import CREATE, UNCHANGED
+
+_dir_path = os.path.dirname(os.path.realpath(__file__))
+
+url = "https://rest-test.db.ripe.net/test/inet6num/2001:1234:4567::/64"
+webhook = {
+    "event": "updated",
+    "model": "prefix",
+    "username": "ripeupdater sync",
+    "data": {
+        "prefix": "2001:1234:4567::/64",
+        "site": {"slug": "myslug"},
+        "custom_fields": {"ripe_report": True, "ripe_template": "CLOUD-POOL"},
+    },
+}
+attributes = [
+    {'name': 'inet6num', 'value': '2001:1234:4567::/64'},
+    {'name': 'netname', 'value': 'CLOUD-POOL'},
+    {'name': 'descr', 'value': 'MyCompany Cloud Pool'},
+    {'name': 'org', 'value': 'ORG-EIPB1-TEST'},
+    {'name': 'country', 'value': 'DE'},
+    {'name': 'remarks', 'value': 'Managed by ripeupdater'},
+    {'name': 'admin-c', 'value': 'AA1-TEST'},
+    {'name': 'tech-c', 'value': 'AA1-TEST'},
+    {'name': 'notify', 'value': 'noc@example.com'},
+    {'name': 'mnt-by', 'value': 'TEST-DBM-MNT'},
+    {'name': 'status', 'value': 'ALLOCATED PA'},
+    {'name': 'created', 'value': '2022-01-01T00:00:00Z'},
+    {'name': 'last-modified', 'value': '2022-01-01T00:00:00Z'},
+    {'name': 'source', 'value': 'TEST'},
+]
+
+
+def fetch_data(netbox_api):
+    nb = netbox_api.return_value
+    nb.dcim.regions.all.return_value = [SimpleNamespace(slug="germany", parent=None)]
+    nb.dcim.sites.all.return_value = [Mock(slug="myslug", region=Mock(slug="germany"))]
+    nb.ipam.aggregates.all.return_value = [
+        Mock(prefix="2001:1234::/32", custom_fields={"lir": "de.examplelir1"}),
+    ]
+    return PrefetchedData()
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES", "example.json")
+def test_sync_prefix_unchanged(netbox_api):
+    with requests_mock.Mocker() as m:
+        m.get(f"{url}?unfiltered", json={"objects": {"object": [{"attributes": {"attribute": attributes}}]}})
+        assert sync_prefix(webhook, fetch_data(netbox_api), BackupManager())['action'] == UNCHANGED
+        assert [r.method for r in m.request_history] == ["GET"]
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES_DIR", f"{_dir_path}/")
+@patch("ripeupdater.ripe.TEMPLATES", "example.json")
+def test_sync_prefix_created(netbox_api):
+    with requests_mock.Mocker() as m:
+        m.get(f"{url}?unfiltered", status_code=404)
+        m.post("https://rest-test.db.ripe.net/test/inet6num",
+               json={"objects": {"object": [{"attributes": {"attribute": attributes}}]}})
+        assert sync_prefix(webhook, fetch_data(netbox_api), BackupManager())['action'] == CREATE
+        assert m.last_request.method == "POST"
+
+
+@patch("pynetbox.api")
+@patch("ripeupdater.netbox.TEMPLATES_DIR", f"{_dir_path}/")
+def test_sync_prefix_skipped(netbox_api):
+    private = dict(webhook, data=dict(webhook["data"], prefix="10.0.0.0/8"))
+    assert sync_prefix(private, fetch_data(netbox_api), BackupManager())['action'] == SKIPPED
@@ -0,0 +1,56 @@
+import json
+import os
+
+from pytest import raises
+
+from ripeupdater.exceptions import ConfigError
+from ripeupdater.template_store import TemplateStore, validate_templates
+
+_dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+def write(path, content):
+    path.write_text(json.dumps(content))
+    # make sure the modification time changes on filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+
+def test_load():
+    store = TemplateStore(_dir_path, interval=0)
+
+    assert store.file("example.json")["templates"]["CLOUD-POOL"]["inherit"] == "base_mycompany.json"
+    assert store.file("example.json")["templates"]["CUST-ACCESS-NET"]["inherit"] == "base_mycompany.example.json"
+    assert store.stats()["reloads"] == 1
+    with raises(ConfigError):
+        store.file("missing.json")
+
+
+def test_reload(tmp_path):
+    write(tmp_path / "base.json", {"attributes": [{"remarks": "one"}]})
+    store = TemplateStore(str(tmp_path), interval=0)
+
+    write(tmp_path / "base.json", {"attributes": [{"remarks": "two"}]})
+    assert store.scan() != store.snapshot[1]
+    store.load()
+    assert store.file("base.json") == {"attributes": [{"remarks": "two"}]}
+    assert store.stats()["reloads"] == 2
+
+    # invalid templates are rejected, the previous set is kept
+    (tmp_path / "base.json").write_text("{")
+    with raises(ConfigError):
+        store.load()
+    assert store.file("base.json") == {"attributes": [{"remarks": "two"}]}
+
+
+def test_validate_templates():
+    assert validate_templates({"lir_org.json": {"templates": {"lir_org": {"de.examplelir1": "ORG-EIPB1-TEST"}}}}) == []
+    assert validate_templates({"templates.json": {"templates": {"CLOUD-POOL": {"attributes": [{"descr": "foo"}],
+                                                                              "inherit": "base.json"}}}}) == \
+        ["templates.json: CLOUD-POOL inherits missing file base.json"]
+    # example templates are not used, so they may inherit missing files
+    assert validate_templates({"templates.example.json": {"templates": {"CLOUD-POOL": {
+        "attributes": [{"descr": "foo"}], "inherit": "base.example.json"}}}}) == []
+    assert validate_templates({"base.json": {"attributes": [{"descr": "foo"}, {}]}}) == \
+        ["base.json: attributes must be a list of attribute objects"]
+    assert validate_templates({"base.json": []}) == ["base.json must contain an object"]